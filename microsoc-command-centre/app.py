@@ -1,52 +1,53 @@
 # app.py
-from fastapi import FastAPI
-import asyncio, time, json, os, requests
-from classifier import classify_request
-from blocklist import add_block
+from fastapi import Depends, FastAPI, Header, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+import asyncio, time, os, secrets
+from classifier import classify_request_async, classify_batch_async
+from ml import predict as ml_predict
+from ml.batcher import get_batcher
+from threat_intel import get_client as get_threat_intel
+import block_store
+import log_shipper
+import metrics
 from dotenv import load_dotenv
-from pymongo import MongoClient, UpdateOne
-import redis
 
 load_dotenv()
 app = FastAPI(title="P3 Threat Detection Engine (Decision API)")
 
 # ---------------- CONFIG ----------------
-REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
-LOG_QUEUE = "attack_logs_queue"
-BACKEND_API_URL = os.getenv("BACKEND_API_URL", "http://localhost:3000/api/logs/ingest")
-
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-
-# Try to connect to MongoDB
-try:
-    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
-    client.server_info()  # Force connection attempt
-    db = client["threat_engine"]
-    attack_logs = db["attack_logs"]
-    MONGODB_AVAILABLE = True
-    print("[MongoDB] Connected successfully")
-except Exception as e:
-    print(f"[MongoDB] Connection failed ({e}), using memory-only mode")
-    client = None
-    db = None
-    attack_logs = None
-    MONGODB_AVAILABLE = False
-
-# Try to connect to Redis, fallback to in-memory queue if unavailable
-try:
-    r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True, socket_connect_timeout=2)
-    r.ping()  # Test connection
-    REDIS_AVAILABLE = True
-    print("[Redis] Connected successfully")
-except Exception as e:
-    print(f"[Redis] Connection failed ({e}), using in-memory queue fallback")
-    r = None
-    REDIS_AVAILABLE = False
-    # In-memory queue fallback
-    MEMORY_LOG_QUEUE = []
-
 BLOCK_DURATION = int(os.getenv("BLOCK_DURATION", "600"))
+THREAT_INTEL_PREFETCH_TIMEOUT = float(os.getenv("THREAT_INTEL_PREFETCH_TIMEOUT", "0.05"))
+DECISIONS_MAX_ITEMS = int(os.getenv("DECISIONS_MAX_ITEMS", "1000"))  # per /security/decisions request
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # Admin routes are disabled while unset
+
+# ---------------- METRICS ----------------
+# Gauges are read when /metrics is scraped, never on the decision path
+def _spool_bytes():
+    spool = log_shipper._spool
+    return spool.pending() if spool is not None else 0
+
+metrics.Gauge("blocked_ips", "Currently blocked IPs", block_store.count_blocked)
+metrics.Gauge("blocked_ranges", "Blocked CIDR ranges", block_store.count_ranges)
+metrics.Gauge("log_buffer_depth", "Log aggregates waiting in this worker", log_shipper.depth)
+metrics.Gauge("log_queue_backlog", "Logs left in the queue after the last flush", lambda: log_shipper.get_shipper().lag)
+metrics.Gauge("log_batch_size", "Current adaptive flush batch size", lambda: log_shipper.get_shipper().batch_size)
+metrics.Gauge("log_spool_bytes", "Undelivered log bytes in the disk spool", _spool_bytes)
+metrics.Gauge("ml_batch_queue_depth", "Rows waiting for the ML micro-batcher", lambda: get_batcher()._queue.qsize())
+for _key in ("enqueued", "aggregated", "dropped", "spilled", "replayed", "errors"):
+    metrics.Gauge(f"log_shipper_{_key}_total", f"Log shipper {_key} count", lambda k=_key: log_shipper.stats[k], "counter")
+for _key in ("hits", "misses", "invalidations"):
+    metrics.Gauge(f"block_cache_{_key}_total", f"Block near-cache {_key}", lambda k=_key: block_store.stats[k], "counter")
+def _intel_stat(key):
+    intel = get_threat_intel()
+    return intel.stats[key] if intel else 0
+
+metrics.Gauge("threat_intel_pending", "Reputation lookups running or queued",
+              lambda: get_threat_intel().pending() if get_threat_intel() else 0)
+metrics.Gauge("threat_intel_skipped_total", "Reputation lookups skipped at THREAT_INTEL_MAX_PENDING",
+              lambda: _intel_stat("skipped"), "counter")
+metrics.Gauge("ml_verdict_cache_size", "Flows with a cached ML verdict", lambda: len(ml_predict.verdicts))
+for _key in ("hits", "misses"):
+    metrics.Gauge(f"ml_verdict_cache_{_key}_total", f"ML verdict cache {_key}", lambda k=_key: ml_predict.verdicts.stats[k], "counter")
 
 # ---------------- RESPONSE MAKER ----------------
 def make_response(ip, path, method, status, result):
@@ -68,6 +69,28 @@ def make_response(ip, path, method, status, result):
 def home():
     return {"message": "P3 Threat Detection Engine Running"}
 
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 only once the model is loaded and warmed up"""
+    body = {"ready": ml_predict.is_ready(), "ml_state": ml_predict.ml_state, "ml_backend": ml_predict.ML_BACKEND}
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+def finalize_decision(ip, path, method, result):
+    """Apply blocking for a classifier result and build the API response"""
+    status = result.get("status", "ALLOW")
+
+    # Block IP if needed (rule hits are already blocked by the classifier)
+    if status == "BLOCK" and not block_store.is_blocked(ip):
+        block_store.block_ip(ip, result.get("reason") or "Decision API block", "DecisionAPI",
+                             result.get("severity") or "HIGH", ttl=BLOCK_DURATION)
+
+    # The classifier already logged this decision through the log shipper
+    return make_response(ip, path, method, status, result)
+
 @app.post("/security/decision")
 async def security_decision(data: dict):
     ip = data.get("ip")
@@ -80,106 +103,118 @@ async def security_decision(data: dict):
         return make_response("", path, method, "WARN", result={"reason": "Missing ip"})
 
     # Classify request
-    result = classify_request(ip, path, method, ua, payload=payload)
-    status = result.get("status", "ALLOW")
-
-    # Block IP if needed
-    if status == "BLOCK":
-        add_block(ip, duration=BLOCK_DURATION)
-
-    resp = make_response(ip, path, method, status, result)
-
-    # ---------------- LOG HANDLING ----------------
-    if REDIS_AVAILABLE and r:
-        try:
-            r.lpush(LOG_QUEUE, json.dumps(resp))
-        except Exception as e:
-            print(f"Failed to push log to Redis: {e}")
-            MEMORY_LOG_QUEUE.append(json.dumps(resp))
-    else:
-        MEMORY_LOG_QUEUE.append(json.dumps(resp))
-
-    # ALLOW requests can also be written immediately (if MongoDB available)
-    if status == "ALLOW" and MONGODB_AVAILABLE and attack_logs:
-        try:
-            doc_id = f"{resp['ip']}_{resp.get('attack_type','normal')}_{int(resp['timestamp']/60)}"
-            attack_logs.update_one({"_id": doc_id}, {"$set": resp}, upsert=True)
-        except Exception as e:
-            print(f"[MongoDB] Write failed: {e}")
-
-    return resp
+    started = time.perf_counter()
+    result = await classify_request_async(ip, path, method, ua, payload=payload)
+    response = finalize_decision(ip, path, method, result)
+    metrics.DECISION_TOTAL.observe(time.perf_counter() - started, "decision")
+    return response
+
+@app.post("/security/decisions")
+async def security_decisions(items: list[dict]):
+    """Bulk variant of /security/decision; responses come back in input order"""
+    if len(items) > DECISIONS_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {DECISIONS_MAX_ITEMS} items per request")
+    started = time.perf_counter()
+    responses = [None] * len(items)
+    valid = []
+
+    for i, data in enumerate(items):
+        if not data.get("ip"):
+            responses[i] = make_response("", data.get("path", "/"), data.get("method", "GET"),
+                                         "WARN", result={"reason": "Missing ip"})
+        else:
+            valid.append(i)
+
+    # Warm reputation for every source in one concurrent burst so the batch sees fresh verdicts
+    intel = get_threat_intel()
+    if intel and valid:
+        # asyncio.wait does not cancel on timeout: slow lookups keep filling the cache
+        prefetch = asyncio.ensure_future(intel.prefetch([items[i]["ip"] for i in valid]))
+        await asyncio.wait([prefetch], timeout=THREAT_INTEL_PREFETCH_TIMEOUT)
+
+    results = await classify_batch_async([items[i] for i in valid])
+    for i, result in zip(valid, results):
+        data = items[i]
+        responses[i] = finalize_decision(data["ip"], data.get("path", "/"), data.get("method", "GET"), result)
+
+    metrics.DECISION_TOTAL.observe(time.perf_counter() - started, "decisions")
+    return responses
+
+# ---------------- ADMIN ROUTES ----------------
+def require_admin(x_admin_token: str = Header("")):
+    """Admin routes need the X-Admin-Token header to match ADMIN_TOKEN"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API disabled (ADMIN_TOKEN not set)")
+    if not secrets.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.get("/admin/blocks", dependencies=[Depends(require_admin)])
+def list_blocks(cursor: int = Query(0, ge=0), count: int = Query(100, ge=1, le=1000)):
+    """Cursor-paginated block listing; pass back `cursor` until it is 0"""
+    next_cursor, items = block_store.list_blocked(cursor, count)
+    return {"cursor": next_cursor, "count": len(items), "total": block_store.count_blocked(), "items": items}
+
+@app.delete("/admin/blocks/{ip}", dependencies=[Depends(require_admin)])
+def unblock(ip: str):
+    return {"ip": ip, "removed": block_store.unblock_ip(ip)}
+
+@app.post("/admin/blocks/unblock", dependencies=[Depends(require_admin)])
+def bulk_unblock(data: dict):
+    ips = data.get("ips") or []
+    if not isinstance(ips, list) or not all(isinstance(ip, str) for ip in ips):
+        return JSONResponse({"error": "ips must be a list of IP strings"}, status_code=400)
+    return {"requested": len(ips), "removed": block_store.unblock_many(ips)}
+
+@app.get("/admin/ranges", dependencies=[Depends(require_admin)])
+def range_lookup(ip: str = ""):
+    """Which range blocks `ip` (if any), plus the number of blocked ranges"""
+    match = block_store.blocked_range(ip) if ip else None
+    body = {"total": block_store.count_ranges()}
+    if ip:
+        body["ip"] = ip
+        body["range"] = None
+        if match:
+            cidr, expires_at, reason, source = match
+            ttl = int(expires_at - time.time()) if expires_at != float("inf") else None  # None = never expires
+            body["range"] = {"cidr": cidr, "reason": reason, "source": source, "ttl_remaining": ttl}
+    return body
+
+@app.post("/admin/ranges", dependencies=[Depends(require_admin)])
+def block_ranges(data: dict):
+    """Block {"cidr": ...} or a feed's worth of {"ranges": [...]}; optional reason, source, ttl (seconds)"""
+    ranges = data.get("ranges") or ([data["cidr"]] if data.get("cidr") else [])
+    ttl = data.get("ttl")
+    if not isinstance(ranges, list):
+        return JSONResponse({"error": "ranges must be a list of CIDR strings"}, status_code=400)
+    if ttl is not None and (not isinstance(ttl, int) or isinstance(ttl, bool) or ttl <= 0):
+        return JSONResponse({"error": "ttl must be a positive number of seconds"}, status_code=400)
+    # Entries that are not CIDR strings come back under `rejected`
+    added, rejected = block_store.block_ranges(ranges, data.get("reason") or "Manual range block",
+                                               data.get("source") or "Admin", ttl)
+    return {"requested": len(ranges), "added": added, "rejected": rejected[:100]}
+
+@app.delete("/admin/ranges/{cidr:path}", dependencies=[Depends(require_admin)])
+def unblock_range(cidr: str):
+    try:
+        return {"cidr": cidr, "removed": block_store.unblock_range(cidr)}
+    except ValueError as e:
+        return JSONResponse({"cidr": cidr, "error": str(e)}, status_code=400)
 
 # ---------------- BACKGROUND WORKER ----------------
 async def mongo_writer_worker():
     print("🔥 Mongo Writer Worker started")
-    while True:
-        batch = []
-        backend_batch = []
-
-        # Pull from Redis or memory queue
-        for _ in range(100):
-            log_json = None
-            
-            if REDIS_AVAILABLE and r:
-                try:
-                    log_json = r.rpop(LOG_QUEUE)
-                except Exception as e:
-                    print(f"[Redis] Error pulling log: {e}")
-                    break
-            elif MEMORY_LOG_QUEUE:
-                log_json = MEMORY_LOG_QUEUE.pop(0)
-            
-            if not log_json:
-                break
-            
-            log = json.loads(log_json)
-            # Use .get() to avoid KeyError
-            log["_id"] = f"{log['ip']}_{log.get('attack_type','normal')}_{int(log['timestamp']/60)}"
-
-            batch.append(UpdateOne({"_id": log["_id"]}, {"$set": log}, upsert=True))
-            backend_batch.append(log)
-
-        if batch and MONGODB_AVAILABLE and attack_logs:
-            # Save to MongoDB
-            try:
-                attack_logs.bulk_write(batch)
-                print(f"[MongoDB] Batch saved: {len(batch)}")
-            except Exception as e:
-                print(f"[MongoDB] Bulk write failed: {e}")
-
-            # Send to backend API
-            try:
-                response = requests.post(
-                    BACKEND_API_URL,
-                    json=backend_batch,
-                    timeout=5
-                )
-                print(f"[Backend] Sent {len(backend_batch)} logs | Status: {response.status_code}")
-                if response.status_code >= 400:
-                    print(f"[Backend] Error: {response.text}")
-            except requests.exceptions.ConnectionError as ce:
-                print(f"[Backend] Connection failed to {BACKEND_API_URL}")
-        elif batch and not MONGODB_AVAILABLE:
-            # No MongoDB, just send to backend
-            try:
-                response = requests.post(
-                    BACKEND_API_URL,
-                    json=backend_batch,
-                    timeout=5
-                )
-                print(f"[Backend] Sent {len(backend_batch)} logs | Status: {response.status_code}")
-                if response.status_code >= 400:
-                    print(f"[Backend] Error: {response.text}")
-            except requests.exceptions.ConnectionError as ce:
-                print(f"[Backend] Connection failed to {BACKEND_API_URL}")
-            except requests.exceptions.Timeout:
-                print(f"[Backend] Timeout sending to {BACKEND_API_URL}")
-            except Exception as e:
-                print(f"[Backend] Error: {e}")
-
-        await asyncio.sleep(1)
+    await log_shipper.get_shipper().run()
 
 @app.on_event("startup")
 async def startup_event():
+    print("🔥 Warming up ML model in background...")
+    ml_predict.start_background_load()
     print("🔥 Starting Mongo Writer Worker...")
     asyncio.create_task(mongo_writer_worker())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    intel = get_threat_intel()
+    if intel:
+        await intel.close()
+    await log_shipper.get_shipper().close()
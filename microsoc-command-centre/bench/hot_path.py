@@ -0,0 +1,227 @@
+"""
+Offline latency benchmark for the decision hot path.
+
+Redis and MongoDB are replaced with fakeredis and mongomock (when installed) before
+any engine module is imported, so nothing needs to be running. If the trained
+model cannot be loaded (e.g. TensorFlow missing and no exported .npz), the ML
+benchmarks time the NumPy engine with random weights of the same shape.
+
+    python -m bench.hot_path                      # run, compare with bench/baseline.json if present
+    python -m bench.hot_path --save-baseline      # run and record the baseline
+    python -m bench.hot_path --threshold 0.5 -n 5000 --only classify
+
+Exits with status 1 when a benchmark's median is more than --threshold slower
+than its baseline.
+"""
+import argparse
+import json
+import os
+import pickle
+import time
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def _offline_stand_ins():
+    """Point redis.Redis / pymongo.MongoClient at in-process fakes before the engine imports them"""
+    os.environ.setdefault("SPOOL_ENABLED", "0")  # Logs pile up unshipped here; keep them off disk
+    try:
+        import fakeredis
+        import redis
+        redis.Redis = fakeredis.FakeRedis
+    except ImportError:
+        print("[Bench] fakeredis not installed, engine falls back to in-memory stores")
+    try:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+    except ImportError:
+        print("[Bench] mongomock not installed, engine runs in memory-only mode")
+
+
+_offline_stand_ins()
+
+import numpy as np  # noqa: E402
+
+import behavior  # noqa: E402
+import block_store  # noqa: E402
+import classifier  # noqa: E402
+import log_shipper  # noqa: E402
+import rate_limiter  # noqa: E402
+from ml import predict as ml_predict  # noqa: E402
+from ml.Hybrid_recommend import hybrid_remediation  # noqa: E402
+from ml.numpy_lstm import NumpyLSTM  # noqa: E402
+
+
+# ---------------- SETUP ----------------
+def _load_ml():
+    ml_predict.load_model()
+    if ml_predict.model is not None:
+        return "trained model"
+
+    print("[Bench] Trained model unavailable, timing the NumPy engine with random weights")
+    for name in ("protocol_encoder", "label_encoder", "scaler"):
+        with open(os.path.join(ml_predict.BASE_DIR, f"{name}.pkl"), "rb") as f:
+            setattr(ml_predict, name, pickle.load(f))
+    rng = np.random.default_rng(0)
+    units, classes = 64, len(ml_predict.label_encoder.classes_)
+    ml_predict.model = NumpyLSTM({
+        "lstm_kernel": rng.normal(0, 0.1, (5, 4 * units)),
+        "lstm_recurrent_kernel": rng.normal(0, 0.1, (units, 4 * units)),
+        "lstm_bias": np.zeros(4 * units),
+        "dense1_kernel": rng.normal(0, 0.1, (units, 32)),
+        "dense1_bias": np.zeros(32),
+        "dense2_kernel": rng.normal(0, 0.1, (32, classes)),
+        "dense2_bias": np.zeros(classes),
+    })
+    return "random weights"
+
+
+def _ip(branch, i):
+    # A fresh source per request keeps floods and earlier blocks out of the measured branch
+    return f"10.{branch}.{(i >> 8) & 255}.{i & 255}"
+
+
+def _flow(ip):
+    return {"src_ip": ip, "dst_ip": "10.0.0.1", "port": 443, "protocol": "TCP", "packet_size": 600}
+
+
+BLOCKED_IP = "10.250.0.1"
+
+# classify_request branch -> request builder
+BRANCHES = {
+    "blocked": lambda i: dict(ip=BLOCKED_IP, path="/api/products", method="GET", ua="Mozilla/5.0"),
+    "sqli": lambda i: dict(ip=_ip(1, i), path="/search", method="POST", ua="Mozilla/5.0",
+                           payload="id=1 UNION SELECT password FROM users"),
+    "xss": lambda i: dict(ip=_ip(2, i), path="/comment", method="POST", ua="Mozilla/5.0",
+                          payload="<script>alert(document.cookie)</script>"),
+    "sensitive_path": lambda i: dict(ip=_ip(3, i), path="/.env", method="GET", ua="Mozilla/5.0"),
+    "ml": lambda i: dict(ip=_ip(4, i), path="/login", method="POST", ua="Mozilla/5.0", payload=_flow(_ip(4, i))),
+    "allow": lambda i: dict(ip=_ip(5, i), path="/api/products", method="GET", ua="Mozilla/5.0"),
+}
+
+
+# ---------------- MEASUREMENT ----------------
+def _measure(fn, n, warmup):
+    for i in range(warmup):
+        fn(i)
+    samples = np.empty(n)
+    for i in range(n):
+        start = time.perf_counter()
+        fn(warmup + i)
+        samples[i] = time.perf_counter() - start
+    samples *= 1e6
+    return {
+        "mean_us": float(samples.mean()),
+        "p50_us": float(np.percentile(samples, 50)),
+        "p95_us": float(np.percentile(samples, 95)),
+        "p99_us": float(np.percentile(samples, 99)),
+        "ops_s": float(n / samples.sum() * 1e6),
+    }
+
+
+def _reset_side_effects():
+    with log_shipper._buffer_lock:
+        log_shipper._pending.clear()
+        log_shipper._overflow.clear()
+
+
+def benchmarks(n):
+    """name -> (callable(i), iterations)"""
+    block_store.block_ip(BLOCKED_IP, "Benchmark", "Bench", ttl=3600)
+    row = ("10.9.0.1", "10.0.0.1", 443, "TCP", 600)
+    batch = [(f"10.9.{i >> 8}.{i & 255}", "10.0.0.1", 443, "TCP", 600) for i in range(64)]
+    now = time.time()
+
+    def classify(build):
+        return lambda i: classifier.classify_request(timestamp=now, **build(i))
+
+    suite = {f"classify.{name}": (classify(build), n) for name, build in BRANCHES.items()}
+    suite.update({
+        "predict.single": (lambda i: ml_predict.predict_payload(*row), n),
+        "predict.single_uncached": (lambda i: ml_predict.predict_payload(*((_ip(8, i),) + row[1:])), n),
+        "predict.batch64": (lambda i: ml_predict.predict_payloads(batch), max(1, n // 16)),
+        "rate_limiter.add_request": (lambda i: rate_limiter.add_request(_ip(6, i), now), n),
+        "rate_limiter.count_requests": (lambda i: rate_limiter.count_requests(_ip(6, i), 60, now), n),
+        "rate_limiter.add_path": (lambda i: rate_limiter.add_path(_ip(6, i), f"/p/{i & 31}", now), n),
+        "rate_limiter.count_unique_paths": (lambda i: rate_limiter.count_unique_paths(_ip(6, i), 60, now), n),
+        "rate_limiter.hit_and_count": (lambda i: rate_limiter.hit_and_count(_ip(7, i), now, 60), n),
+        "behavior.observe": (lambda i: behavior.observe(_ip(9, i & 1023), f"/p/{i & 7}", None, now), n),
+        "hybrid_remediation": (lambda i: hybrid_remediation("ML_port_scan", confidence=0.9, frequency=i & 31), n),
+    })
+    return suite
+
+
+# ---------------- BASELINE ----------------
+def compare(results, baseline, threshold):
+    """Print the comparison table; returns the names that regressed past threshold"""
+    regressed = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"{name:<34} p50 {stats['p50_us']:9.1f} us | (no baseline)")
+            continue
+        change = stats["p50_us"] / base["p50_us"] - 1
+        flag = ""
+        if change > threshold:
+            regressed.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<34} p50 {stats['p50_us']:9.1f} us | baseline {base['p50_us']:9.1f} us | {change:+7.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the decision hot path")
+    parser.add_argument("-n", type=int, default=2000, help="Timed iterations per benchmark")
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--only", help="Run benchmarks whose name contains this text")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Write results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed p50 slowdown (0.25 = +25%%)")
+    parser.add_argument("--json", help="Also write raw results to this file")
+    args = parser.parse_args()
+
+    ml_source = _load_ml()
+    print(f"[Bench] ML: {ml_source} ({type(ml_predict.model).__name__}, {ml_predict.ML_SEQUENCE_MODE} sequences) | "
+          f"Redis: {'fake' if block_store.REDIS_AVAILABLE else 'in-memory'}")
+
+    results = {}
+    for name, (fn, n) in benchmarks(args.n).items():
+        if args.only and args.only not in name:
+            continue
+        _reset_side_effects()
+        results[name] = stats = _measure(fn, n, args.warmup)
+        print(f"{name:<34} mean {stats['mean_us']:9.1f} us | p50 {stats['p50_us']:9.1f} us | "
+              f"p95 {stats['p95_us']:9.1f} us | p99 {stats['p99_us']:9.1f} us | {stats['ops_s']:10.0f} ops/s")
+    _reset_side_effects()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"[Bench] Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"[Bench] No baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    print(f"\n[Bench] Comparing medians with {args.baseline} (threshold +{args.threshold:.0%})")
+    regressed = compare(results, baseline, args.threshold)
+    if regressed:
+        print(f"[Bench] {len(regressed)} regression(s): {', '.join(regressed)}")
+        raise SystemExit(1)
+    print("[Bench] No regressions")
+
+
+if __name__ == "__main__":
+    main()
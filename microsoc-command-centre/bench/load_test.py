@@ -0,0 +1,204 @@
+"""
+Concurrent load generator for /security/decision.
+
+    uvicorn app:app --port 8000 &
+    python -m bench.load_test --rps 500 --duration 30 --concurrency 64
+    python -m bench.load_test --mix normal=60,sqli=10,xss=10,sensitive_path=5,brute_force=5,ml=10
+    python -m bench.load_test --rps 0 --duration 10      # closed loop: as fast as the workers can go
+
+With --rps set, requests are scheduled on a fixed timetable (open loop) and latency
+is measured from each request's scheduled time, so a stalled server shows up as
+latency instead of silently lowering the offered load. In closed-loop mode latency
+is measured from the actual send. A response is an error when the request fails
+or the status code is not 2xx. On a single-core box the generator competes with
+the server for CPU, so throughput numbers there are a lower bound.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+import numpy as np
+
+DEFAULT_URL = "http://127.0.0.1:8000/security/decision"
+DEFAULT_MIX = "normal=70,sqli=5,xss=5,sensitive_path=5,brute_force=5,ml=10"
+
+BROWSER_UA = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36"
+
+
+# ---------------- PROFILES ----------------
+# Each profile draws source IPs from its own /16 so blocks in one do not leak into another
+def _ip(profile_id, rng, pool):
+    n = rng.randrange(pool)
+    return f"10.{profile_id}.{(n >> 8) & 255}.{n & 255}"
+
+
+def normal(rng, pool):
+    return {"ip": _ip(1, rng, pool), "path": rng.choice(["/", "/api/products", "/api/cart", "/search?q=shoes"]),
+            "method": "GET", "user_agent": BROWSER_UA}
+
+
+def sqli(rng, pool):
+    return {"ip": _ip(2, rng, pool), "path": "/api/users", "method": "POST", "user_agent": "curl/7.68.0",
+            "payload": {"username": rng.choice(["admin' OR 1=1 --", "1 UNION SELECT password FROM users"]),
+                        "password": "anything"}}
+
+
+def xss(rng, pool):
+    return {"ip": _ip(3, rng, pool), "path": "/search", "method": "GET", "user_agent": BROWSER_UA,
+            "payload": {"q": rng.choice(["<script>alert('xss')</script>", "<img src=x onerror=alert(1)>"])}}
+
+
+def sensitive_path(rng, pool):
+    return {"ip": _ip(4, rng, pool), "path": rng.choice(["/.env", "/.git/config", "/admin", "/backup.zip"]),
+            "method": "GET", "user_agent": BROWSER_UA}
+
+
+def brute_force(rng, pool):
+    # A handful of sources hammering the login endpoint
+    ip = _ip(5, rng, max(1, pool // 100))
+    return {"ip": ip, "path": "/login", "method": "POST", "user_agent": BROWSER_UA,
+            "payload": {"src_ip": ip, "dst_ip": "10.0.0.1", "port": 443, "protocol": "TCP",
+                        "packet_size": 600, "status": "failed"}}
+
+
+def ml(rng, pool):
+    ip = _ip(6, rng, pool)
+    return {"ip": ip, "path": "/api/stream", "method": "POST", "user_agent": BROWSER_UA,
+            "payload": {"src_ip": ip, "dst_ip": f"10.0.0.{rng.randrange(1, 255)}",
+                        "port": rng.choice([22, 80, 443, 3306, rng.randrange(1, 65536)]),
+                        "protocol": rng.choice(["TCP", "UDP", "ICMP"]), "packet_size": rng.randrange(60, 1500)}}
+
+
+PROFILES = {f.__name__: f for f in (normal, sqli, xss, sensitive_path, brute_force, ml)}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in PROFILES:
+            raise argparse.ArgumentTypeError(f"Unknown profile {name!r} (choose from {', '.join(PROFILES)})")
+        mix[name] = float(weight)
+    return mix
+
+
+# ---------------- RUNNER ----------------
+class Stats:
+    def __init__(self):
+        self.latencies = []  # seconds
+        self.errors = 0
+        self.decisions = {}  # decision status (or error kind) -> count
+
+    def record(self, latency, ok, outcome=None):
+        self.latencies.append(latency)
+        if not ok:
+            self.errors += 1
+        if outcome:
+            self.decisions[outcome] = self.decisions.get(outcome, 0) + 1
+
+
+async def _send(client, url, profile, body, scheduled, stats):
+    ok = False
+    started = time.perf_counter()
+    try:
+        response = await client.post(url, json=body)
+        ok = 200 <= response.status_code < 300
+        outcome = response.json().get("status") if ok else f"HTTP {response.status_code}"
+    except Exception as e:
+        outcome = type(e).__name__
+    # Closed loop has no timetable: measure from the actual send
+    stats[profile].record(time.perf_counter() - (started if scheduled is None else scheduled), ok, outcome)
+
+
+async def run(url, mix, rps, duration, concurrency, pool, seed, timeout):
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    stats = {name: Stats() for name in names}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        queue = asyncio.Queue(maxsize=concurrency * 4)
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                await _send(client, url, *item, stats)
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        started = time.perf_counter()
+        end = started + duration
+        sent = 0
+        while True:
+            now = time.perf_counter()
+            if now >= end:
+                break
+            if rps > 0:
+                scheduled = started + sent / rps
+                if scheduled > now:
+                    await asyncio.sleep(scheduled - now)
+                    continue
+            else:
+                scheduled = None
+            profile = rng.choices(names, weights)[0]
+            await queue.put((profile, PROFILES[profile](rng, pool), scheduled))
+            sent += 1
+
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - started
+    return stats, elapsed
+
+
+def report(stats, elapsed):
+    header = f"{'profile':<16}{'requests':>9}{'req/s':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  outcomes"
+    print(header)
+    print("-" * len(header))
+    everything = Stats()
+    for name, s in stats.items():
+        everything.latencies += s.latencies
+        everything.errors += s.errors
+        for k, v in s.decisions.items():
+            everything.decisions[k] = everything.decisions.get(k, 0) + v
+        _row(name, s, elapsed)
+    print("-" * len(header))
+    _row("total", everything, elapsed)
+
+
+def _row(name, s, elapsed):
+    n = len(s.latencies)
+    if not n:
+        print(f"{name:<16}{0:>9}")
+        return
+    p50, p95, p99 = np.percentile(np.array(s.latencies) * 1000, [50, 95, 99])
+    decisions = ", ".join(f"{k} {v}" for k, v in sorted(s.decisions.items()))
+    print(f"{name:<16}{n:>9}{n / elapsed:>9.1f}{s.errors / n:>8.1%}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}  {decisions}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /security/decision with a weighted traffic mix")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--rps", type=float, default=200, help="Target requests/s (0 = closed loop, no pacing)")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to send for")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight at most")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Default: {DEFAULT_MIX}")
+    parser.add_argument("--ip-pool", type=int, default=5000, help="Distinct source IPs per profile")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"[Load] {args.url} | {'closed loop' if args.rps <= 0 else f'{args.rps:g} req/s'} | "
+          f"{args.duration:g}s | concurrency {args.concurrency}")
+    stats, elapsed = asyncio.run(run(args.url, args.mix, args.rps, args.duration, args.concurrency,
+                                     args.ip_pool, args.seed, args.timeout))
+    report(stats, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Round-trip cost of the distributed sliding-window limiter versus local counters.
+
+    python -m bench.rate_limiter_redis                 # local Redis if reachable, else fakeredis
+    python -m bench.rate_limiter_redis --fake -n 50000
+
+fakeredis needs the `lupa` extra for Lua scripts: pip install "fakeredis[lua]"
+"""
+import argparse
+import time
+
+import rate_limiter
+
+
+def _client(use_fake, host, port):
+    if not use_fake:
+        try:
+            import redis
+            client = redis.Redis(host=host, port=port, decode_responses=True, socket_connect_timeout=1)
+            client.ping()
+            return client, f"redis://{host}:{port}"
+        except Exception as e:
+            print(f"[Bench] Redis not reachable ({e}), using fakeredis")
+    import fakeredis
+    return fakeredis.FakeRedis(decode_responses=True), "fakeredis"
+
+
+def _run(n, ips, window):
+    now = time.time()
+    latencies = []
+    for i in range(n):
+        ip = f"10.0.{(i % ips) // 256}.{i % 256}"
+        start = time.perf_counter()
+        rate_limiter.hit_and_count(ip, now + i * 0.001, window)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "mean_us": sum(latencies) / n * 1e6,
+        "p50_us": latencies[n // 2] * 1e6,
+        "p99_us": latencies[int(n * 0.99)] * 1e6,
+        "ops_s": n / sum(latencies),
+    }
+
+
+def _report(name, stats):
+    print(f"{name:<22} mean {stats['mean_us']:8.1f} us | p50 {stats['p50_us']:8.1f} us | "
+          f"p99 {stats['p99_us']:8.1f} us | {stats['ops_s']:10.0f} decisions/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the distributed rate limiter")
+    parser.add_argument("-n", type=int, default=20000, help="Decisions to simulate")
+    parser.add_argument("--ips", type=int, default=1000, help="Distinct source IPs")
+    parser.add_argument("--window", type=int, default=60)
+    parser.add_argument("--fake", action="store_true", help="Force fakeredis")
+    parser.add_argument("--host", default=rate_limiter.REDIS_HOST)
+    parser.add_argument("--port", type=int, default=rate_limiter.REDIS_PORT)
+    args = parser.parse_args()
+
+    rate_limiter.configure_redis(None)
+    _report("local", _run(args.n, args.ips, args.window))
+
+    client, label = _client(args.fake, args.host, args.port)
+    rate_limiter.configure_redis(client)
+    _report(label, _run(args.n, args.ips, args.window))
+
+    # Sanity check: the shared window sees every hit recorded above for one IP
+    probe = "10.255.255.1"
+    client.delete(f"rl:{{{probe}}}")
+    now = time.time()
+    for i in range(50):
+        count = rate_limiter.hit_and_count(probe, now + i * 0.01, args.window)
+    print(f"[Bench] probe count after 50 hits: {count} ({'OK' if count == 50 else 'MISMATCH'})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+# block_store.py - single source of truth for IP blocks
+#
+# Redis holds `block:{ip}` records with a TTL. Every worker keeps a small
+# process-local near-cache in front of it so the hot-path check usually costs
+# no network I/O; block/unblock events are broadcast on a pub/sub channel so
+# all workers' caches agree. Without Redis the local store is authoritative:
+# per-process by default, or shared by every worker on the host with
+# STATE_BACKEND=shared (see shared_state.py).
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from dotenv import load_dotenv
+
+from cidr_blocks import get_store as get_ranges
+
+load_dotenv()
+
+# ---------------- CONFIG ----------------
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+REDIS_BLOCK_TTL = int(os.getenv("REDIS_BLOCK_TTL", 300))
+BLOCK_KEY_PREFIX = "block:"
+BLOCK_INDEX = "block_index"  # sorted set: ip -> expires_at, for listing without KEYS
+BLOCK_CHANNEL = os.getenv("BLOCK_CHANNEL", "block_events")
+BLOCK_CACHE_SIZE = int(os.getenv("BLOCK_CACHE_SIZE", 100000))
+BLOCK_CACHE_MAX_AGE = float(os.getenv("BLOCK_CACHE_MAX_AGE", 30))       # re-check positives after this
+BLOCK_CACHE_NEGATIVE_TTL = float(os.getenv("BLOCK_CACHE_NEGATIVE_TTL", 5))  # re-check "not blocked" after this
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").lower()  # "memory" | "shared"
+BLOCK_LIST_SNAPSHOT_TTL = float(os.getenv("BLOCK_LIST_SNAPSHOT_TTL", 60))  # seconds a local listing stays pageable
+BLOCK_LIST_SNAPSHOTS = 16                                                  # local listings kept at once
+
+# Try to connect to Redis, fallback to in-memory store if unavailable
+try:
+    r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True, socket_connect_timeout=2)
+    r.ping()  # Test connection
+    REDIS_AVAILABLE = True
+except Exception as e:
+    print(f"[BlockStore] Redis not available, using in-memory store: {e}")
+    r = None
+    REDIS_AVAILABLE = False
+
+
+# ---------------- LOCAL STORE ----------------
+class MemoryBlocks:
+    """Per-process store: ip -> (expires_at, record)"""
+    shared = False
+
+    def __init__(self):
+        self.entries = {}
+
+    def set(self, ip, expires_at, record):
+        self.entries[ip] = (expires_at, record)
+
+    def pop(self, ip):
+        return self.entries.pop(ip, None) is not None
+
+    def get(self, ip, now):
+        entry = self.entries.get(ip)
+        if entry is None:
+            return None
+        if now < entry[0]:
+            return entry
+        self.entries.pop(ip, None)
+        return None
+
+    def active(self, now):
+        return [(ip, expires_at, record) for ip, (expires_at, record) in list(self.entries.items()) if expires_at > now]
+
+    def count(self, now):
+        return sum(1 for expires_at, _ in list(self.entries.values()) if expires_at > now)
+
+
+def _local_store():
+    if STATE_BACKEND == "shared":
+        try:
+            from shared_state import SharedBlocks
+            store = SharedBlocks()
+            print(f"[BlockStore] Using shared-memory block table at {store.path}")
+            return store
+        except Exception as e:
+            print(f"[BlockStore] Shared-memory store unavailable, using per-process store: {e}")
+    return MemoryBlocks()
+
+
+_lock = threading.Lock()
+# ip -> (blocked, cache_valid_until, block_expires_at)
+_cache = OrderedDict()
+# Authoritative store when Redis is down
+_memory = _local_store()
+_subscriber = None
+stats = {"hits": 0, "misses": 0, "invalidations": 0}
+# Local listings being paged: id -> (created, active entries sorted by ip)
+_listings = OrderedDict()
+_listing_ids = itertools.count(1)
+
+
+# ---------------- NEAR CACHE ----------------
+def _cache_put(ip, blocked, expires_at, now):
+    max_age = BLOCK_CACHE_MAX_AGE if blocked else BLOCK_CACHE_NEGATIVE_TTL
+    with _lock:
+        _cache[ip] = (blocked, min(now + max_age, expires_at), expires_at)
+        _cache.move_to_end(ip)
+        while len(_cache) > BLOCK_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _cache_drop(ip):
+    with _lock:
+        _cache.pop(ip, None)
+
+
+def _cache_get(ip, now):
+    entry = _cache.get(ip)
+    if entry is None or now >= entry[1]:
+        return None
+    return entry[0] and now < entry[2]
+
+
+# ---------------- PUB/SUB ----------------
+def _event(op, ip, expires_at=None):
+    return json.dumps({"op": op, "ip": ip, "expires_at": expires_at})
+
+
+def _apply_event(event):
+    ip = event.get("ip")
+    if not ip:
+        return
+    stats["invalidations"] += 1
+    if event.get("op") == "block" and event.get("expires_at"):
+        _cache_put(ip, True, float(event["expires_at"]), time.time())
+    else:
+        _cache_drop(ip)
+
+
+def _apply_events(event):
+    if event.get("op") == "unblock_many":
+        for ip in event.get("ips", []):
+            _apply_event({"op": "unblock", "ip": ip})
+    else:
+        _apply_event(event)
+
+
+def _listen():
+    while True:
+        try:
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(BLOCK_CHANNEL)
+            # Anything cached before (re)subscribing may have missed events
+            with _lock:
+                _cache.clear()
+            for message in pubsub.listen():
+                try:
+                    _apply_events(json.loads(message["data"]))
+                except Exception as e:
+                    print(f"[BlockStore] Bad block event: {e}")
+        except Exception as e:
+            print(f"[BlockStore] Subscriber error, reconnecting: {e}")
+            with _lock:
+                _cache.clear()
+            time.sleep(1)
+
+
+def start_subscriber():
+    global _subscriber
+    if REDIS_AVAILABLE and r and _subscriber is None:
+        _subscriber = threading.Thread(target=_listen, name="block-subscriber", daemon=True)
+        _subscriber.start()
+
+
+# ---------------- PUBLIC API ----------------
+def block_ip(ip, reason="Manual/Auto Block", source="Engine", severity="HIGH", ttl=REDIS_BLOCK_TTL):
+    record = {
+        "ip": ip,
+        "reason": reason,
+        "source": source,
+        "severity": severity,
+        "timestamp": int(time.time())
+    }
+    now = time.time()
+    expires_at = now + ttl
+    if REDIS_AVAILABLE and r:
+        try:
+            pipe = r.pipeline(transaction=False)
+            pipe.set(f"{BLOCK_KEY_PREFIX}{ip}", json.dumps(record), ex=ttl)
+            pipe.zadd(BLOCK_INDEX, {ip: expires_at})
+            pipe.publish(BLOCK_CHANNEL, _event("block", ip, expires_at))
+            pipe.execute()
+        except Exception as e:
+            print(f"Failed to block IP in Redis: {e}")
+            _memory.set(ip, expires_at, record)
+    else:
+        _memory.set(ip, expires_at, record)
+    _cache_put(ip, True, expires_at, now)
+    return record
+
+
+def unblock_ip(ip):
+    removed = _memory.pop(ip)
+    if REDIS_AVAILABLE and r:
+        try:
+            pipe = r.pipeline(transaction=False)
+            pipe.delete(f"{BLOCK_KEY_PREFIX}{ip}")
+            pipe.zrem(BLOCK_INDEX, ip)
+            pipe.publish(BLOCK_CHANNEL, _event("unblock", ip))
+            removed = bool(pipe.execute()[0]) or removed
+        except Exception as e:
+            print(f"Failed to unblock IP in Redis: {e}")
+    _cache_drop(ip)
+    return removed
+
+
+def _memory_blocked(ip, now):
+    return _memory.get(ip, now) is not None
+
+
+def is_blocked(ip):
+    return check_block(ip)[0]
+
+
+def check_block(ip):
+    """
+    (blocked, range) in one pass: range is blocked_range(ip) when a CIDR block
+    matches, else None, so callers that need both do a single range lookup.
+    """
+    in_range = get_ranges().lookup(ip)
+    if in_range is not None:
+        return True, in_range
+    return _ip_blocked(ip), None
+
+
+def _ip_blocked(ip):
+    now = time.time()
+    if _memory.shared and not (REDIS_AVAILABLE and r):
+        # Other workers write the shared table directly and publish nothing, so a
+        # near-cache would serve stale answers; the mmap lookup is cheap enough
+        return _memory_blocked(ip, now)
+    cached = _cache_get(ip, now)
+    if cached is not None:
+        stats["hits"] += 1
+        return cached
+    stats["misses"] += 1
+
+    if REDIS_AVAILABLE and r:
+        try:
+            ttl_ms = r.pttl(f"{BLOCK_KEY_PREFIX}{ip}")  # -2 missing, -1 no expiry
+            if ttl_ms != -2:
+                expires_at = now + ttl_ms / 1000 if ttl_ms > 0 else float("inf")
+                _cache_put(ip, True, expires_at, now)
+                return True
+            if not _memory_blocked(ip, now):
+                _cache_put(ip, False, float("inf"), now)
+                return False
+            return True
+        except Exception as e:
+            print(f"Failed to check Redis block: {e}")
+
+    return _memory_blocked(ip, now)
+
+
+def unblock_many(ips, chunk_size=1000):
+    """Bulk unblock; one pipelined round trip per chunk. Returns how many blocks were removed"""
+    removed = 0
+    ips = list(dict.fromkeys(ips))
+    for ip in ips:
+        removed += _memory.pop(ip)
+        _cache_drop(ip)
+    if REDIS_AVAILABLE and r:
+        for i in range(0, len(ips), chunk_size):
+            chunk = ips[i:i + chunk_size]
+            try:
+                pipe = r.pipeline(transaction=False)
+                pipe.delete(*[f"{BLOCK_KEY_PREFIX}{ip}" for ip in chunk])
+                pipe.zrem(BLOCK_INDEX, *chunk)
+                pipe.publish(BLOCK_CHANNEL, json.dumps({"op": "unblock_many", "ips": chunk}))
+                removed += pipe.execute()[0]
+            except Exception as e:
+                print(f"Failed to bulk unblock in Redis: {e}")
+    return removed
+
+
+def _prune_index(now):
+    r.zremrangebyscore(BLOCK_INDEX, "-inf", now)
+
+
+def count_blocked():
+    now = time.time()
+    if REDIS_AVAILABLE and r:
+        try:
+            return r.zcount(BLOCK_INDEX, now, "+inf")
+        except Exception as e:
+            print(f"Failed to count Redis blocks: {e}")
+    return _memory.count(now)
+
+
+def list_blocked(cursor=0, count=100):
+    """
+    One page of active blocks as (next_cursor, records); next_cursor == 0 means done.
+    Redis mode walks the expiry index with ZSCAN and fetches records in one pipeline,
+    so each page costs two round trips regardless of how many IPs are blocked.
+    """
+    now = time.time()
+    if REDIS_AVAILABLE and r:
+        try:
+            if not cursor:
+                _prune_index(now)
+            next_cursor, members = r.zscan(BLOCK_INDEX, cursor=cursor, count=count)
+            members = [(ip, expires_at) for ip, expires_at in members if expires_at > now]
+            pipe = r.pipeline(transaction=False)
+            for ip, _ in members:
+                pipe.get(f"{BLOCK_KEY_PREFIX}{ip}")
+            records = []
+            for (ip, expires_at), data in zip(members, pipe.execute()):
+                if data is None:
+                    continue  # Unblocked or expired between ZSCAN and GET
+                try:
+                    record = json.loads(data)
+                except ValueError:
+                    record = {}
+                record["ip"] = ip
+                record["ttl_remaining"] = int(expires_at - now)
+                records.append(record)
+            return int(next_cursor), records
+        except Exception as e:
+            print(f"Failed to list Redis blocks: {e}")
+
+    return _list_local(cursor, count, now)
+
+
+def _list_local(cursor, count, now):
+    """
+    Page through the local store. The first page sorts the active entries once and
+    keeps that snapshot; the cursor carries (snapshot id << 32 | offset), so a full
+    listing costs one scan and sort instead of one per page.
+    """
+    listing_id, offset = cursor >> 32, cursor & 0xFFFFFFFF
+    with _lock:
+        for stale in [k for k, (created, _) in _listings.items() if now - created > BLOCK_LIST_SNAPSHOT_TTL]:
+            del _listings[stale]
+        listing = _listings.get(listing_id)
+    if listing is None:
+        # First page, or a snapshot that has expired: take a new one
+        listing_id = next(_listing_ids)
+        listing = (now, sorted(_memory.active(now), key=lambda entry: entry[0]))
+    active = listing[1]
+    end = offset + count
+    records = [dict(record, ip=ip, ttl_remaining=int(expires_at - now))
+               for ip, expires_at, record in active[offset:end] if expires_at > now]
+    with _lock:
+        if end < len(active):
+            _listings[listing_id] = listing
+            while len(_listings) > BLOCK_LIST_SNAPSHOTS:
+                _listings.popitem(last=False)
+            return listing_id << 32 | end, records
+        _listings.pop(listing_id, None)
+    return 0, records
+
+
+# ---------------- RANGES ----------------
+# CIDR blocks live in cidr_blocks' index, shared between workers through its snapshot file
+def blocked_range(ip):
+    """(cidr, expires_at, reason, source) of the most specific range blocking ip, or None"""
+    return get_ranges().lookup(ip)
+
+
+def block_range(cidr, reason="Manual range block", source="Admin", ttl=None):
+    """Block every address in cidr; ttl None = until removed. Returns the normalised range"""
+    return get_ranges().add(cidr, reason, source, ttl)
+
+
+def block_ranges(cidrs, reason="Threat feed", source="Feed", ttl=None):
+    """Bulk range import; returns (added, rejected entries)"""
+    return get_ranges().add_many(cidrs, reason, source, ttl)
+
+
+def unblock_range(cidr):
+    return get_ranges().remove(cidr)
+
+
+def count_ranges():
+    return len(get_ranges())
+
+
+start_subscriber()
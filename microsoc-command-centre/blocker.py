@@ -1,16 +1,11 @@
-import time
+# blocker.py - compatibility wrapper around block_store
+import block_store
 
-BLOCK_DURATION = 300  
-blocklist = {}
+BLOCK_DURATION = 300
 
 def block_ip(ip):
-    r.setex(f"blocked:{ip}", BLOCK_DURATION, "1")
+    block_store.block_ip(ip, source="Blocker", ttl=BLOCK_DURATION)
 
 
 def is_blocked(ip):
-    if ip in blocklist:
-        if time.time() < blocklist[ip]:
-            return True
-        else:
-            del blocklist[ip]
-    return False
+    return block_store.is_blocked(ip)
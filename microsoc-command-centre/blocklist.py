@@ -1,27 +1,17 @@
-# blocklist.py - Redis Free Version
-import time
+# blocklist.py - compatibility wrapper around block_store
 import os
+import block_store
 
 BLOCK_DURATION = int(os.getenv("BLOCK_DURATION", 600))  # Default 10 min
 
-# In-memory store (IP -> expiry timestamp)
-BLOCKED_IPS = {}
-
 def add_block(ip, duration=BLOCK_DURATION):
-    BLOCKED_IPS[ip] = time.time() + duration
+    block_store.block_ip(ip, source="Blocklist", ttl=duration)
 
 def remove_block(ip):
-    if ip in BLOCKED_IPS:
-        del BLOCKED_IPS[ip]
+    block_store.unblock_ip(ip)
 
 def is_blocked(ip):
-    if ip in BLOCKED_IPS:
-        # Check if block expired
-        if time.time() < BLOCKED_IPS[ip]:
-            return True
-        else:
-            remove_block(ip)
-    return False
+    return block_store.is_blocked(ip)
 
 # Alias (keep compatibility)
 def block_ip(ip, duration=BLOCK_DURATION):
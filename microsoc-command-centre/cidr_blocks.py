@@ -0,0 +1,408 @@
+# cidr_blocks.py - range blocks: longest-prefix match over IPv4 and IPv6 CIDRs
+#
+# One hash table per prefix length (network prefix -> entry). A lookup probes the
+# lengths in use, longest first, so it costs at most one dict lookup per prefix
+# length - O(prefix length) like a trie walk, but every step is a C-level dict probe
+# instead of a Python node hop, and bulk feeds load as plain dict inserts. Entries
+# carry their own expiry.
+#
+# The index is shared between workers through a snapshot file plus a delta log next
+# to it. Admin edits append one line to the log; feed imports, and a log grown past
+# CIDR_LOG_MAX_BYTES, rewrite the snapshot and empty the log. Writers hold a file
+# lock; the other workers poll both files and replay only the new log lines, or
+# reload everything when the snapshot was replaced, the way rule packs hot-reload.
+#
+#   python cidr_blocks.py import drop.txt --reason "Spamhaus DROP" --ttl 86400
+#   python cidr_blocks.py lookup 203.0.113.7
+#   python cidr_blocks.py stats
+import argparse
+import fcntl
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CIDR_SNAPSHOT_PATH = os.getenv("CIDR_SNAPSHOT_PATH", os.path.join(BASE_DIR, "cidr_blocks.npz"))
+CIDR_RELOAD_INTERVAL = float(os.getenv("CIDR_RELOAD_INTERVAL", 2))  # seconds between mtime checks
+CIDR_FEED_TTL = int(os.getenv("CIDR_FEED_TTL", 86400))              # default expiry for imported feeds
+CIDR_LOG_MAX_BYTES = int(os.getenv("CIDR_LOG_MAX_BYTES", 1024 * 1024))  # delta log size that triggers a snapshot
+CIDR_LOG_MAX_RANGES = int(os.getenv("CIDR_LOG_MAX_RANGES", 100))        # larger bulk adds rewrite the snapshot
+
+FAMILIES = {4: (socket.AF_INET, 32), 6: (socket.AF_INET6, 128)}
+
+
+def parse_address(ip):
+    """'203.0.113.7' / '2001:db8::1' -> (family, int); None if not an IP address"""
+    if not isinstance(ip, str):
+        return None
+    family = 6 if ":" in ip else 4
+    try:
+        return family, int.from_bytes(socket.inet_pton(FAMILIES[family][0], ip), "big")
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+def parse_cidr(text):
+    """'10.1.0.0/16' -> (family, prefix length, network prefix); host bits are ignored"""
+    if not isinstance(text, str):
+        raise ValueError(f"Not an IP range: {text!r}")
+    address, _, length = text.strip().partition("/")
+    parsed = parse_address(address)
+    if parsed is None:
+        raise ValueError(f"Not an IP range: {text!r}")
+    family, value = parsed
+    bits = FAMILIES[family][1]
+    length = int(length) if length else bits
+    if not 0 <= length <= bits:
+        raise ValueError(f"Bad prefix length in {text!r}")
+    return family, length, value >> (bits - length)
+
+
+def format_cidr(family, length, prefix):
+    bits = FAMILIES[family][1]
+    packed = (prefix << (bits - length)).to_bytes(bits // 8, "big")
+    return f"{socket.inet_ntop(FAMILIES[family][0], packed)}/{length}"
+
+
+# ---------------- INDEX ----------------
+class CidrIndex:
+    """Longest-prefix-match table of (expires_at, reason, source) entries"""
+
+    def __init__(self):
+        self.tables = {4: {}, 6: {}}   # family -> {prefix length: {prefix: entry}}
+        self.lengths = {4: [], 6: []}  # prefix lengths holding entries, longest first
+        self.lock = threading.Lock()
+
+    def _table(self, family, length):
+        table = self.tables[family].get(length)
+        if table is None:
+            table = self.tables[family][length] = {}
+            # Swap in a new list so unlocked readers never see it half-built
+            self.lengths[family] = sorted(self.tables[family], reverse=True)
+        return table
+
+    def add(self, cidr, reason="Range block", source="Engine", ttl=None, now=None):
+        expires_at = (now or time.time()) + ttl if ttl else float("inf")
+        return self.put(cidr, expires_at, reason, source)
+
+    def put(self, cidr, expires_at, reason, source):
+        """Insert with an absolute expiry; returns the normalised CIDR"""
+        family, length, prefix = parse_cidr(cidr)
+        with self.lock:
+            self._table(family, length)[prefix] = (expires_at, reason, source)
+        return format_cidr(family, length, prefix)
+
+    def add_many(self, cidrs, reason="Feed", source="Feed", ttl=None, now=None):
+        """Bulk insert; returns (added, rejected lines)"""
+        expires_at = (now or time.time()) + ttl if ttl else float("inf")
+        entry = (expires_at, reason, source)
+        added, rejected = 0, []
+        with self.lock:
+            tables = {}
+            for cidr in cidrs:
+                try:
+                    family, length, prefix = parse_cidr(cidr)
+                except ValueError:
+                    rejected.append(cidr)
+                    continue
+                table = tables.get((family, length))
+                if table is None:
+                    table = tables[family, length] = self._table(family, length)
+                table[prefix] = entry
+                added += 1
+        return added, rejected
+
+    def remove(self, cidr):
+        family, length, prefix = parse_cidr(cidr)
+        with self.lock:
+            table = self.tables[family].get(length)
+            return table is not None and table.pop(prefix, None) is not None
+
+    def lookup(self, ip, now=None):
+        """Most specific live range containing ip as (cidr, expires_at, reason, source), or None"""
+        parsed = parse_address(ip) if ip else None
+        if parsed is None:
+            return None
+        family, value = parsed
+        if family == 6 and value >> 32 == 0xFFFF:
+            family, value = 4, value & 0xFFFFFFFF  # IPv4-mapped (::ffff:a.b.c.d) is matched as IPv4
+        lengths = self.lengths[family]
+        if not lengths:
+            return None
+        now = now or time.time()
+        bits = FAMILIES[family][1]
+        tables = self.tables[family]
+        for length in lengths:
+            entry = tables[length].get(value >> (bits - length))
+            if entry is not None and entry[0] > now:
+                return (format_cidr(family, length, value >> (bits - length)),) + entry
+        return None
+
+    def purge(self, now=None):
+        """Drop expired entries and empty prefix lengths; returns how many were dropped"""
+        now = now or time.time()
+        dropped = 0
+        with self.lock:
+            for family, tables in self.tables.items():
+                for length in list(tables):
+                    table = tables[length]
+                    expired = [p for p, entry in table.items() if entry[0] <= now]
+                    for prefix in expired:
+                        del table[prefix]
+                    dropped += len(expired)
+                    if not table:
+                        del tables[length]
+                self.lengths[family] = sorted(tables, reverse=True)
+        return dropped
+
+    def entries(self, now=None):
+        """Yield (cidr, expires_at, reason, source) for every live range"""
+        now = now or time.time()
+        for family, tables in self.tables.items():
+            for length, table in list(tables.items()):
+                for prefix, entry in list(table.items()):
+                    if entry[0] > now:
+                        yield (format_cidr(family, length, prefix),) + entry
+
+    def __len__(self):
+        return sum(len(table) for tables in self.tables.values() for table in tables.values())
+
+    # ---------------- SNAPSHOT ----------------
+    def save(self, path):
+        """Write live entries as .npz (atomic replace): prefixes split into 64-bit halves"""
+        self.purge()
+        columns = {name: [] for name in ("family", "length", "hi", "lo", "expires", "label")}
+        labels = {}
+        with self.lock:
+            for family, tables in self.tables.items():
+                for length, table in tables.items():
+                    for prefix, (expires_at, reason, source) in table.items():
+                        columns["family"].append(family)
+                        columns["length"].append(length)
+                        columns["hi"].append(prefix >> 64)
+                        columns["lo"].append(prefix & 0xFFFFFFFFFFFFFFFF)
+                        columns["expires"].append(expires_at)
+                        columns["label"].append(labels.setdefault((reason, source), len(labels)))
+        arrays = {
+            "family": np.array(columns["family"], dtype=np.uint8),
+            "length": np.array(columns["length"], dtype=np.uint8),
+            "hi": np.array(columns["hi"], dtype=np.uint64),
+            "lo": np.array(columns["lo"], dtype=np.uint64),
+            "expires": np.array(columns["expires"], dtype=np.float64),
+            "label": np.array(columns["label"], dtype=np.uint32),
+            "reasons": np.array([reason for reason, _ in labels] or [""]),
+            "sources": np.array([source for _, source in labels] or [""]),
+        }
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with np.load(path, allow_pickle=False) as data:
+            labels = list(zip(data["reasons"].tolist(), data["sources"].tolist()))
+            rows = zip(data["family"].tolist(), data["length"].tolist(), data["hi"].tolist(),
+                       data["lo"].tolist(), data["expires"].tolist(), data["label"].tolist())
+            now = time.time()
+            for family, length, hi, lo, expires_at, label in rows:
+                if expires_at > now:
+                    index.tables[family].setdefault(length, {})[(hi << 64) | lo] = (expires_at,) + labels[label]
+        for family, tables in index.tables.items():
+            index.lengths[family] = sorted(tables, reverse=True)
+        return index
+
+
+def read_feed(path):
+    """Ranges from a feed file: one IP or CIDR per line, '#' / ';' comments, extra columns ignored"""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            token = line.split("#", 1)[0].split(";", 1)[0].replace(",", " ").split()
+            if token:
+                yield token[0]
+
+
+# ---------------- SHARED STORE ----------------
+class RangeStore:
+    """The process's CidrIndex, kept in sync with the snapshot and delta log other workers write"""
+
+    def __init__(self, path=CIDR_SNAPSHOT_PATH, reload_interval=CIDR_RELOAD_INTERVAL):
+        self.path = path
+        self.log_path = f"{path}.log"
+        self.reload_interval = reload_interval
+        self.index = CidrIndex()
+        self._files = None    # identity of the loaded snapshot and delta log files
+        self._log_offset = 0  # bytes of the delta log already applied
+        self._next_check = 0.0
+        self._maybe_reload(force=True)
+
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+            return st.st_ino, st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _identity(self):
+        snapshot, log = self._stat(self.path), self._stat(self.log_path)
+        return (snapshot[:2] if snapshot else None, log[0] if log else None), (log[2] if log else 0)
+
+    def _maybe_reload(self, force=False):
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return
+        self._next_check = now + self.reload_interval
+        files, log_size = self._identity()
+        if files != self._files or log_size < self._log_offset:
+            # A replaced snapshot comes with a new, empty log: start over from both
+            try:
+                index = CidrIndex.load(self.path) if files[0] else CidrIndex()
+            except Exception as e:
+                print(f"[Ranges] Failed to load {self.path}: {e}")
+                return
+            self.index, self._files, self._log_offset = index, files, 0
+            if files[0]:
+                print(f"[Ranges] Loaded {len(index)} blocked ranges from {self.path}")
+        if log_size > self._log_offset:
+            self._replay_log()
+
+    def _replay_log(self):
+        """Apply the delta log lines past the applied offset"""
+        with open(self.log_path, "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1  # A line still being written is picked up next time
+        for line in data[:end].splitlines():
+            try:
+                op = json.loads(line)
+                if op["op"] == "add":
+                    expires_at = op["expires_at"] if op["expires_at"] is not None else float("inf")
+                    self.index.put(op["cidr"], expires_at, op["reason"], op["source"])
+                else:
+                    self.index.remove(op["cidr"])
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"[Ranges] Skipping bad delta log line {line[:80]!r}: {e}")
+        self._log_offset += end
+
+    @contextmanager
+    def _writing(self):
+        """Serialise changes across workers, starting from their latest state"""
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._maybe_reload(force=True)
+                yield self.index
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _append_log(self, ops):
+        """Record edits already applied to self.index (caller holds the lock)"""
+        with open(self.log_path, "ab") as f:
+            f.write(b"".join(json.dumps(op).encode() + b"\n" for op in ops))
+        self._files, self._log_offset = self._identity()
+        if self._log_offset > CIDR_LOG_MAX_BYTES:
+            self._save_snapshot()
+
+    def _save_snapshot(self):
+        """Fold everything into a new snapshot and start an empty log (caller holds the lock)"""
+        self.index.save(self.path)
+        tmp = f"{self.log_path}.tmp"
+        open(tmp, "wb").close()
+        os.replace(tmp, self.log_path)
+        self._files, self._log_offset = self._identity()
+
+    def _put(self, index, cidr, expires_at, reason, source):
+        """Add to the index; returns the delta log line for it"""
+        cidr = index.put(cidr, float("inf") if expires_at is None else expires_at, reason, source)
+        return {"op": "add", "cidr": cidr, "expires_at": expires_at, "reason": reason, "source": source}
+
+    def lookup(self, ip):
+        self._maybe_reload()
+        return self.index.lookup(ip)
+
+    def add(self, cidr, reason, source, ttl=None):
+        """Returns the normalised range; raises ValueError for a bad one"""
+        with self._writing() as index:
+            op = self._put(index, cidr, time.time() + ttl if ttl else None, reason, source)
+            self._append_log([op])
+            return op["cidr"]
+
+    def add_many(self, cidrs, reason, source, ttl=None):
+        """Returns (added, rejected lines). A feed-sized batch is written as a new snapshot"""
+        cidrs = list(cidrs)
+        with self._writing() as index:
+            if len(cidrs) > CIDR_LOG_MAX_RANGES:
+                result = index.add_many(cidrs, reason, source, ttl)
+                self._save_snapshot()
+                return result
+            expires_at = time.time() + ttl if ttl else None
+            ops, rejected = [], []
+            for cidr in cidrs:
+                try:
+                    ops.append(self._put(index, cidr, expires_at, reason, source))
+                except ValueError:
+                    rejected.append(cidr)
+            if ops:
+                self._append_log(ops)
+            return len(ops), rejected
+
+    def remove(self, cidr):
+        with self._writing() as index:
+            removed = index.remove(cidr)
+            if removed:
+                self._append_log([{"op": "remove", "cidr": cidr}])
+            return removed
+
+    def __len__(self):
+        return len(self.index)
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = RangeStore()
+    return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage CIDR range blocks")
+    parser.add_argument("--snapshot", default=CIDR_SNAPSHOT_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    feed = sub.add_parser("import", help="Load a feed file (one IP/CIDR per line)")
+    feed.add_argument("path")
+    feed.add_argument("--reason", default="Threat feed")
+    feed.add_argument("--source", default="Feed")
+    feed.add_argument("--ttl", type=int, default=CIDR_FEED_TTL, help="Seconds; 0 = never expires")
+    lookup = sub.add_parser("lookup", help="Show the range blocking an IP")
+    lookup.add_argument("ip")
+    sub.add_parser("stats", help="Count live ranges per prefix length")
+    args = parser.parse_args()
+
+    store = RangeStore(args.snapshot)
+    if args.command == "import":
+        started = time.perf_counter()
+        added, rejected = store.add_many(read_feed(args.path), args.reason, args.source, args.ttl or None)
+        print(f"[Ranges] Imported {added} ranges ({len(rejected)} rejected) in {time.perf_counter() - started:.2f}s; "
+              f"{len(store)} in {args.snapshot}")
+        for line in rejected[:10]:
+            print(f"[Ranges] Rejected: {line}")
+    elif args.command == "lookup":
+        print(store.lookup(args.ip) or f"{args.ip} is not in a blocked range")
+    else:
+        for family, tables in store.index.tables.items():
+            for length in sorted(tables):
+                print(f"IPv{family} /{length:<4}{len(tables[length]):>10}")
+        print(f"total {len(store)}")
+
+
+if __name__ == "__main__":
+    main()
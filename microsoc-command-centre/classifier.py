@@ -1,99 +1,71 @@
+import asyncio
 import time
-import re
-import redis
-import json
 import os
-from rate_limiter import count_requests, count_unique_paths
-from threat_intel import check_abuseipdb
-from ml.predict import predict_payload
+from rate_limiter import hit_and_count
+from threat_intel import get_client as get_threat_intel
+from ml.predict import predict_payload, predict_payloads
+from ml.batcher import get_batcher
 from ml.Hybrid_recommend import hybrid_remediation
 from dotenv import load_dotenv
+import behavior
+import block_store
+import log_shipper
+from rule_engine import get_engine
+from metrics import DECISION_STAGE, DECISIONS
 
 load_dotenv()
 
-# ----------------- REDIS CONFIG -----------------
-REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
-LOG_QUEUE = "attack_logs_queue"
+# ----------------- CONFIG -----------------
 REDIS_BLOCK_TTL = int(os.getenv("REDIS_BLOCK_TTL", 300))
+ML_BATCHING = os.getenv("ML_BATCHING", "1") == "1"
 
-# Try to connect to Redis, fallback to in-memory block list if unavailable
-try:
-    r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True, socket_connect_timeout=2)
-    r.ping()  # Test connection
-    REDIS_AVAILABLE = True
-except Exception as e:
-    print(f"[Classifier] Redis not available, using in-memory fallback: {e}")
-    r = None
-    REDIS_AVAILABLE = False
-    # In-memory block list fallback
-    BLOCKED_IPS_MEMORY = {}
-
-# In-memory log queue fallback (shared with app.py)
-LOG_QUEUE_MEMORY = []
+# ----------------- RATE LIMIT CONFIG -----------------
+FLOOD_WINDOW = int(os.getenv("FLOOD_WINDOW", 60))
+FLOOD_MAX_REQUESTS = int(os.getenv("FLOOD_MAX_REQUESTS", 300))
+
+# ----------------- BEHAVIOUR CONFIG -----------------
+# attack_type -> (status, severity, block reason or None, reason template)
+BEHAVIOR_ACTIONS = {
+    "brute_force_login": ("BLOCK", "HIGH", "Brute Force Login", "{n} failed logins in {window}s"),
+    "directory_scan": ("BLOCK", "HIGH", "Directory Scan", "~{n} distinct paths in {window}s"),
+    "repeated_path": ("WARN", "MEDIUM", None, "~{n} hits on {path} in {window}s"),
+}
 
 # ----------------- HELPER FUNCTIONS -----------------
 def push_log(log):
-    if REDIS_AVAILABLE and r:
-        try:
-            r.lpush(LOG_QUEUE, json.dumps(log))
-        except Exception as e:
-            print(f"Failed to push log to Redis: {e}")
-            LOG_QUEUE_MEMORY.append(json.dumps(log))
-    else:
-        LOG_QUEUE_MEMORY.append(json.dumps(log))
+    # Every decision passes through here exactly once, so it is also where decisions are counted
+    DECISIONS.inc(log["status"], log["attack_type"])
+    started = time.perf_counter()
+    log_shipper.enqueue(log)
+    DECISION_STAGE.observe(time.perf_counter() - started, "log_push")
 
 def block_ip(ip, reason, source, severity="HIGH"):
-    record = {
-        "ip": ip,
-        "reason": reason,
-        "source": source,
-        "severity": severity,
-        "timestamp": int(time.time())
-    }
-    if REDIS_AVAILABLE and r:
-        try:
-            r.set(f"block:{ip}", json.dumps(record), ex=REDIS_BLOCK_TTL)
-        except Exception as e:
-            print(f"Failed to block IP in Redis: {e}")
-            BLOCKED_IPS_MEMORY[ip] = time.time() + REDIS_BLOCK_TTL
-    else:
-        BLOCKED_IPS_MEMORY[ip] = time.time() + REDIS_BLOCK_TTL
-    push_log(record)
+    # The BLOCK decision that triggered this is logged by the caller
+    block_store.block_ip(ip, reason, source, severity, ttl=REDIS_BLOCK_TTL)
 
 def is_blocked(ip):
-    if REDIS_AVAILABLE and r:
-        try:
-            return r.exists(f"block:{ip}")
-        except Exception as e:
-            print(f"Failed to check Redis block: {e}")
-    
-    # Check in-memory blocklist
-    if ip in BLOCKED_IPS_MEMORY:
-        if time.time() < BLOCKED_IPS_MEMORY[ip]:
-            return True
-        else:
-            del BLOCKED_IPS_MEMORY[ip]
-    return False
+    return block_store.is_blocked(ip)
 
-# ----------------- PATTERNS -----------------
-SQLI = re.compile(r"(union|select|information_schema|--|;|'\s*or\s*1=1|drop)", re.IGNORECASE)
-XSS = re.compile(r"(<script|onerror=|onload=|javascript:)", re.IGNORECASE)
-SENSITIVE_PATHS = {"/admin", "/phpmyadmin", "/backup.zip", "/.git"}
+def parse_timestamp(value):
+    """Epoch seconds from a client-supplied timestamp; now when it is missing or not a number"""
+    try:
+        return int(float(value)) if value else int(time.time())
+    except (TypeError, ValueError, OverflowError):
+        return int(time.time())
 
 # ----------------- CLASSIFIER -----------------
-def classify_request(ip, path, method, ua, payload=None, timestamp=None):
-    timestamp = int(timestamp or time.time())
-    ua = (ua or "").lower()
-    path = path or "/"
-
+def _rule_check(ip, path, method, ua, payload, timestamp):
+    """Blocklist and signature checks; returns a decision or None when nothing matched"""
     # --- Check if IP is blocked in Redis ---
-    if is_blocked(ip):
+    started = time.perf_counter()
+    blocked, in_range = block_store.check_block(ip)
+    DECISION_STAGE.observe(time.perf_counter() - started, "block_check")
+    if blocked:
         log = {
             "status": "BLOCK",
-            "attack_type": "previous_block",
+            "attack_type": "blocked_range" if in_range else "previous_block",
             "severity": "CRITICAL",
-            "reason": "IP already blocked",
+            "reason": f"IP in blocked range {in_range[0]} ({in_range[2]})" if in_range else "IP already blocked",
             "suggestion": "Wait TTL",
             "ip": ip,
             "path": path,
@@ -104,15 +76,19 @@ def classify_request(ip, path, method, ua, payload=None, timestamp=None):
         push_log(log)
         return log
 
-    # --- SQL Injection ---
-    if (payload and SQLI.search(str(payload))) or SQLI.search(path):
-        block_ip(ip, "SQL Injection", "RuleEngine", "HIGH")
+    # --- DDoS Request Flood ---
+    started = time.perf_counter()
+    hits = hit_and_count(ip, timestamp, FLOOD_WINDOW)
+    DECISION_STAGE.observe(time.perf_counter() - started, "rate_limit")
+    if hits > FLOOD_MAX_REQUESTS:
+        block_ip(ip, "Request Flood", "RateLimiter", "HIGH")
+        rec = hybrid_remediation("dos_flood", frequency=hits)
         log = {
             "status": "BLOCK",
-            "attack_type": "sql_injection",
+            "attack_type": "dos_flood",
             "severity": "HIGH",
-            "reason": "SQL injection detected",
-            "suggestion": "Sanitize input",
+            "reason": f"{hits} requests in {FLOOD_WINDOW}s",
+            "suggestion": rec["suggestion"],
             "ip": ip,
             "path": path,
             "method": method,
@@ -122,32 +98,67 @@ def classify_request(ip, path, method, ua, payload=None, timestamp=None):
         push_log(log)
         return log
 
-    # --- XSS Attempt ---
-    if payload and XSS.search(str(payload)):
+    # --- Signature rules (SQLi, XSS, sensitive paths, bad user agents) ---
+    started = time.perf_counter()
+    rule = get_engine().match(payload, path, ua)
+    DECISION_STAGE.observe(time.perf_counter() - started, "rule_scan")
+    if rule:
+        if rule.get("block_reason"):
+            block_ip(ip, rule["block_reason"], "RuleEngine", rule["severity"])
         log = {
-            "status": "WARN",
-            "attack_type": "xss_attempt",
-            "severity": "MEDIUM",
-            "reason": "Possible XSS attempt",
-            "suggestion": "Escape output",
+            "status": rule["status"],
+            "attack_type": rule["attack_type"],
+            "severity": rule["severity"],
+            "reason": rule["reason"].format(path=path),
+            "suggestion": rule["suggestion"],
             "ip": ip,
             "path": path,
             "method": method,
             "timestamp": timestamp,
-            "is_blocked_now": False
+            "is_blocked_now": bool(rule.get("block_reason"))
         }
         push_log(log)
         return log
 
-    # --- Sensitive Paths ---
-    if path.lower() in SENSITIVE_PATHS:
-        block_ip(ip, "Sensitive Path Access", "RuleEngine")
+    # --- Behaviour (brute-force logins, directory scans, hammered paths) ---
+    started = time.perf_counter()
+    finding = behavior.observe(ip, path, payload, timestamp)
+    DECISION_STAGE.observe(time.perf_counter() - started, "behavior")
+    if finding:
+        attack_type, n, window = finding
+        status, severity, block_reason, reason = BEHAVIOR_ACTIONS[attack_type]
+        if block_reason:
+            block_ip(ip, block_reason, "Behavior", severity)
+        rec = hybrid_remediation(attack_type, frequency=n)
+        log = {
+            "status": status,
+            "attack_type": attack_type,
+            "severity": severity,
+            "reason": reason.format(n=n, window=window, path=path),
+            "suggestion": rec["suggestion"],
+            "ip": ip,
+            "path": path,
+            "method": method,
+            "timestamp": timestamp,
+            "is_blocked_now": bool(block_reason)
+        }
+        push_log(log)
+        return log
+
+    # --- Threat Intelligence (cache only; misses are looked up in the background) ---
+    started = time.perf_counter()
+    intel = get_threat_intel()
+    reputation = intel.peek(ip) if intel else None
+    DECISION_STAGE.observe(time.perf_counter() - started, "threat_intel")
+    if reputation and reputation.get("is_malicious"):
+        block_ip(ip, "Threat Intel Reputation", "ThreatIntel", "HIGH")
+        rec = hybrid_remediation("threat_intel")
         log = {
             "status": "BLOCK",
-            "attack_type": "sensitive_path_access",
+            "attack_type": "threat_intel",
             "severity": "HIGH",
-            "reason": f"Accessed sensitive path {path}",
-            "suggestion": "Restrict access",
+            "reason": f"IP abuse confidence {reputation.get('confidence')}",
+            "suggestion": rec["suggestion"],
             "ip": ip,
             "path": path,
             "method": method,
@@ -157,38 +168,47 @@ def classify_request(ip, path, method, ua, payload=None, timestamp=None):
         push_log(log)
         return log
 
-    # --- ML / AI Prediction ---
-    if payload:
-        try:
-            src = payload.get("src_ip")
-            dst = payload.get("dst_ip")
-            port = payload.get("port")
-            protocol = payload.get("protocol")
-            size = payload.get("packet_size")
-
-            if None not in (src, dst, port, protocol, size):
-                label, conf = predict_payload(src, dst, port, protocol, size)
-                if label != "normal" and conf > 0.85:
-                    status = "BLOCK"
-                    log = {
-                        "status": status,
-                        "attack_type": f"ML_{label}",
-                        "severity": "HIGH",
-                        "reason": f"AI detected {label}",
-                        "suggestion": "Investigate",
-                        "ip": ip,
-                        "path": path,
-                        "method": method,
-                        "timestamp": timestamp,
-                        "confidence": conf,
-                        "is_blocked_now": True
-                    }
-                    push_log(log)
-                    return log
-        except Exception as e:
-            print("ML prediction failed:", e)
+    return None
 
-    # --- Normal Request ---
+
+def _ml_features(payload):
+    """Extract the (src_ip, dst_ip, port, protocol, packet_size) row, or None if not ML-eligible"""
+    if not isinstance(payload, dict):
+        return None
+    row = (
+        payload.get("src_ip"),
+        payload.get("dst_ip"),
+        payload.get("port"),
+        payload.get("protocol"),
+        payload.get("packet_size"),
+    )
+    if None in row:
+        return None
+    return row
+
+
+def _ml_decision(ip, path, method, timestamp, label, conf):
+    if label != "normal" and conf > 0.85:
+        status = "BLOCK"
+        log = {
+            "status": status,
+            "attack_type": f"ML_{label}",
+            "severity": "HIGH",
+            "reason": f"AI detected {label}",
+            "suggestion": "Investigate",
+            "ip": ip,
+            "path": path,
+            "method": method,
+            "timestamp": timestamp,
+            "confidence": conf,
+            "is_blocked_now": True
+        }
+        push_log(log)
+        return log
+    return None
+
+
+def _allow_decision(ip, path, method, timestamp):
     rec = hybrid_remediation("normal")
     allow_log = {
         "status": "ALLOW",
@@ -204,3 +224,122 @@ def classify_request(ip, path, method, ua, payload=None, timestamp=None):
     }
     push_log(allow_log)
     return allow_log
+
+
+def classify_request(ip, path, method, ua, payload=None, timestamp=None):
+    timestamp = parse_timestamp(timestamp)
+    ua = (ua or "").lower()
+    path = path or "/"
+
+    log = _rule_check(ip, path, method, ua, payload, timestamp)
+    if log:
+        return log
+
+    # --- ML / AI Prediction ---
+    row = _ml_features(payload)
+    if row:
+        try:
+            label, conf = predict_payload(*row)
+            log = _ml_decision(ip, path, method, timestamp, label, conf)
+            if log:
+                return log
+        except Exception as e:
+            print("ML prediction failed:", e)
+
+    # --- Normal Request ---
+    return _allow_decision(ip, path, method, timestamp)
+
+
+async def classify_request_async(ip, path, method, ua, payload=None, timestamp=None):
+    """
+    Same decisions as classify_request, but ML-eligible requests are scored through
+    the shared micro-batcher so concurrent handlers share one model call.
+    """
+    if not ML_BATCHING:
+        return classify_request(ip, path, method, ua, payload=payload, timestamp=timestamp)
+
+    timestamp = parse_timestamp(timestamp)
+    ua = (ua or "").lower()
+    path = path or "/"
+
+    log = _rule_check(ip, path, method, ua, payload, timestamp)
+    if log:
+        return log
+
+    # --- ML / AI Prediction (micro-batched) ---
+    row = _ml_features(payload)
+    if row:
+        try:
+            label, conf = await get_batcher().predict(*row)
+            log = _ml_decision(ip, path, method, timestamp, label, conf)
+            if log:
+                return log
+        except Exception as e:
+            print("ML prediction failed:", e)
+
+    # --- Normal Request ---
+    return _allow_decision(ip, path, method, timestamp)
+
+
+def _batch_rules(items):
+    """Rule checks in input order; returns (decisions, ML-eligible rows still to score)"""
+    decisions = [None] * len(items)
+    pending = []  # (index, ip, path, method, timestamp, row)
+
+    for i, item in enumerate(items):
+        ip = item.get("ip")
+        path = item.get("path") or "/"
+        method = item.get("method", "GET")
+        ua = (item.get("user_agent") or "").lower()
+        payload = item.get("payload")
+        timestamp = parse_timestamp(item.get("timestamp"))
+
+        log = _rule_check(ip, path, method, ua, payload, timestamp)
+        if log:
+            decisions[i] = log
+            continue
+
+        row = _ml_features(payload)
+        if row:
+            pending.append((i, ip, path, method, timestamp, row))
+        else:
+            decisions[i] = _allow_decision(ip, path, method, timestamp)
+
+    return decisions, pending
+
+
+def _predict_pending(pending):
+    try:
+        return predict_payloads([p[5] for p in pending])
+    except Exception as e:
+        print("ML batch prediction failed:", e)
+        return [("normal", 0.0)] * len(pending)
+
+
+def _batch_ml(decisions, pending, predictions):
+    for (i, ip, path, method, timestamp, _), (label, conf) in zip(pending, predictions):
+        decisions[i] = (_ml_decision(ip, path, method, timestamp, label, conf)
+                        or _allow_decision(ip, path, method, timestamp))
+    return decisions
+
+
+def classify_batch(items):
+    """
+    Classify many requests at once. Each item is a dict with the same keys as the
+    decision API (ip, path, method, user_agent, payload, timestamp). Rule checks run
+    in input order, then every ML-eligible row goes through a single batched
+    prediction. Decisions are returned in input order.
+    """
+    decisions, pending = _batch_rules(items)
+    if pending:
+        _batch_ml(decisions, pending, _predict_pending(pending))
+    return decisions
+
+
+async def classify_batch_async(items):
+    """
+    classify_batch for async handlers. The whole batch (rule checks, Redis round
+    trips and the model call) runs in a worker thread so the event loop keeps
+    serving other requests; reputation comes from the cache only.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, classify_batch, items)
@@ -0,0 +1,119 @@
+# metrics.py - in-process histograms, counters and gauges rendered in the Prometheus text format
+#
+# Kept dependency-free and cheap enough for the decision path: an observation is
+# one bisect over fixed buckets plus a few additions under a lock. Gauges are
+# callbacks evaluated only when /metrics is scraped.
+import os
+import threading
+from bisect import bisect_left
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Seconds; dense below 10ms where the decision path lives, coarse above for I/O
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        if not METRICS_ENABLED:
+            return
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = {k: list(v) for k, v in self.series.items()}
+        names = self.labelnames + ("le",)
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), series):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, n=1):
+        if not METRICS_ENABLED:
+            return
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + n
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            snapshot = sorted(self.values.items())
+        lines += [f"{self.name}{_labels(self.labelnames, labels)} {v}" for labels, v in snapshot]
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time; kind="counter" for monotonic totals kept elsewhere"""
+
+    def __init__(self, name, help_text, fn, kind="gauge"):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.kind = kind
+        _registry.append(self)
+
+    def render(self):
+        try:
+            value = float(self.fn())
+        except Exception as e:
+            print(f"[Metrics] Gauge {self.name} failed: {e}")
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", f"{self.name} {value}"]
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+# ---------------- SHARED METRICS ----------------
+DECISION_STAGE = Histogram("decision_stage_seconds", "Time spent in each stage of classify_request", ["stage"])
+DECISION_TOTAL = Histogram("decision_seconds", "End-to-end decision latency inside the API handler", ["endpoint"])
+DECISIONS = Counter("decisions_total", "Decisions by status and attack type", ["status", "attack_type"])
+SHIPPER_STAGE = Histogram("log_shipper_stage_seconds", "Time spent in each step of a log flush", ["stage"])
+SHIPPER_ROWS = Counter("log_shipper_rows_total", "Aggregates handled by the log shipper", ["sink", "result"])
@@ -5,6 +5,7 @@ def hybrid_remediation(attack_type, confidence=0.0, frequency=1):
         "directory_scan": "Throttle IP, serve fake honeypot paths for attacker deception.",
         "brute_force_login": "Enable MFA, account lockout policy, add invisible bot CAPTCHA.",
         "dos_flood": "Activate rate-limiter, drop packets, auto-scale system.",
+        "repeated_path": "Throttle the endpoint per client, cache or CAPTCHA the response.",
         "threat_intel": "Auto blacklist for 24h, export IOC to SOC.",
         "sensitive_path_access": "Block, log, and alert — attempt to access system internals.",
         "ML_port_scan": "Block & deploy honeypot port response to observe attacker.",
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from ml.predict import predict_payloads
+
+# ---------------- CONFIG ----------------
+ML_BATCH_MAX_SIZE = int(os.getenv("ML_BATCH_MAX_SIZE", 64))
+ML_BATCH_WAIT_MS = float(os.getenv("ML_BATCH_WAIT_MS", 2))
+
+
+class InferenceBatcher:
+    """
+    Collects concurrent prediction requests for up to `max_wait_ms` (or until
+    `max_batch` rows are queued) and scores them with one batched model call.
+    Each caller gets a Future that resolves to its own (label, confidence).
+    """
+
+    def __init__(self, predict_fn=predict_payloads, max_batch=ML_BATCH_MAX_SIZE, max_wait_ms=ML_BATCH_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ml-batcher", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+
+    def submit(self, src_ip, dst_ip, port, protocol, packet_size):
+        """Queue one row for the next batch; returns a concurrent.futures.Future"""
+        self.start()
+        future = Future()
+        self._queue.put(((src_ip, dst_ip, port, protocol, packet_size), future))
+        return future
+
+    async def predict(self, src_ip, dst_ip, port, protocol, packet_size):
+        """Awaitable variant of submit() for use inside async handlers"""
+        future = self.submit(src_ip, dst_ip, port, protocol, packet_size)
+        return await asyncio.wrap_future(future)
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Stop marker: finish this batch, then exit on the next loop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            # Claim each future before inference: one cancelled from here on (e.g. a client
+            # disconnect cancelling wrap_future) can no longer change state under set_result
+            batch = [(row, future) for row, future in self._collect(first) if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            rows = [row for row, _ in batch]
+            try:
+                results = self.predict_fn(rows)
+            except Exception as e:
+                print(f"[ML] Batch inference failed: {e}")
+                results = [("normal", 0.0)] * len(rows)
+
+            self.batches += 1
+            self.rows += len(rows)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+_batcher = None
+
+
+def get_batcher():
+    """Process-wide batcher shared by all request handlers"""
+    global _batcher
+    if _batcher is None:
+        _batcher = InferenceBatcher()
+    return _batcher
@@ -1,77 +1,159 @@
-import pandas as pd
+"""
+Synthetic flow dataset for the threat LSTM, generated with vectorized NumPy in
+fixed-size chunks so tens of millions of rows stream straight to disk.
+
+    python ml/dataset_making.py                                   # 6000 rows -> lstm_threat_dataset.csv
+    python ml/dataset_making.py --rows 20000000 --out flows.parquet --seed 7
+    python ml/dataset_making.py --mix Normal=0.6,DoS=0.2,PortScan=0.1,SQLi=0.05,XSS=0.05
+    python ml/dataset_making.py --profiles my_profiles.json
+
+Output is identical for the same --seed, --rows, --chunk-rows, --mix, --profiles and --start.
+"""
+import argparse
+import json
+import time
+
 import numpy as np
-from datetime import datetime, timedelta
-import random
-
-num_rows = 6000  # dataset size
-start_time = datetime.now()
-
-timestamps = []
-src_ips = []
-dst_ips = []
-ports = []
-protocols = []
-packet_sizes = []
-labels = []
-
-protocol_list = ['TCP', 'UDP', 'ICMP']
-attack_types = ['Normal', 'DoS', 'PortScan', 'SQLi', 'XSS']
-
-def random_ip():
-    return ".".join(str(random.randint(1, 255)) for _ in range(4))
-
-for i in range(num_rows):
-    timestamps.append(start_time + timedelta(seconds=i))
-    src_ips.append(random_ip())
-    dst_ips.append(random_ip())
-
-
-    port = random.randint(1, 65535)
-    protocol = random.choice(protocol_list)
-    packet_size = random.randint(60, 1500)
-
-    prob = random.random()
-
-    if prob < 0.80:   
-        label = "Normal"
-
-    elif prob < 0.88:  
-        label = "DoS"
-        protocol = 'UDP'
-        packet_size = random.randint(800, 1500)
-
-    elif prob < 0.94:  
-        label = "PortScan"
-        port = random.randint(1, 200)  # scanning small port range repeatedly
-        protocol = 'TCP'
-        packet_size = random.randint(60, 300)
-
-    elif prob < 0.97:  # 3% SQL Injection
-        label = "SQLi"
-        port = random.choice([80, 443]) # web servers
-        protocol = 'TCP'
-        packet_size = random.randint(150, 400)
-
-    else:  # 3% XSS
-        label = "XSS"
-        port = random.choice([80, 443])
-        protocol = 'TCP'
-        packet_size = random.randint(200, 600)
-
-    ports.append(port)
-    protocols.append(protocol)
-    packet_sizes.append(packet_size)
-    labels.append(label)
-
-df = pd.DataFrame({
-    'Timestamp': timestamps,
-    'Source_IP': src_ips,
-    'Destination_IP': dst_ips,
-    'Port': ports,
-    'Protocol': protocols,
-    'Packet_Size': packet_sizes,
-    'Label': labels
-})
-
-df.to_csv("lstm_threat_dataset.csv", index=False)
-print("LSTM Dataset created successfully → lstm_threat_dataset.csv")
+import pandas as pd
+
+PROTOCOLS = ['TCP', 'UDP', 'ICMP']
+
+# Default class mix: 80% normal, 8% DoS, 6% port scans, 3% SQLi, 3% XSS
+DEFAULT_MIX = {"Normal": 0.80, "DoS": 0.08, "PortScan": 0.06, "SQLi": 0.03, "XSS": 0.03}
+
+# Per-label traffic shape. "ports" is [low, high] (inclusive) or {"choice": [...]};
+# "protocols" is picked uniformly; "packet_size" is [low, high] (inclusive).
+DEFAULT_PROFILES = {
+    "Normal": {"ports": [1, 65535], "protocols": PROTOCOLS, "packet_size": [60, 1500]},
+    "DoS": {"ports": [1, 65535], "protocols": ["UDP"], "packet_size": [800, 1500]},
+    "PortScan": {"ports": [1, 200], "protocols": ["TCP"], "packet_size": [60, 300]},  # scanning small port range
+    "SQLi": {"ports": {"choice": [80, 443]}, "protocols": ["TCP"], "packet_size": [150, 400]},  # web servers
+    "XSS": {"ports": {"choice": [80, 443]}, "protocols": ["TCP"], "packet_size": [200, 600]},
+}
+
+_OCTETS = np.array([str(i) for i in range(256)], dtype=object)
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        label, _, weight = part.partition("=")
+        mix[label.strip()] = float(weight)
+    return mix
+
+
+def random_ips(rng, n):
+    """n dotted-quad strings with every octet in 1..255, built from a lookup table"""
+    octets = rng.integers(1, 256, size=(4, n))
+    t = _OCTETS
+    return t[octets[0]] + "." + t[octets[1]] + "." + t[octets[2]] + "." + t[octets[3]]
+
+
+def _draw(rng, spec, n):
+    if isinstance(spec, dict):
+        return rng.choice(np.asarray(spec["choice"]), size=n)
+    return rng.integers(spec[0], spec[1] + 1, size=n)
+
+
+def make_chunk(rng, start, first_row, n, labels, weights, profiles):
+    label_idx = rng.choice(len(labels), size=n, p=weights)
+    ports = np.empty(n, dtype=np.int64)
+    sizes = np.empty(n, dtype=np.int64)
+    protocols = np.empty(n, dtype=object)
+    for i, label in enumerate(labels):
+        rows = np.nonzero(label_idx == i)[0]
+        if not len(rows):
+            continue
+        profile = profiles[label]
+        ports[rows] = _draw(rng, profile["ports"], len(rows))
+        sizes[rows] = _draw(rng, profile["packet_size"], len(rows))
+        protocols[rows] = rng.choice(np.asarray(profile["protocols"], dtype=object), size=len(rows))
+
+    return pd.DataFrame({
+        'Timestamp': start + (np.arange(first_row, first_row + n) * 1_000_000).astype("timedelta64[us]"),
+        'Source_IP': random_ips(rng, n),
+        'Destination_IP': random_ips(rng, n),
+        'Port': ports,
+        'Protocol': protocols,
+        'Packet_Size': sizes,
+        'Label': np.asarray(labels, dtype=object)[label_idx],
+    })
+
+
+class _Writer:
+    """Appends DataFrame chunks to one CSV or Parquet file"""
+
+    def __init__(self, path, fmt):
+        self.path = path
+        self.fmt = fmt
+        self.parquet = None
+        self.first = True
+
+    def write(self, df):
+        if self.fmt == "parquet":
+            import pyarrow as pa  # Only needed for Parquet output
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self.parquet is None:
+                self.parquet = pq.ParquetWriter(self.path, table.schema)
+            self.parquet.write_table(table)
+        else:
+            df.to_csv(self.path, index=False, mode="w" if self.first else "a", header=self.first)
+        self.first = False
+
+    def close(self):
+        if self.parquet is not None:
+            self.parquet.close()
+
+
+def generate(out, rows, seed=0, chunk_rows=1_000_000, mix=None, profiles=None,
+             start="2025-01-01 00:00:00", fmt=None):
+    mix = mix or DEFAULT_MIX
+    profiles = dict(DEFAULT_PROFILES, **(profiles or {}))
+    missing = [label for label in mix if label not in profiles]
+    if missing:
+        raise ValueError(f"No attack profile for {missing}")
+    labels = list(mix)
+    weights = np.array([mix[label] for label in labels], dtype=np.float64)
+    weights /= weights.sum()
+
+    fmt = fmt or ("parquet" if out.endswith(".parquet") else "csv")
+    start = np.datetime64(pd.Timestamp(start).to_datetime64(), "us")
+    writer = _Writer(out, fmt)
+    # One child stream per chunk: chunks are independent of each other and of wall time
+    streams = np.random.SeedSequence(seed).spawn(-(-rows // chunk_rows) if rows else 0)
+    try:
+        for k, stream in enumerate(streams):
+            first_row = k * chunk_rows
+            n = min(chunk_rows, rows - first_row)
+            writer.write(make_chunk(np.random.default_rng(stream), start, first_row, n, labels, weights, profiles))
+    finally:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic flow dataset for the threat LSTM")
+    parser.add_argument("--rows", type=int, default=6000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="lstm_threat_dataset.csv")
+    parser.add_argument("--format", choices=("csv", "parquet"), help="Default: from the --out extension")
+    parser.add_argument("--chunk-rows", type=int, default=1_000_000)
+    parser.add_argument("--mix", type=parse_mix, help="Label=weight,... (weights are normalised)")
+    parser.add_argument("--profiles", help="JSON file of per-label profiles, merged over the defaults")
+    parser.add_argument("--start", default="2025-01-01 00:00:00", help="Timestamp of the first row")
+    args = parser.parse_args()
+
+    profiles = None
+    if args.profiles:
+        with open(args.profiles) as f:
+            profiles = json.load(f)
+
+    started = time.perf_counter()
+    generate(args.out, args.rows, seed=args.seed, chunk_rows=args.chunk_rows, mix=args.mix,
+             profiles=profiles, start=args.start, fmt=args.format)
+    print(f"LSTM Dataset created successfully → {args.out} "
+          f"({args.rows} rows in {time.perf_counter() - started:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Export threat_lstm.keras into a compact .npz for the TensorFlow-free NumPy backend,
+then check that both engines agree and compare their latency.
+
+    python -m ml.export_weights            # export + parity check + latency
+    python -m ml.export_weights --no-verify
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from ml.numpy_lstm import NumpyLSTM
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODEL = os.path.join(BASE_DIR, "threat_lstm.keras")
+DEFAULT_WEIGHTS = os.path.join(BASE_DIR, "threat_lstm_weights.npz")
+
+
+def export(model, out_path):
+    lstm = [l for l in model.layers if l.__class__.__name__ == "LSTM"]
+    dense = [l for l in model.layers if l.__class__.__name__ == "Dense"]
+    if len(lstm) != 1 or len(dense) != 2:
+        raise ValueError("Expected LSTM -> Dense -> Dense architecture")
+
+    cfg = lstm[0].get_config()
+    if cfg.get("activation") != "tanh" or cfg.get("recurrent_activation") != "sigmoid":
+        raise ValueError("NumPy backend only supports tanh/sigmoid LSTM activations")
+
+    kernel, recurrent, bias = lstm[0].get_weights()
+    d1_kernel, d1_bias = dense[0].get_weights()
+    d2_kernel, d2_bias = dense[1].get_weights()
+    np.savez_compressed(
+        out_path,
+        lstm_kernel=kernel,
+        lstm_recurrent_kernel=recurrent,
+        lstm_bias=bias,
+        dense1_kernel=d1_kernel,
+        dense1_bias=d1_bias,
+        dense2_kernel=d2_kernel,
+        dense2_bias=d2_bias,
+    )
+    print(f"[Export] Weights written to {out_path} ({os.path.getsize(out_path)} bytes)")
+
+
+def _time_predict(predict, x, repeats):
+    predict(x)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        predict(x)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def verify(model, weights_path, samples=512, atol=1e-4, repeats=50):
+    """Parity check against model.predict plus a latency comparison; returns True on match"""
+    engine = NumpyLSTM.load(weights_path)
+    rng = np.random.default_rng(0)
+    x = rng.random((samples, 10, 5), dtype=np.float32)
+
+    expected = model.predict(x, verbose=0)
+    actual = engine.predict(x)
+    max_diff = float(np.abs(expected - actual).max())
+    same_argmax = bool((expected.argmax(axis=1) == actual.argmax(axis=1)).all())
+    ok = max_diff <= atol and same_argmax
+    print(f"[Verify] max |keras - numpy| = {max_diff:.2e} (atol {atol}) | argmax match: {same_argmax} | {'OK' if ok else 'FAIL'}")
+
+    for n in (1, 64):
+        xb = x[:n]
+        keras_ms = _time_predict(lambda a: model.predict(a, verbose=0), xb, repeats)
+        numpy_ms = _time_predict(engine.predict, xb, repeats)
+        print(f"[Latency] batch={n:<3} keras {keras_ms:8.3f} ms | numpy {numpy_ms:8.3f} ms | speedup x{keras_ms / numpy_ms:.1f}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the threat LSTM to a NumPy .npz")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--out", default=DEFAULT_WEIGHTS)
+    parser.add_argument("--no-verify", action="store_true", help="Skip parity check and latency comparison")
+    parser.add_argument("--atol", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    import tensorflow as tf  # Only the export step needs TensorFlow
+
+    model = tf.keras.models.load_model(args.model)
+    export(model, args.out)
+    if not args.no_verify and not verify(model, args.out, atol=args.atol):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import numpy as np
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+class NumpyLSTM:
+    """
+    Pure NumPy forward pass of the threat model (LSTM(64) -> Dropout -> Dense(32, relu)
+    -> Dense(num_classes, softmax)) using weights exported by ml/export_weights.py.
+    Drop-in for the Keras model: exposes predict(x_seq) on (N, timesteps, features).
+    """
+
+    def __init__(self, weights):
+        self.kernel = weights["lstm_kernel"].astype(np.float32)            # (features, 4*units)
+        self.recurrent = weights["lstm_recurrent_kernel"].astype(np.float32)  # (units, 4*units)
+        self.bias = weights["lstm_bias"].astype(np.float32)                # (4*units,)
+        self.dense1_kernel = weights["dense1_kernel"].astype(np.float32)
+        self.dense1_bias = weights["dense1_bias"].astype(np.float32)
+        self.dense2_kernel = weights["dense2_kernel"].astype(np.float32)
+        self.dense2_bias = weights["dense2_bias"].astype(np.float32)
+        self.units = self.recurrent.shape[0]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls({k: data[k] for k in data.files})
+
+    def _cell(self, z, c):
+        """Apply LSTM gates to pre-activations z; Keras gate order is input, forget, cell, output"""
+        u = self.units
+        i = _sigmoid(z[:, :u])
+        f = _sigmoid(z[:, u:2 * u])
+        g = np.tanh(z[:, 2 * u:3 * u])
+        o = _sigmoid(z[:, 3 * u:])
+        c = f * c + i * g
+        return o * np.tanh(c), c
+
+    def lstm_step(self, x_t, h, c):
+        """One LSTM timestep for a (N, features) input"""
+        return self._cell(x_t @ self.kernel + h @ self.recurrent + self.bias, c)
+
+    def head(self, h):
+        """Dense layers on top of the final hidden state (Dropout is a no-op at inference)"""
+        d = np.maximum(h @ self.dense1_kernel + self.dense1_bias, 0.0)
+        return _softmax(d @ self.dense2_kernel + self.dense2_bias)
+
+    def predict(self, x_seq, verbose=0, batch_size=None):
+        x_seq = np.asarray(x_seq, dtype=np.float32)
+        n, steps, _ = x_seq.shape
+        h = np.zeros((n, self.units), dtype=np.float32)
+        c = np.zeros((n, self.units), dtype=np.float32)
+        # Input projection for all timesteps at once; only the recurrent part is sequential
+        xz = x_seq @ self.kernel + self.bias
+        for t in range(steps):
+            h, c = self._cell(xz[:, t] + h @ self.recurrent, c)
+        return self.head(h)
@@ -1,26 +1,102 @@
-import tensorflow as tf
 import numpy as np
 import pickle
 import os
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import DECISION_STAGE
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# "keras" (default) or "numpy" — the NumPy engine runs without importing TensorFlow.
+# Export its weights first with: python -m ml.export_weights
+ML_BACKEND = os.getenv("ML_BACKEND", "keras").lower()
+ML_WEIGHTS_PATH = os.getenv("ML_WEIGHTS_PATH", os.path.join(BASE_DIR, "threat_lstm_weights.npz"))
+
+# How each request becomes an LSTM input:
+#   "window"   - the source IP's last 10 events (default, matches training)
+#   "stateful" - carry LSTM state per source IP, one step per event (NumPy backend only)
+#   "repeat"   - the request's own vector repeated 10 times (legacy, no per-IP state)
+ML_SEQUENCE_MODE = os.getenv("ML_SEQUENCE_MODE", "window").lower()
+
+# Verdicts remembered for repeated identical flows (scanners, floods); 0 disables
+ML_VERDICT_CACHE_SIZE = int(os.getenv("ML_VERDICT_CACHE_SIZE", 10000))
+
 # Lazy loading of LSTM model and encoders
 model = None
 protocol_encoder = None
 label_encoder = None
 scaler = None
+sequences = None
+_fused = None  # preprocessing tables derived from the encoders above, see _tables()
+
+
+class VerdictCache:
+    """
+    Bounded LRU of (label, confidence) keyed on the raw (src_ip, dst_ip, port,
+    protocol, packet_size) row. Only used where the model input is fully
+    determined by the row, see predict_payloads.
+    """
+
+    def __init__(self, size=ML_VERDICT_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key):
+        with self.lock:
+            verdict = self.entries.get(key)
+            if verdict is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return verdict
+
+    def put(self, key, verdict):
+        with self.lock:
+            self.entries[key] = verdict
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.stats = {"hits": 0, "misses": 0}
+
+    def hit_rate(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+verdicts = VerdictCache()
+
+# Warm-up state for the readiness probe: "cold" -> "loading" -> "ready" | "failed"
+ml_state = "cold"
+_load_lock = threading.Lock()
+_ready = threading.Event()
 
 def load_model():
     """Load ML model and encoders on first use"""
+    with _load_lock:
+        _load_model()
+
+
+def _load_model():
     global model, protocol_encoder, label_encoder, scaler
-    
+
     if model is not None:
         return  # Already loaded
-    
+
     try:
         # Load LSTM model
-        model = tf.keras.models.load_model(os.path.join(BASE_DIR, "threat_lstm.keras"))
+        model = _load_network()
         
         # Load encoders and scaler
         with open(os.path.join(BASE_DIR, "protocol_encoder.pkl"), "rb") as f:
@@ -32,35 +108,191 @@ def load_model():
         with open(os.path.join(BASE_DIR, "scaler.pkl"), "rb") as f:
             scaler = pickle.load(f)
         
+        verdicts.clear()
         print("[ML] Model loaded successfully")
     except Exception as e:
         print(f"[ML] Failed to load model: {e}")
         model = None
 
 
+def _load_network():
+    if ML_BACKEND == "numpy":
+        if os.path.exists(ML_WEIGHTS_PATH):
+            from ml.numpy_lstm import NumpyLSTM
+            print(f"[ML] Using NumPy backend ({ML_WEIGHTS_PATH})")
+            return NumpyLSTM.load(ML_WEIGHTS_PATH)
+        print(f"[ML] {ML_WEIGHTS_PATH} not found, falling back to Keras backend")
+
+    import tensorflow as tf  # Deferred: only the Keras backend needs TensorFlow
+    return tf.keras.models.load_model(os.path.join(BASE_DIR, "threat_lstm.keras"))
+
+
+def warm_up(batch_sizes=(1, 64)):
+    """Load everything and run dummy predictions so the first real request is not slow"""
+    global ml_state
+    ml_state = "loading"
+    started = time.time()
+    load_model()
+    if model is None or protocol_encoder is None:
+        ml_state = "failed"
+        return False
+
+    # Distinct packet sizes so no dummy is answered from the verdict cache
+    dummy = ("0.0.0.0", "0.0.0.0", 80, protocol_encoder.classes_[0])
+    for n in batch_sizes:
+        predict_payloads([dummy + (60 + k,) for k in range(n)])
+    if sequences is not None:
+        sequences.forget(dummy[0])
+    verdicts.clear()
+    ml_state = "ready"
+    _ready.set()
+    print(f"[ML] Warm-up finished in {time.time() - started:.2f}s")
+    return True
+
+
+def start_background_load():
+    """Kick off warm_up() in a daemon thread; returns immediately"""
+    global ml_state
+    if ml_state in ("loading", "ready"):
+        return
+    ml_state = "loading"
+    threading.Thread(target=warm_up, name="ml-warmup", daemon=True).start()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def get_sequences():
+    """Per-source-IP sequence store for the configured ML_SEQUENCE_MODE (None for "repeat")"""
+    global sequences, ML_SEQUENCE_MODE
+    if sequences is None and ML_SEQUENCE_MODE != "repeat":
+        from ml.sequences import SequenceStore
+        units = None
+        if ML_SEQUENCE_MODE == "stateful":
+            if hasattr(model, "lstm_step"):
+                units = model.units
+            else:
+                print("[ML] Stateful sequences need ML_BACKEND=numpy, using window mode")
+                ML_SEQUENCE_MODE = "window"
+        sequences = SequenceStore(features=len(scaler.data_min_), units=units)
+    return sequences
+
+
 def ip_to_int(ip):
     parts = ip.split(".")
     return sum([int(parts[i]) << (8 * (3 - i)) for i in range(4)])
 
 
-def predict_payload(src_ip, dst_ip, port, protocol, packet_size):
+def _tables():
+    """
+    Preprocessing compiled from the fitted encoders: a protocol -> index table and
+    MinMaxScaler's transform as one multiply-add (X * scale_ + min_, the same
+    arithmetic sklearn does, minus its per-call validation). Rebuilt if any
+    encoder object is replaced.
+    """
+    global _fused
+    if _fused is None or _fused[0] is not scaler or _fused[1] is not protocol_encoder or _fused[2] is not label_encoder:
+        _fused = (scaler, protocol_encoder, label_encoder,
+                  {p: i for i, p in enumerate(protocol_encoder.classes_)},
+                  np.asarray(scaler.scale_, dtype=np.float64),
+                  np.asarray(scaler.min_, dtype=np.float64),
+                  scaler.feature_range if getattr(scaler, "clip", False) else None,
+                  np.asarray(label_encoder.classes_))
+    return _fused[3:]
+
+
+def _cache_key(row):
+    key = tuple(row)
+    try:
+        hash(key)
+    except TypeError:
+        return None  # e.g. a list or dict smuggled into a field: never cached
+    return key
+
+
+def predict_payloads(rows):
+    """Predict a batch of (src_ip, dst_ip, port, protocol, packet_size) rows in one model call"""
+    results = [("normal", 0.0)] * len(rows)
     try:
         load_model()  # Load on first use
-        
-        if model is None or protocol_encoder is None:
-            return "normal", 0.0
-        
-        protocol_encoded = protocol_encoder.transform([protocol])[0]
-        x = np.array([[ip_to_int(src_ip), ip_to_int(dst_ip), port, protocol_encoded, packet_size]])
-        x_scaled = scaler.transform(x)
-        x_seq = np.repeat(x_scaled, 10, axis=0).reshape(1, 10, 5)
-        prediction = model.predict(x_seq, verbose=0)
-        label_idx = prediction.argmax()
-        if label_idx >= len(label_encoder.classes_):
-            label_idx = 0
-        label = label_encoder.inverse_transform([label_idx])[0]
-        confidence = float(prediction.max())
-        return label, confidence
+
+        if model is None or protocol_encoder is None or not rows:
+            return results
+
+        started = time.perf_counter()
+        protocol_index, scale, offset, clip_range, classes = _tables()
+        features = []
+        valid = []
+        for i, (src_ip, dst_ip, port, protocol, packet_size) in enumerate(rows):
+            # Skip malformed rows so one bad entry does not fail the whole batch
+            try:
+                features.append([ip_to_int(src_ip), ip_to_int(dst_ip), float(port),
+                                 protocol_index[protocol], float(packet_size)])
+                valid.append(i)
+            except Exception as e:
+                print(f"[ML] Skipping row {i}: {e}")
+
+        if not valid:
+            return results
+
+        x_scaled = np.array(features) * scale + offset
+        if clip_range is not None:
+            np.clip(x_scaled, clip_range[0], clip_range[1], out=x_scaled)
+        store = get_sequences()
+        sources = [rows[i][0] for i in valid]
+        # A verdict can be reused when the model input is the row repeated: always in
+        # "repeat" mode, and in "window" mode once the IP's whole window is this row.
+        # Stateful mode carries hidden state the row alone does not determine.
+        if store is None:
+            cacheable = [True] * len(valid)
+        elif ML_SEQUENCE_MODE == "stateful":
+            cacheable = [False] * len(valid)
+        else:
+            runs = []
+            x_windows = store.push(sources, x_scaled, runs)  # (N, 10, 5), each source's recent events
+            cacheable = [n >= store.length for n in runs]
+
+        keys = [None] * len(valid)
+        todo = []  # positions in valid that need the model
+        for j, i in enumerate(valid):
+            if cacheable[j] and ML_VERDICT_CACHE_SIZE > 0:
+                keys[j] = _cache_key(rows[i])
+                verdict = verdicts.get(keys[j]) if keys[j] is not None else None
+                if verdict is not None:
+                    results[i] = verdict
+                    continue
+            todo.append(j)
+        preprocessed = time.perf_counter()
+        DECISION_STAGE.observe(preprocessed - started, "ml_preprocess")
+
+        if not todo:
+            return results
+        if store is None:
+            x_seq = np.repeat(x_scaled[todo, np.newaxis, :], 10, axis=1)  # (N, 10, 5)
+        elif ML_SEQUENCE_MODE == "stateful":
+            x_seq = None  # The state update is the inference step
+        else:
+            x_seq = x_windows[todo]
+
+        if x_seq is None:
+            prediction = model.head(store.step(sources, x_scaled, model))
+        else:
+            prediction = model.predict(x_seq, verbose=0, batch_size=len(todo))
+        DECISION_STAGE.observe(time.perf_counter() - preprocessed, "ml_inference")
+        label_idx = prediction.argmax(axis=1)
+        label_idx[label_idx >= len(classes)] = 0
+        labels = classes[label_idx]
+        confidences = prediction.max(axis=1)
+        for j, label, conf in zip(todo, labels, confidences):
+            results[valid[j]] = verdict = (label, float(conf))
+            if keys[j] is not None:
+                verdicts.put(keys[j], verdict)
+        return results
     except Exception as e:
-        print(f"[ML] Prediction failed: {e}")
-        return "normal", 0.0
+        print(f"[ML] Batch prediction failed: {e}")
+        return results
+
+
+def predict_payload(src_ip, dst_ip, port, protocol, packet_size):
+    return predict_payloads([(src_ip, dst_ip, port, protocol, packet_size)])[0]
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# ---------------- CONFIG ----------------
+SEQUENCE_LENGTH = 10  # Must match sequence_length in ml/train.py
+ML_SEQUENCE_MAX_IPS = int(os.getenv("ML_SEQUENCE_MAX_IPS", 50000))
+ML_SEQUENCE_IDLE_TTL = float(os.getenv("ML_SEQUENCE_IDLE_TTL", 900))  # seconds
+
+
+class SequenceStore:
+    """
+    Per-source-IP history of scaled feature vectors for the LSTM.
+
+    All storage is preallocated: `windows` is a (max_ips, length, features) ring
+    buffer and each IP owns one slot, handed out LRU-first with idle eviction.
+    A new IP's window is backfilled with its first vector, so a first request
+    scores exactly like the old repeated-vector input; later requests see the
+    real last `length` events, oldest first, as ml/train.py builds X_seq.
+
+    With `units` set the store also keeps per-slot LSTM state (h, c) for the
+    incremental mode, which advances the network one step per event instead of
+    re-running the whole window.
+
+    `runs` counts how many of a slot's most recent vectors are identical; once it
+    reaches `length` the window is the vector repeated, so its verdict depends on
+    that vector alone and can be cached.
+    """
+
+    def __init__(self, features=5, length=SEQUENCE_LENGTH, max_ips=ML_SEQUENCE_MAX_IPS,
+                 idle_ttl=ML_SEQUENCE_IDLE_TTL, units=None):
+        self.length = length
+        self.max_ips = max(1, int(max_ips))
+        self.idle_ttl = idle_ttl
+        self.windows = np.zeros((self.max_ips, length, features), dtype=np.float32)
+        self.cursor = np.zeros(self.max_ips, dtype=np.int64)  # next write position per slot
+        self.runs = np.zeros(self.max_ips, dtype=np.int64)    # trailing identical vectors per slot
+        self.h = np.zeros((self.max_ips, units), dtype=np.float32) if units else None
+        self.c = np.zeros((self.max_ips, units), dtype=np.float32) if units else None
+        self.slots = OrderedDict()  # ip -> [slot, last_seen], least recently seen first
+        self.free = list(range(self.max_ips - 1, -1, -1))
+        self.lock = threading.Lock()
+        self.evicted = 0
+
+    def _evict(self, now):
+        # Oldest entries sit at the front, so eviction stops at the first live IP
+        while self.slots:
+            ip, (slot, last_seen) = next(iter(self.slots.items()))
+            if self.free and now - last_seen <= self.idle_ttl:
+                break
+            del self.slots[ip]
+            self.free.append(slot)
+            self.evicted += 1
+
+    def _slot(self, ip, now):
+        """Return (slot, is_new) for ip, claiming a fresh slot if needed"""
+        entry = self.slots.get(ip)
+        if entry is not None:
+            entry[1] = now
+            self.slots.move_to_end(ip)
+            return entry[0], False
+        self._evict(now)
+        slot = self.free.pop()
+        self.slots[ip] = [slot, now]
+        return slot, True
+
+    def push(self, keys, x, runs=None):
+        """
+        Append one scaled vector per key (in order; a key may repeat) and return
+        the (N, length, features) window each event sees, oldest step first.
+        If `runs` is a list it receives each event's identical-vector run length.
+        """
+        x = np.asarray(x, dtype=np.float32)
+        out = np.empty((len(keys), self.length, x.shape[1]), dtype=np.float32)
+        steps = np.arange(1, self.length + 1)
+        now = time.monotonic()
+        with self.lock:
+            for i, key in enumerate(keys):
+                slot, is_new = self._slot(key, now)
+                pos = self.cursor[slot]
+                if is_new:
+                    self.windows[slot] = x[i]
+                    self.runs[slot] = self.length
+                    pos = 0
+                elif (self.windows[slot, pos - 1] == x[i]).all():
+                    self.runs[slot] = min(self.runs[slot] + 1, self.length)
+                else:
+                    self.runs[slot] = 1
+                self.windows[slot, pos] = x[i]
+                self.cursor[slot] = (pos + 1) % self.length
+                out[i] = self.windows[slot, (pos + steps) % self.length]
+                if runs is not None:
+                    runs.append(int(self.runs[slot]))
+        return out
+
+    def step(self, keys, x, model):
+        """
+        Incremental mode: advance each key's LSTM state by one event with
+        model.lstm_step and return the (N, units) hidden states. Rows for distinct
+        IPs go through one vectorised step; repeats of an IP run in later waves so
+        its events are applied in order.
+        """
+        x = np.asarray(x, dtype=np.float32)
+        out = np.empty((len(keys), self.h.shape[1]), dtype=np.float32)
+        now = time.monotonic()
+        with self.lock:
+            slots = np.empty(len(keys), dtype=np.int64)
+            waves = np.empty(len(keys), dtype=np.int64)
+            seen = {}
+            for i, key in enumerate(keys):
+                slot, is_new = self._slot(key, now)
+                if is_new:
+                    self.h[slot] = 0.0
+                    self.c[slot] = 0.0
+                slots[i] = slot
+                waves[i] = seen.get(slot, 0)
+                seen[slot] = waves[i] + 1
+
+            for wave in range(int(waves.max()) + 1 if len(keys) else 0):
+                rows = np.nonzero(waves == wave)[0]
+                s = slots[rows]
+                h, c = model.lstm_step(x[rows], self.h[s], self.c[s])
+                self.h[s] = h
+                self.c[s] = c
+                out[rows] = h
+        return out
+
+    def forget(self, ip):
+        with self.lock:
+            entry = self.slots.pop(ip, None)
+            if entry is not None:
+                self.free.append(entry[0])
+
+    def __len__(self):
+        return len(self.slots)
@@ -1,31 +1,300 @@
+import os
+import threading
 import time
-from collections import defaultdict
+from collections import OrderedDict, deque
 
-requests_log = defaultdict(list)
-path_log = defaultdict(list)
-same_path_hits_log = defaultdict(list)
+# ---------------- CONFIG ----------------
+RATE_LIMIT_RESOLUTION = float(os.getenv("RATE_LIMIT_RESOLUTION", 1))   # seconds per bucket
+RATE_LIMIT_HORIZON = int(os.getenv("RATE_LIMIT_HORIZON", 120))          # longest window kept, seconds
+RATE_LIMIT_MAX_IPS = int(os.getenv("RATE_LIMIT_MAX_IPS", 100000))       # hard cap on tracked IPs
+RATE_LIMIT_MAX_PATHS = int(os.getenv("RATE_LIMIT_MAX_PATHS", 256))      # per-IP cap on tracked paths
+RATE_LIMIT_IDLE_TTL = int(os.getenv("RATE_LIMIT_IDLE_TTL", 300))        # drop IPs idle this long
 
+# "local" keeps counters in process memory; "shared" shares them across the workers on
+# this host through shared_state.py; "redis" shares them across workers and pods
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "local").lower()
+RATE_LIMIT_REDIS_RETRY = float(os.getenv("RATE_LIMIT_REDIS_RETRY", 5))  # seconds before retrying Redis
+RATE_LIMIT_REDIS_TIMEOUT = float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT", 0.25))  # connect and per-call socket timeout
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+
+
+# ---------------- SLIDING COUNTER ----------------
+class SlidingCounter:
+    """
+    Time-bucketed counter. Only buckets that saw traffic are stored, so memory is
+    bounded by HORIZON / RESOLUTION per counter; add() is O(1) and expiry is amortized O(1).
+    """
+    __slots__ = ("buckets", "total")
+
+    def __init__(self):
+        self.buckets = deque()  # [bucket_index, count], oldest first
+        self.total = 0
+
+    def add(self, timestamp, n=1):
+        b = int(timestamp // RATE_LIMIT_RESOLUTION)
+        if self.buckets and self.buckets[-1][0] >= b:
+            # Same bucket, or a slightly out-of-order timestamp: fold into the newest bucket
+            self.buckets[-1][1] += n
+        else:
+            self.buckets.append([b, n])
+        self.total += n
+
+    def expire(self, now):
+        floor = int(now // RATE_LIMIT_RESOLUTION) - int(RATE_LIMIT_HORIZON / RATE_LIMIT_RESOLUTION)
+        while self.buckets and self.buckets[0][0] <= floor:
+            self.total -= self.buckets.popleft()[1]
+
+    def count(self, now, window):
+        self.expire(now)
+        if window >= RATE_LIMIT_HORIZON:
+            return self.total
+        start = int((now - window) // RATE_LIMIT_RESOLUTION)
+        hits = 0
+        for b, n in reversed(self.buckets):
+            if b < start:
+                break
+            hits += n
+        return hits
+
+
+class _IPState:
+    __slots__ = ("requests", "paths", "path_hits", "last_seen")
+
+    def __init__(self):
+        self.requests = SlidingCounter()
+        self.paths = OrderedDict()      # path -> last seen, most recent last
+        self.path_hits = OrderedDict()  # path -> SlidingCounter, most recent last
+        self.last_seen = 0.0
+
+
+# ---------------- IP TABLE ----------------
+class RateTracker:
+    """Per-IP counters with a hard cap on tracked IPs (LRU) and idle eviction"""
+
+    def __init__(self, max_ips=RATE_LIMIT_MAX_IPS, idle_ttl=RATE_LIMIT_IDLE_TTL):
+        self.max_ips = max_ips
+        self.idle_ttl = idle_ttl
+        self.ips = OrderedDict()  # ip -> _IPState, least recently seen first
+        self.lock = threading.Lock()
+        self.evicted = 0
+
+    def _touch(self, ip, timestamp):
+        state = self.ips.get(ip)
+        if state is None:
+            state = self.ips[ip] = _IPState()
+        else:
+            self.ips.move_to_end(ip)
+        state.last_seen = max(state.last_seen, timestamp)
+        self._evict(timestamp)
+        return state
+
+    def _evict(self, now):
+        # Oldest entries sit at the front, so eviction stops at the first live IP
+        while self.ips:
+            ip, state = next(iter(self.ips.items()))
+            if len(self.ips) <= self.max_ips and now - state.last_seen <= self.idle_ttl:
+                break
+            del self.ips[ip]
+            self.evicted += 1
+
+    def add_request(self, ip, timestamp):
+        with self.lock:
+            self._touch(ip, timestamp).requests.add(timestamp)
+
+    def count_requests(self, ip, window, now):
+        with self.lock:
+            state = self.ips.get(ip)
+            return state.requests.count(now, window) if state else 0
+
+    def add_path(self, ip, path, timestamp):
+        with self.lock:
+            paths = self._touch(ip, timestamp).paths
+            paths[path] = timestamp
+            paths.move_to_end(path)
+            if len(paths) > RATE_LIMIT_MAX_PATHS:
+                paths.popitem(last=False)
+
+    def count_unique_paths(self, ip, window, now):
+        with self.lock:
+            state = self.ips.get(ip)
+            if not state:
+                return 0
+            unique = 0
+            for ts in reversed(state.paths.values()):
+                if now - ts > window:
+                    break
+                unique += 1
+            return unique
+
+    def add_same_path(self, ip, path, timestamp):
+        with self.lock:
+            hits = self._touch(ip, timestamp).path_hits
+            counter = hits.get(path)
+            if counter is None:
+                counter = hits[path] = SlidingCounter()
+                if len(hits) > RATE_LIMIT_MAX_PATHS:
+                    hits.popitem(last=False)
+            else:
+                hits.move_to_end(path)
+            counter.add(timestamp)
+
+    def count_same_path_hits(self, ip, path, window, now):
+        with self.lock:
+            state = self.ips.get(ip)
+            counter = state.path_hits.get(path) if state else None
+            return counter.count(now, window) if counter else 0
+
+    def tracked_ips(self):
+        return len(self.ips)
+
+
+_tracker = RateTracker()
+
+
+# ---------------- PUBLIC API ----------------
 def add_request(ip, timestamp):
-    requests_log[ip].append(timestamp)
+    _tracker.add_request(ip, timestamp)
 
-def count_requests(ip, window=60):
-    now = time.time()
-    requests_log[ip] = [t for t in requests_log[ip] if now - t <= window]
-    return len(requests_log[ip])
+def count_requests(ip, window=60, now=None):
+    return _tracker.count_requests(ip, window, now or time.time())
 
-def count_unique_paths(ip, window=30):
-    now = time.time()
-    path_log[ip] = [t for t in path_log[ip] if now - t[1] <= window]
-    return len(set([p[0] for p in path_log[ip]]))
+def count_unique_paths(ip, window=30, now=None):
+    return _tracker.count_unique_paths(ip, window, now or time.time())
 
 def add_path(ip, path, timestamp):
-    path_log[ip].append((path, timestamp))
+    _tracker.add_path(ip, path, timestamp)
 
-def count_same_path_hits(ip, path, window=60):
-    now = time.time()
-    same_path_hits_log[ip] = [t for t in same_path_hits_log[ip] if now - t[1] <= window]
-    hits = len([1 for p, ts in same_path_hits_log[ip] if p == path])
-    return hits
+def count_same_path_hits(ip, path, window=60, now=None):
+    return _tracker.count_same_path_hits(ip, path, window, now or time.time())
 
 def add_same_path(ip, path, timestamp):
-    same_path_hits_log[ip].append((path, timestamp))
+    _tracker.add_same_path(ip, path, timestamp)
+
+
+# ---------------- DISTRIBUTED (REDIS) MODE ----------------
+# One hash per IP (field = bucket index, value = hits). The script increments the
+# current bucket, drops buckets older than the horizon and returns the windowed sum,
+# so every decision costs a single round trip.
+SLIDING_WINDOW_LUA = """
+local key = KEYS[1]
+local bucket = tonumber(ARGV[1])
+local start = tonumber(ARGV[2])
+local stale = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+local incr = tonumber(ARGV[5])
+if incr > 0 then
+    redis.call('HINCRBY', key, bucket, incr)
+    redis.call('EXPIRE', key, ttl)
+end
+local fields = redis.call('HGETALL', key)
+local total = 0
+for i = 1, #fields, 2 do
+    local b = tonumber(fields[i])
+    if b <= stale then
+        redis.call('HDEL', key, fields[i])
+    elseif b >= start then
+        total = total + tonumber(fields[i + 1])
+    end
+end
+return total
+"""
+
+_redis = None
+_redis_script = None  # Set only while Redis answers; the hot path reads nothing else
+_reconnector = None
+_reconnect_lock = threading.Lock()
+
+
+def configure_redis(client):
+    """Use an existing client (e.g. fakeredis in tests); None resets to RATE_LIMIT_BACKEND"""
+    global _redis, _redis_script
+    _redis = client
+    _redis_script = client.register_script(SLIDING_WINDOW_LUA) if client is not None else None
+
+
+def _reconnect(delay):
+    """Background thread: ping Redis until it answers, then re-enable the shared window"""
+    global _redis, _reconnector
+    time.sleep(delay)
+    while True:
+        client = _redis
+        if client is None and RATE_LIMIT_BACKEND == "redis":
+            import redis
+            client = _redis = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True,
+                                          socket_connect_timeout=RATE_LIMIT_REDIS_TIMEOUT,
+                                          socket_timeout=RATE_LIMIT_REDIS_TIMEOUT)
+        if client is None:
+            break  # Reconfigured to local counters meanwhile
+        try:
+            client.ping()
+            configure_redis(client)
+            print("[RateLimiter] Using Redis sliding window")
+            break
+        except Exception as e:
+            print(f"[RateLimiter] Redis not available, using local counters: {e}")
+            time.sleep(RATE_LIMIT_REDIS_RETRY)
+    with _reconnect_lock:
+        _reconnector = None
+
+
+def _start_reconnect(delay=0.0):
+    global _reconnector
+    with _reconnect_lock:
+        if _reconnector is None:
+            _reconnector = threading.Thread(target=_reconnect, args=(delay,), name="rate-limiter-redis", daemon=True)
+            _reconnector.start()
+
+
+def _mark_redis_down():
+    """Serve from local counters and retry Redis in the background after RATE_LIMIT_REDIS_RETRY"""
+    global _redis_script
+    _redis_script = None
+    _start_reconnect(RATE_LIMIT_REDIS_RETRY)
+
+
+# ---------------- SHARED-MEMORY MODE ----------------
+_shared = None
+_shared_checked = False
+
+
+def _get_shared():
+    global _shared, _shared_checked
+    if not _shared_checked:
+        _shared_checked = True
+        try:
+            from shared_state import SharedCounters
+            _shared = SharedCounters(buckets=int(RATE_LIMIT_HORIZON / RATE_LIMIT_RESOLUTION),
+                                     resolution=RATE_LIMIT_RESOLUTION, idle_ttl=RATE_LIMIT_IDLE_TTL)
+            print(f"[RateLimiter] Using shared-memory counters at {_shared.path}")
+        except Exception as e:
+            print(f"[RateLimiter] Shared-memory counters unavailable, using local counters: {e}")
+    return _shared
+
+
+def hit_and_count(ip, timestamp, window=60):
+    """
+    Record one request and return the number of requests from ip in the last
+    `window` seconds. Uses the shared Redis window or the host's shared-memory
+    counters when configured and reachable, otherwise the local tracker.
+    """
+    script = _redis_script
+    if script is not None:
+        try:
+            slots = int(RATE_LIMIT_HORIZON / RATE_LIMIT_RESOLUTION)
+            bucket = int(timestamp // RATE_LIMIT_RESOLUTION)
+            start = int((timestamp - window) // RATE_LIMIT_RESOLUTION)
+            return int(script(keys=[f"rl:{{{ip}}}"], args=[bucket, start, bucket - slots, RATE_LIMIT_HORIZON, 1]))
+        except Exception as e:
+            print(f"[RateLimiter] Redis error, falling back to local counters: {e}")
+            _mark_redis_down()
+    elif RATE_LIMIT_BACKEND == "redis" and _reconnector is None:
+        _start_reconnect()  # First use; never connects on the request path
+
+    if RATE_LIMIT_BACKEND == "shared":
+        counters = _get_shared()
+        if counters is not None:
+            return counters.hit_and_count(ip, timestamp, window)
+
+    add_request(ip, timestamp)
+    return count_requests(ip, window, now=timestamp)
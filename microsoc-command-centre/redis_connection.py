@@ -1,49 +1,33 @@
 # redis_connection.py
-import redis
-import json
-import time
+import block_store
 
-REDIS_HOST = "localhost"
-REDIS_PORT = 6379
 BLOCK_EXPIRY = 3600  # 1 hour
 
-redis_client = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
+# Shares block_store's connection (None when Redis is unavailable)
+redis_client = block_store.r
 
 
 # ---------------- BLOCK IP ----------------
 def block_ip(ip, reason="Manual/Auto Block", source="Engine", severity="HIGH"):
-    record = {
-        "ip": ip,
-        "reason": reason,
-        "source": source,
-        "severity": severity,
-        "timestamp": int(time.time())
-    }
-    redis_client.set(f"block:{ip}", json.dumps(record), ex=BLOCK_EXPIRY)
+    block_store.block_ip(ip, reason, source, severity, ttl=BLOCK_EXPIRY)
 
 
 # ---------------- CHECK BLOCKED ----------------
 def is_redis_blocked(ip):
-    return redis_client.exists(f"block:{ip}")
+    return block_store.is_blocked(ip)
 
 
 # ---------------- MANUAL UNBLOCK ----------------
 def unblock_ip(ip):
-    return redis_client.delete(f"block:{ip}")
+    return block_store.unblock_ip(ip)
 
 
 # ---------------- LIST ALL BLOCKED ----------------
-def get_all_blocked():
-    keys = redis_client.keys("block:*")
+def get_all_blocked(page_size=1000):
     result = []
-    for key in keys:
-        data = redis_client.get(key)
-        ttl = redis_client.ttl(key)
-        try:
-            record = json.loads(data)
-            record["ip"] = key.replace("block:", "")
-            record["ttl_remaining"] = ttl
-            result.append(record)
-        except:
-            pass
-    return result
+    cursor = 0
+    while True:
+        cursor, records = block_store.list_blocked(cursor, page_size)
+        result.extend(records)
+        if not cursor:
+            return result
@@ -0,0 +1,327 @@
+# replay.py - offline backtest: re-classify recorded traffic and diff against the recorded outcome
+#
+#   python replay.py decisions.log                              # JSONL in, decisions to replay_out.jsonl
+#   python replay.py access.csv --workers 8 --out new.jsonl --summary diff.json
+#   python replay.py export.jsonl --no-blocks --limit 1000000
+#
+# Input is JSONL (decisions.log, mongoexport of attack_logs) or CSV with a header row
+# using the decision API field names: ip, path, method, user_agent, payload, timestamp,
+# plus the recorded status / attack_type when available.
+#
+# Events are sharded by source IP across worker processes, so every IP's history
+# (rate windows, blocks, ML sequences) stays in one process and in input order.
+# Workers run with Redis, MongoDB, threat-intel lookups and log shipping disabled:
+# nothing a replay does reaches production state. Rate windows follow the recorded
+# timestamps; block TTLs run on wall-clock time, so within a fast replay a block
+# lasts for the rest of the run (use --no-blocks to judge every event on its own).
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+
+_IP_FIELD = re.compile(r'"ip"\s*:\s*"([^"]*)"')
+BLOCK_DURATION = int(os.getenv("BLOCK_DURATION", "600"))
+
+
+# ---------------- WORKER ----------------
+def _isolate(no_blocks):
+    """Cut every external side effect before the engine modules are imported"""
+    os.environ["SPOOL_ENABLED"] = "0"
+    os.environ["RATE_LIMIT_BACKEND"] = "local"
+    os.environ["STATE_BACKEND"] = "memory"  # Never touch the host's shared block table
+
+    def _offline(*args, **kwargs):
+        raise ConnectionError("disabled during replay")
+
+    import redis
+    import pymongo
+    redis.Redis = _offline
+    pymongo.MongoClient = _offline
+
+    import block_store
+    import log_shipper
+    import threat_intel
+    log_shipper.enqueue = lambda log: True
+    threat_intel._client, threat_intel._client_checked = None, True
+    if no_blocks:
+        block_store.block_ip = lambda *args, **kwargs: None
+
+
+def _timestamp(value):
+    if isinstance(value, dict):  # mongoexport {"$date": ...} / {"$numberLong": ...}
+        value = value.get("$numberLong") or value.get("$date")
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _event(raw):
+    """Raw JSONL line or CSV dict -> request dict"""
+    event = json.loads(raw) if isinstance(raw, str) else dict(raw)
+    if not isinstance(event, dict):
+        raise ValueError(f"expected a JSON object, got {type(event).__name__}")
+    payload = event.get("payload")
+    if isinstance(payload, str) and payload[:1] in "{[":
+        try:
+            event["payload"] = json.loads(payload)
+        except ValueError:
+            pass
+    event["timestamp"] = _timestamp(event.get("timestamp"))
+    return event
+
+
+def _result(seq, event, decision):
+    recorded = event.get("status")
+    recorded_attack = event.get("attack_type") or "normal"
+    return {
+        "seq": seq,
+        "ip": event.get("ip"),
+        "path": decision.get("path"),
+        "method": decision.get("method"),
+        "status": decision.get("status"),
+        "attack_type": decision.get("attack_type"),
+        "severity": decision.get("severity"),
+        "reason": decision.get("reason"),
+        "recorded_status": recorded,
+        "recorded_attack_type": recorded_attack if recorded else None,
+        "changed": bool(recorded) and (recorded != decision.get("status") or recorded_attack != decision.get("attack_type")),
+    }
+
+
+def _finalize(block_store, event, decision):
+    """What app.finalize_decision does after classifying: a BLOCK verdict blocks the IP"""
+    ip = event.get("ip")
+    if decision.get("status") == "BLOCK" and not block_store.is_blocked(ip):
+        block_store.block_ip(ip, decision.get("reason") or "Decision API block", "DecisionAPI",
+                             decision.get("severity") or "HIGH", ttl=BLOCK_DURATION)
+
+
+def _classify_one(classifier, block_store, seq, event):
+    try:
+        decision = classifier.classify_request(event.get("ip"), event.get("path"), event.get("method", "GET"),
+                                               event.get("user_agent"), event.get("payload"), event.get("timestamp"))
+        _finalize(block_store, event, decision)
+        return _result(seq, event, decision)
+    except Exception as e:
+        return {"seq": seq, "error": f"classify failed: {type(e).__name__}: {e}"}
+
+
+def _classify_chunk(classifier, block_store, seqs, events):
+    """classify_batch, then block like /security/decisions; per event if one of them breaks the batch"""
+    try:
+        decisions = classifier.classify_batch(events)
+    except Exception:
+        return [_classify_one(classifier, block_store, seq, e) for seq, e in zip(seqs, events)]
+    results = []
+    for seq, event, decision in zip(seqs, events, decisions):
+        try:
+            _finalize(block_store, event, decision)
+            results.append(_result(seq, event, decision))
+        except Exception as e:
+            results.append({"seq": seq, "error": f"classify failed: {type(e).__name__}: {e}"})
+    return results
+
+
+def _worker(index, inbox, outbox, exact, no_blocks):
+    try:
+        _isolate(no_blocks)
+        import block_store
+        import classifier
+
+        while True:
+            chunk = inbox.get()
+            if chunk is None:
+                break
+            results, seqs, events = [], [], []
+            for seq, raw in chunk:
+                try:
+                    events.append(_event(raw))
+                    seqs.append(seq)
+                except Exception as e:
+                    results.append({"seq": seq, "error": f"unparseable: {e}"})
+            if exact:
+                # Like /security/decision: a block is applied before the IP's next event
+                results.extend(_classify_one(classifier, block_store, seq, e) for seq, e in zip(seqs, events))
+            elif events:
+                results.extend(_classify_chunk(classifier, block_store, seqs, events))
+            outbox.put(results)
+    finally:
+        outbox.put(index)  # Done marker, also sent when the worker fails
+
+
+# ---------------- INPUT ----------------
+def read_events(path):
+    """Yield (ip, raw) where raw is a JSONL line or a CSV row dict"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield row.get("ip") or "", row
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    # Only the ip is needed to route the event; workers do the full parse
+                    match = _IP_FIELD.search(line)
+                    yield (match.group(1) if match else ""), line
+
+
+# ---------------- SUMMARY ----------------
+class Summary:
+    def __init__(self):
+        self.events = 0
+        self.errors = 0
+        self.skipped = 0  # Events never classified because their worker died
+        self.changed = 0
+        self.transitions = Counter()  # (recorded_status, new_status)
+        self.attack_changes = Counter()  # (recorded_attack_type, new_attack_type) where they differ
+        self.statuses = Counter()
+
+    def add(self, result):
+        self.events += 1
+        if "error" in result:
+            self.errors += 1
+            return
+        self.statuses[result["status"]] += 1
+        if result["recorded_status"] is None:
+            return
+        self.transitions[(result["recorded_status"], result["status"])] += 1
+        if result["changed"]:
+            self.changed += 1
+        if result["recorded_attack_type"] != result["attack_type"]:
+            self.attack_changes[(result["recorded_attack_type"], result["attack_type"])] += 1
+
+    def to_dict(self, elapsed):
+        return {
+            "events": self.events,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "changed": self.changed,
+            "events_per_second": round(self.events / elapsed, 1) if elapsed else None,
+            "statuses": dict(self.statuses),
+            "transitions": {f"{a} -> {b}": n for (a, b), n in self.transitions.most_common()},
+            "attack_type_changes": {f"{a} -> {b}": n for (a, b), n in self.attack_changes.most_common()},
+        }
+
+    def print(self, elapsed):
+        compared = sum(self.transitions.values())
+        print(f"[Replay] {self.events} events in {elapsed:.1f}s ({self.events / max(elapsed, 1e-9):.0f}/s), "
+              f"{self.errors} failed" + (f", {self.skipped} skipped (worker died)" if self.skipped else ""))
+        print(f"[Replay] New decisions: {dict(self.statuses)}")
+        if not compared:
+            print("[Replay] No recorded outcomes to compare against")
+            return
+        print(f"[Replay] {self.changed}/{compared} decisions differ from the recording ({self.changed / compared:.2%})")
+        print(f"{'recorded -> new':<28}{'events':>10}")
+        for (a, b), n in self.transitions.most_common():
+            print(f"{a + ' -> ' + b:<28}{n:>10}{'' if a == b else '  *'}")
+        if self.attack_changes:
+            print(f"{'attack type changes':<48}{'events':>10}")
+            for (a, b), n in self.attack_changes.most_common(20):
+                print(f"{a + ' -> ' + str(b):<48}{n:>10}")
+
+
+# ---------------- DRIVER ----------------
+def replay(path, out_path, workers, chunk_size, exact=False, no_blocks=False, limit=None):
+    ctx = mp.get_context("spawn")  # Fresh interpreters: nothing from this process leaks into workers
+    inboxes = [ctx.Queue(maxsize=4) for _ in range(workers)]
+    outbox = ctx.Queue(maxsize=workers * 4)
+    procs = [ctx.Process(target=_worker, args=(i, inbox, outbox, exact, no_blocks), daemon=True)
+             for i, inbox in enumerate(inboxes)]
+    for p in procs:
+        p.start()
+
+    summary = Summary()
+
+    def drain():
+        # Results arrive per chunk, grouped by shard; seq restores the global order if needed
+        finished, suspects = set(), set()
+        with open(out_path, "w", encoding="utf-8") as out:
+            while len(finished) < workers:
+                try:
+                    results = outbox.get(timeout=1)
+                except queue.Empty:
+                    # A worker killed outright never sends its done marker. Give its last
+                    # results one more timeout to arrive, then stop waiting for it.
+                    dead = {i for i, p in enumerate(procs) if p.exitcode is not None and i not in finished}
+                    for i in dead & suspects:
+                        print(f"[Replay] Worker {i} exited with code {procs[i].exitcode} without finishing")
+                        finished.add(i)
+                    suspects = dead
+                    continue
+                if isinstance(results, int):
+                    finished.add(results)
+                    continue
+                for result in results:
+                    summary.add(result)
+                    out.write(json.dumps(result) + "\n")
+
+    writer = threading.Thread(target=drain, name="replay-writer")
+    writer.start()
+
+    def send(shard, item):
+        """Put on a shard's inbox without blocking forever on a dead worker"""
+        while procs[shard].exitcode is None:
+            try:
+                inboxes[shard].put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    started = time.perf_counter()
+    buffers = [[] for _ in range(workers)]
+    read = 0
+    for seq, (ip, raw) in enumerate(read_events(path)):
+        if limit is not None and seq >= limit:
+            break
+        read += 1
+        shard = zlib.crc32(ip.encode()) % workers
+        buffers[shard].append((seq, raw))
+        if len(buffers[shard]) >= chunk_size:
+            send(shard, buffers[shard])
+            buffers[shard] = []
+    for shard in range(workers):
+        if buffers[shard]:
+            send(shard, buffers[shard])
+        send(shard, None)
+
+    writer.join()
+    for p in procs:
+        p.join()
+    summary.skipped = read - summary.events
+    return summary, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded traffic through the classifier offline")
+    parser.add_argument("input", help="JSONL (decisions.log, mongoexport) or .csv with a header row")
+    parser.add_argument("--out", default="replay_out.jsonl", help="Decisions, one JSON object per event")
+    parser.add_argument("--summary", help="Also write the diff summary as JSON")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Events per worker task")
+    parser.add_argument("--exact", action="store_true",
+                        help="classify_request per event instead of classify_batch per chunk, like "
+                             "/security/decision (slower; a BLOCK then applies to the same IP's next event "
+                             "instead of from the next chunk on)")
+    parser.add_argument("--no-blocks", action="store_true", help="Do not carry blocks between events")
+    parser.add_argument("--limit", type=int, help="Stop after this many events")
+    args = parser.parse_args()
+
+    summary, elapsed = replay(args.input, args.out, max(1, args.workers), max(1, args.chunk_size),
+                              exact=args.exact, no_blocks=args.no_blocks, limit=args.limit)
+    summary.print(elapsed)
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summary.to_dict(elapsed), f, indent=2)
+    print(f"[Replay] Decisions written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# rule_engine.py - single-pass signature matching from a reloadable rule pack
+import json
+import os
+import re
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RULES_PATH = os.getenv("RULES_PATH", os.path.join(BASE_DIR, "rules", "default.json"))
+RULES_RELOAD_INTERVAL = float(os.getenv("RULES_RELOAD_INTERVAL", 2))  # seconds between mtime checks
+
+FIELDS = ("payload", "path", "ua")
+KINDS = ("regex", "substring", "path_prefix")
+REQUIRED = ("status", "attack_type", "severity", "reason", "suggestion")  # read by the classifier on every hit
+
+
+def _check_rule(rule):
+    """Reject a rule the decision path could not use; raises ValueError"""
+    rid = rule.get("id")
+    for key in REQUIRED:
+        if not isinstance(rule.get(key), str):
+            raise ValueError(f"Rule {rid} needs a string {key!r}")
+    try:
+        rule["reason"].format(path="/")
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError(f"Rule {rid} reason may only use the {{path}} placeholder: {e!r}")
+    if not isinstance(rule.get("fields"), list):
+        raise ValueError(f"Rule {rid} needs a list of fields")
+    if rule.get("kind", "regex") == "regex":
+        try:
+            compiled = re.compile(rule["pattern"])
+        except (KeyError, TypeError, re.error) as e:
+            raise ValueError(f"Rule {rid} has a bad pattern: {e!r}")
+        if compiled.groupindex:
+            # Matches are attributed to rules through the r<index> group around each pattern
+            raise ValueError(f"Rule {rid} pattern must not define named groups")
+    elif not isinstance(rule.get("values"), list) or not all(isinstance(v, str) for v in rule["values"]):
+        raise ValueError(f"Rule {rid} needs a list of string values")
+
+
+def _trie_pattern(words):
+    """
+    Build a prefix-trie shaped regex from literal words. CPython's re tries each
+    alternative in turn, so a flat "a|b|c" slows down as signatures are added;
+    sharing prefixes keeps the cost per position roughly constant.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch != ""]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class RulePack:
+    """
+    Compiled rule pack. Rules are listed in priority order. Text is lowercased once
+    and each field is scanned once:
+      - `substring` rules share one trie regex per field (literal -> rule lookup)
+      - `regex` rules share one alternation per field, written for lowercase input
+      - `path_prefix` rules are dict lookups at each path segment boundary
+    Matches are taken at every start position (zero-width lookahead), so a
+    lower-priority hit can never hide a higher-priority one.
+    """
+
+    def __init__(self, data):
+        self.version = str(data.get("version", "unversioned"))
+        self.rules = data["rules"]
+        self.literals = {f: {} for f in FIELDS}   # field -> literal -> rule index
+        self.prefixes = {}                         # path prefix -> rule index
+        regex_parts = {f: [] for f in FIELDS}
+
+        for idx, rule in enumerate(self.rules):
+            kind = rule.get("kind", "regex")
+            if kind not in KINDS:
+                raise ValueError(f"Rule {rule.get('id')} has unknown kind {kind!r}")
+            _check_rule(rule)
+            for field in rule["fields"]:
+                if field not in FIELDS:
+                    raise ValueError(f"Rule {rule.get('id')} has unknown field {field!r}")
+                if kind == "substring":
+                    for value in rule["values"]:
+                        self.literals[field].setdefault(value.lower(), idx)
+                elif kind == "path_prefix":
+                    for value in rule["values"]:
+                        self.prefixes.setdefault(value.lower().rstrip("/"), idx)
+                else:
+                    regex_parts[field].append(f"(?=(?P<r{idx}>{rule['pattern']}))")
+
+        self.literal_matchers = {
+            f: re.compile(f"(?=({_trie_pattern(words)}))") for f, words in self.literals.items() if words
+        }
+        self.regex_matchers = {f: re.compile("|".join(parts)) for f, parts in regex_parts.items() if parts}
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _scan(self, field, text, best):
+        literal_matcher = self.literal_matchers.get(field)
+        if literal_matcher is not None:
+            words = self.literals[field]
+            for m in literal_matcher.finditer(text):
+                hit = m.group(1)
+                # The trie returns the longest literal at this position; shorter ones are its prefixes
+                for k in range(1, len(hit) + 1):
+                    idx = words.get(hit[:k])
+                    if idx is not None and (best is None or idx < best):
+                        best = idx
+                if best == 0:
+                    return best
+
+        regex_matcher = self.regex_matchers.get(field)
+        if regex_matcher is not None:
+            for m in regex_matcher.finditer(text):
+                idx = int(m.lastgroup[1:])
+                if best is None or idx < best:
+                    best = idx
+                    if best == 0:
+                        return best
+
+        if field == "path" and self.prefixes:
+            for pos in [i for i, ch in enumerate(text) if ch in "/?#" and i > 0] + [len(text)]:
+                idx = self.prefixes.get(text[:pos])
+                if idx is not None and (best is None or idx < best):
+                    best = idx
+        return best
+
+    def match(self, fields):
+        """Return the highest-priority rule matching any of the given field texts, or None"""
+        best = None
+        for field, text in fields.items():
+            if text:
+                best = self._scan(field, text.lower(), best)
+                if best == 0:
+                    break
+        return self.rules[best] if best is not None else None
+
+
+class RuleEngine:
+    """Holds the active RulePack and swaps in a new one when the file changes on disk"""
+
+    def __init__(self, path=RULES_PATH, reload_interval=RULES_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        self.pack = None
+        self.reload()
+
+    def reload(self):
+        """Load the pack from disk; a broken file keeps the previous pack active"""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+                pack = RulePack.load(self.path)
+            except Exception as e:
+                print(f"[Rules] Failed to load {self.path}: {e}")
+                return False
+            self.pack, self._mtime = pack, mtime
+            print(f"[Rules] Loaded rule pack {pack.version} ({len(pack.rules)} rules)")
+            return True
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.reload_interval
+        try:
+            changed = os.path.getmtime(self.path) != self._mtime
+        except OSError:
+            return
+        if changed:
+            self.reload()
+
+    def match(self, payload=None, path="", ua=""):
+        self._maybe_reload()
+        if self.pack is None:
+            return None
+        return self.pack.match({"payload": str(payload) if payload else "", "path": path, "ua": ua})
+
+
+_engine = None
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = RuleEngine()
+    return _engine
@@ -0,0 +1,320 @@
+# shared_state.py - host-local state shared by every worker process, without Redis
+#
+# Fixed-size open-addressing hash tables in mmap'd files (under /dev/shm by default, so
+# they live in RAM). Every read-modify-write runs under an fcntl lock on the table file
+# plus a thread lock, so updates are atomic across all `uvicorn --workers N` processes
+# on the box. Entries carry an expiry and are reclaimed by a background sweep in small
+# chunks, so no request ever waits on a full-table scan; tables are sized up front and
+# never grow.
+import fcntl
+import os
+import struct
+import tempfile
+import threading
+import time
+import weakref
+import zlib
+from contextlib import contextmanager
+from itertools import compress
+from operator import eq
+
+# ---------------- CONFIG ----------------
+_DEFAULT_DIR = "/dev/shm/microsoc" if os.path.isdir("/dev/shm") else os.path.join(tempfile.gettempdir(), "microsoc")
+SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR", _DEFAULT_DIR)
+SHARED_BLOCK_SLOTS = int(os.getenv("SHARED_BLOCK_SLOTS", 131072))
+SHARED_RATE_SLOTS = int(os.getenv("SHARED_RATE_SLOTS", 65536))
+SHARED_SWEEP_INTERVAL = float(os.getenv("SHARED_SWEEP_INTERVAL", 5))  # seconds between expiry sweeps, 0 = off
+SHARED_SWEEP_CHUNK = int(os.getenv("SHARED_SWEEP_CHUNK", 4096))       # slots scanned per lock hold
+
+MAGIC = b"MSOCTBL2"
+HEADER = struct.Struct("<8sIIQQ")  # magic, record size, slots, used (live + deleted), live
+ENTRY = struct.Struct("<B47sd")    # state, key, expires_at; table-specific payload follows
+EMPTY, LIVE, DELETED = 0, 1, 2
+MAX_LOAD = 0.75                    # compact when live + deleted slots pass this share
+TOMBSTONE_LOAD = 0.125             # the sweep compacts once deleted slots pass this share
+KEEP_LOAD = 0.5                    # a compaction keeps at most this share, latest expiry first
+
+
+class SharedTable:
+    """
+    Linear-probing hash table over an mmap'd file. Keys are up to 47 bytes (any IPv4
+    or IPv6 text form fits). Expired entries count as free slots; a background sweep
+    deletes them and compacts the table in place once deleted slots pile up. If an
+    insert still finds the table full the entries closest to expiry are evicted, so
+    an insert never fails.
+    """
+
+    def __init__(self, path, slots, payload_format):
+        self.path = path
+        self.slots = slots
+        self.payload = struct.Struct("<" + payload_format)
+        self.record_size = ENTRY.size + self.payload.size
+        self._scan = struct.Struct(f"<B47sd{self.payload.size}x")  # one whole slot, payload skipped
+        self.size = HEADER.size + slots * self.record_size
+        self.lock = threading.Lock()
+        self.evicted = 0
+        self._open()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.pid = os.getpid()
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self.fd, HEADER.size, 0)
+            if len(header) < HEADER.size or HEADER.unpack(header)[:3] != (MAGIC, self.record_size, self.slots):
+                # New file, or one laid out for a different configuration: start empty
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, self.size)
+                os.pwrite(self.fd, HEADER.pack(MAGIC, self.record_size, self.slots, 0, 0), 0)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        import mmap
+        self.mm = mmap.mmap(self.fd, self.size)
+        if SHARED_SWEEP_INTERVAL > 0:
+            threading.Thread(target=_sweep_forever, args=(weakref.ref(self), self.pid),
+                             name="shared-state-sweep", daemon=True).start()
+
+    @contextmanager
+    def locked(self):
+        with self.lock:
+            if os.getpid() != self.pid:
+                # Inherited across fork: the flock would be shared with the parent
+                self.mm.close()
+                os.close(self.fd)
+                self._open()
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    # ---------------- SLOTS (call with the lock held) ----------------
+    def _offset(self, i):
+        return HEADER.size + i * self.record_size
+
+    def _used(self):
+        return struct.unpack_from("<Q", self.mm, 16)[0]
+
+    def _set_used(self, n):
+        struct.pack_into("<Q", self.mm, 16, n)
+
+    def _live_count(self):
+        return struct.unpack_from("<Q", self.mm, 24)[0]
+
+    def _set_live_count(self, n):
+        struct.pack_into("<Q", self.mm, 24, n)
+
+    def _find(self, key, now):
+        """(slot holding key or -1, first reusable slot or -1)"""
+        home = zlib.crc32(key) % self.slots
+        free = -1
+        for probe in range(self.slots):
+            i = (home + probe) % self.slots
+            state, slot_key, expires_at = ENTRY.unpack_from(self.mm, self._offset(i))
+            if state == EMPTY:
+                return -1, free if free >= 0 else i
+            live = state == LIVE and expires_at > now
+            if live and slot_key.rstrip(b"\0") == key:
+                return i, i
+            if not live and free < 0:
+                free = i
+        return -1, free
+
+    def _compact(self, now):
+        """Rewrite the table keeping only live entries, evicting the soonest to expire past KEEP_LOAD"""
+        live = []
+        for i in self._scan_live(now):
+            off = self._offset(i)
+            live.append((ENTRY.unpack_from(self.mm, off)[2], bytes(self.mm[off:off + self.record_size])))
+        keep = int(self.slots * KEEP_LOAD)
+        if len(live) > keep:
+            live.sort(key=lambda entry: entry[0], reverse=True)
+            self.evicted += len(live) - keep
+            del live[keep:]
+        self.mm[HEADER.size:self.size] = bytes(self.size - HEADER.size)
+        for _, record in live:
+            key = ENTRY.unpack_from(record)[1].rstrip(b"\0")
+            _, slot = self._find(key, now)
+            off = self._offset(slot)
+            self.mm[off:off + self.record_size] = record
+        self._set_used(len(live))
+        self._set_live_count(len(live))
+
+    def _slot_for(self, key, now):
+        """Slot for key, claiming one if absent; returns (slot, existed)"""
+        found, free = self._find(key, now)
+        if found >= 0:
+            return found, True
+        if free < 0 or self._used() >= self.slots * MAX_LOAD:
+            self._compact(now)
+            _, free = self._find(key, now)
+        state = ENTRY.unpack_from(self.mm, self._offset(free))[0]
+        if state == EMPTY:
+            self._set_used(self._used() + 1)
+        return free, False
+
+    def _stamp(self, slot, key, expires_at):
+        """Mark slot live for key; a slot that was not live before adds to the live count"""
+        off = self._offset(slot)
+        if self.mm[off] != LIVE:
+            self._set_live_count(self._live_count() + 1)
+        ENTRY.pack_into(self.mm, off, LIVE, key, expires_at)
+
+    def _write(self, slot, key, expires_at, payload):
+        self._stamp(slot, key, expires_at)
+        self.payload.pack_into(self.mm, self._offset(slot) + ENTRY.size, *payload)
+
+    def _read(self, slot):
+        off = self._offset(slot)
+        _, key, expires_at = ENTRY.unpack_from(self.mm, off)
+        return key.rstrip(b"\0").decode(), expires_at, self.payload.unpack_from(self.mm, off + ENTRY.size)
+
+    def _delete(self, slot):
+        off = self._offset(slot)
+        if self.mm[off] == LIVE:
+            self._set_live_count(self._live_count() - 1)
+        self.mm[off] = DELETED
+
+    def _scan_live(self, now, start=0, stop=None, expired=False):
+        """Slots in [start, stop) holding an unexpired entry (or, with expired=True, an expired one)"""
+        stop = self.slots if stop is None else stop
+        with memoryview(self.mm) as view, view[self._offset(start):self._offset(stop)] as region:
+            return [i for i, (state, _, expires_at) in enumerate(self._scan.iter_unpack(region), start)
+                    if state == LIVE and (expires_at <= now) == expired]
+
+    # ---------------- MAINTENANCE ----------------
+    def sweep(self, now=None, chunk=SHARED_SWEEP_CHUNK):
+        """
+        Delete expired entries, holding the lock for `chunk` slots at a time, then
+        compact if deleted slots have piled up. Runs in the background every
+        SHARED_SWEEP_INTERVAL seconds; returns the number of entries reclaimed.
+        """
+        now = time.time() if now is None else now
+        reclaimed = 0
+        for start in range(0, self.slots, chunk):
+            with self.locked():
+                for i in self._scan_live(now, start, min(start + chunk, self.slots), expired=True):
+                    self._delete(i)
+                    reclaimed += 1
+        with self.locked():
+            if self._used() - self._live_count() >= self.slots * TOMBSTONE_LOAD:
+                self._compact(now)
+        return reclaimed
+
+    def count(self, now=None):
+        """Live entries from the header counter; expired ones count until the next sweep"""
+        with self.locked():
+            return self._live_count()
+
+
+def _sweep_forever(table_ref, pid):
+    while True:
+        time.sleep(SHARED_SWEEP_INTERVAL)
+        table = table_ref()
+        if table is None or table.pid != pid:
+            return  # Table gone, or reopened after a fork with its own sweeper
+        try:
+            table.sweep()
+        except Exception as e:
+            print(f"[SharedState] Sweep of {table.path} failed: {e}")
+        del table
+
+
+def _text(value, size):
+    return str(value or "").encode("utf-8")[:size]
+
+
+class SharedBlocks(SharedTable):
+    """Drop-in for block_store's in-process store: ip -> (expires_at, record)"""
+    shared = True
+
+    def __init__(self, path=None, slots=SHARED_BLOCK_SLOTS):
+        # created_at, reason, source, severity
+        super().__init__(path or os.path.join(SHARED_STATE_DIR, "blocks.tbl"), slots, "d96s32s16s")
+
+    def _record(self, ip, payload):
+        created, reason, source, severity = payload
+        return {
+            "ip": ip,
+            "reason": reason.rstrip(b"\0").decode("utf-8", "replace"),
+            "source": source.rstrip(b"\0").decode("utf-8", "replace"),
+            "severity": severity.rstrip(b"\0").decode("utf-8", "replace"),
+            "timestamp": int(created),
+        }
+
+    def set(self, ip, expires_at, record):
+        key = ip.encode()
+        payload = (record.get("timestamp", time.time()), _text(record.get("reason"), 96),
+                   _text(record.get("source"), 32), _text(record.get("severity"), 16))
+        with self.locked():
+            slot, _ = self._slot_for(key, time.time())
+            self._write(slot, key, expires_at, payload)
+
+    def pop(self, ip):
+        with self.locked():
+            slot, _ = self._find(ip.encode(), time.time())
+            if slot < 0:
+                return False
+            self._delete(slot)
+            return True
+
+    def get(self, ip, now):
+        with self.locked():
+            slot, _ = self._find(ip.encode(), now)
+            if slot < 0:
+                return None
+            _, expires_at, payload = self._read(slot)
+        return expires_at, self._record(ip, payload)
+
+    def active(self, now):
+        with self.locked():
+            rows = [self._read(i) for i in self._scan_live(now)]
+        return [(ip, expires_at, self._record(ip, payload)) for ip, expires_at, payload in rows]
+
+
+class SharedCounters(SharedTable):
+    """
+    Per-IP sliding-window request counters: a ring of `buckets` cells, each holding
+    (bucket index, hits). A cell whose stamp is not the current bucket is stale and
+    restarts at zero, so nothing ever needs sweeping.
+    """
+
+    def __init__(self, path=None, slots=SHARED_RATE_SLOTS, buckets=120, resolution=1.0, idle_ttl=300):
+        self.buckets = buckets
+        self.resolution = resolution
+        self.idle_ttl = idle_ttl
+        super().__init__(path or os.path.join(SHARED_STATE_DIR, f"rate_{buckets}x{resolution:g}.tbl"),
+                         slots, f"{buckets}q{buckets}I")
+        self._blank = self.payload.pack(*([-1] * buckets + [0] * buckets))
+
+    def hit_and_count(self, ip, timestamp, window, n=1):
+        """Add n hits at timestamp and return hits in the last `window` seconds, atomically"""
+        key = ip.encode()
+        bucket = int(timestamp // self.resolution)
+        first = max(int((timestamp - window) // self.resolution), bucket - self.buckets + 1)
+        now = time.time()
+        with self.locked():
+            slot, existed = self._slot_for(key, now)
+            off = self._offset(slot)
+            self._stamp(slot, key, now + self.idle_ttl)
+            off += ENTRY.size
+            if not existed:
+                self.mm[off:off + self.payload.size] = self._blank
+            # Zero-copy views onto this slot's ring
+            with memoryview(self.mm) as view, view[off:off + 8 * self.buckets].cast("q") as stamps, \
+                    view[off + 8 * self.buckets:off + self.payload.size].cast("I") as counts:
+                cell = bucket % self.buckets
+                if stamps[cell] != bucket:
+                    stamps[cell], counts[cell] = bucket, 0
+                counts[cell] += n
+                # The window is a contiguous run of the ring (two runs when it wraps); a
+                # cell counts only if its stamp is the bucket expected at that position
+                total = 0
+                b = first
+                while b <= bucket:
+                    i = b % self.buckets
+                    j = min(self.buckets, i + bucket - b + 1)
+                    total += sum(compress(counts[i:j], map(eq, stamps[i:j], range(b, b + j - i))))
+                    b += j - i
+        return total
@@ -0,0 +1,263 @@
+# spool.py - durable on-disk log spool (write-ahead, at-least-once)
+#
+# Records are appended to size-rotated segment files as
+#   [u32 length][u32 crc32][json bytes]
+# and read back through mmap. A checkpoint file stores the consumer position
+# (segment, offset); segments fully behind it are deleted. A crash between
+# delivery and commit() replays the batch, so delivery is at-least-once.
+#
+# A spool directory belongs to one process, held with an exclusive flock. Workers
+# sharing a base directory each claim a worker-N slot (claim()), and the slots of
+# workers that are gone are drained into a live one (adopt_orphans()).
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+HEADER = struct.Struct("<II")
+SEGMENT_SUFFIX = ".seg"
+CHECKPOINT_FILE = "checkpoint.json"
+LOCK_FILE = "lock"
+SLOT_PREFIX = "worker-"
+
+
+class Spool:
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024, max_bytes=1024 * 1024 * 1024,
+                 fsync_interval=1.0, fsync_bytes=1024 * 1024):
+        """Raises BlockingIOError when another process owns the directory"""
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self.fsync_bytes = fsync_bytes
+        self.lock = threading.Lock()
+        self.stats = {"appended": 0, "corrupt": 0, "dropped_segments": 0, "adopted": 0}
+        os.makedirs(directory, exist_ok=True)
+        self.owner = open(os.path.join(directory, LOCK_FILE), "a")
+        try:
+            fcntl.flock(self.owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.owner.close()
+            raise
+
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+        self.position = self._load_checkpoint()
+        segments = self._segments()
+        if segments and self.position[0] < segments[0]:
+            self.position = (segments[0], 0)
+        # Always write into a fresh segment: a torn tail from a crash stays in a sealed one
+        self.active = (segments[-1] + 1) if segments else max(self.position[0], 1)
+        self.writer = open(self._path(self.active), "ab")
+        self.sizes = {seg: os.path.getsize(self._path(seg)) for seg in segments}
+        self.sizes[self.active] = 0
+
+    # ---------------- FILES ----------------
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:020d}{SEGMENT_SUFFIX}")
+
+    def _segments(self):
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(SEGMENT_SUFFIX))
+
+    def _load_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_FILE)) as f:
+                data = json.load(f)
+            return int(data["segment"]), int(data["offset"])
+        except (OSError, ValueError, KeyError):
+            return 0, 0
+
+    def _save_checkpoint(self):
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"segment": self.position[0], "offset": self.position[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _sync(self):
+        self.writer.flush()
+        os.fsync(self.writer.fileno())
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def _rotate(self):
+        self._sync()  # A sealed segment is never written again: make it durable now
+        self.writer.close()
+        self.active += 1
+        self.writer = open(self._path(self.active), "ab")
+        self.sizes[self.active] = 0
+
+    def _enforce_cap(self):
+        """Keep disk usage bounded: drop the oldest sealed segment when over max_bytes"""
+        while sum(self.sizes.values()) > self.max_bytes and len(self.sizes) > 1:
+            oldest = min(self.sizes)
+            os.remove(self._path(oldest))
+            del self.sizes[oldest]
+            self.stats["dropped_segments"] += 1
+            if self.position[0] <= oldest:
+                self.position = (min(self.sizes), 0)
+                self._save_checkpoint()
+            print(f"[Spool] Over {self.max_bytes} bytes, dropped segment {oldest}")
+
+    # ---------------- WRITE ----------------
+    def append_many(self, records):
+        """
+        Records reach the OS page cache before this returns, so a process crash
+        loses nothing. They reach the disk within fsync_interval seconds or
+        fsync_bytes, whichever comes first (and whenever a segment is sealed), so a
+        power loss can lose at most that unsynced tail. commit() syncs before it
+        writes the checkpoint, which therefore never points past unsynced data.
+        """
+        with self.lock:
+            for record in records:
+                data = json.dumps(record).encode("utf-8")
+                frame = HEADER.pack(len(data), zlib.crc32(data)) + data
+                self.writer.write(frame)
+                self.sizes[self.active] += len(frame)
+                self.unsynced += len(frame)
+                self.stats["appended"] += 1
+                if self.sizes[self.active] >= self.segment_bytes:
+                    self._rotate()
+            self.writer.flush()
+            if self.unsynced >= self.fsync_bytes or time.monotonic() - self.synced_at >= self.fsync_interval:
+                self._sync()
+            self._enforce_cap()
+
+    def append(self, record):
+        self.append_many([record])
+
+    def sync(self):
+        """fsync the active segment if it holds data older than fsync_interval (call periodically)"""
+        with self.lock:
+            if self.unsynced and time.monotonic() - self.synced_at >= self.fsync_interval:
+                self._sync()
+
+    # ---------------- READ ----------------
+    def _read_segment(self, segment, offset, limit, out):
+        """Parse up to `limit` records from one segment; returns the new offset"""
+        size = self.sizes.get(segment, 0)
+        if offset >= size:
+            return offset
+        with open(self._path(segment), "rb") as f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as m:
+            while len(out) < limit and offset + HEADER.size <= size:
+                length, crc = HEADER.unpack_from(m, offset)
+                end = offset + HEADER.size + length
+                if end > size:
+                    break  # Partially written record
+                data = m[offset + HEADER.size:end]
+                if zlib.crc32(data) != crc:
+                    self.stats["corrupt"] += 1
+                    print(f"[Spool] Corrupt record in segment {segment} at {offset}, skipping rest of segment")
+                    return size
+                out.append(json.loads(data))
+                offset = end
+        if offset < size and len(out) < limit and segment != self.active:
+            # A sealed segment ending mid-record was torn by a crash; nothing more will arrive
+            self.stats["corrupt"] += 1
+            print(f"[Spool] Torn record at the end of segment {segment}, skipping it")
+            return size
+        return offset
+
+    def read(self, max_records):
+        """
+        Return (records, position) starting at the committed checkpoint. Nothing is
+        consumed until commit(position) is called with the returned position.
+        """
+        with self.lock:
+            self.writer.flush()
+            records = []
+            segment, offset = self.position
+            while len(records) < max_records:
+                if segment not in self.sizes:
+                    later = [s for s in self.sizes if s > segment]
+                    if not later:
+                        break
+                    segment, offset = min(later), 0
+                offset = self._read_segment(segment, offset, max_records, records)
+                if offset < self.sizes[segment] or segment == self.active:
+                    break
+                segment, offset = segment + 1, 0
+            return records, (segment, offset)
+
+    def commit(self, position):
+        with self.lock:
+            if self.unsynced:
+                self._sync()
+            self.position = position
+            self._save_checkpoint()
+            for segment in [s for s in self.sizes if s < position[0] and s != self.active]:
+                os.remove(self._path(segment))
+                del self.sizes[segment]
+
+    def pending(self):
+        """Approximate bytes not yet committed"""
+        with self.lock:
+            segment, offset = self.position
+            return sum(size for s, size in self.sizes.items() if s >= segment) - offset
+
+    # ---------------- OWNERSHIP ----------------
+    def adopt_orphans(self, base, batch=1000):
+        """
+        Move the records left in spool directories under `base` that no live process
+        holds (slots of workers that exited, or a spool written directly into
+        `base`) into this one. Returns the number of records adopted.
+        """
+        adopted = 0
+        for directory in _slots(base) + ([base] if _has_segments(base) else []):
+            if os.path.abspath(directory) == os.path.abspath(self.directory):
+                continue
+            try:
+                orphan = Spool(directory, self.segment_bytes, self.max_bytes)
+            except OSError:
+                continue  # Owned by a live worker
+            try:
+                while True:
+                    records, position = orphan.read(batch)
+                    if not records:
+                        break
+                    self.append_many(records)
+                    with self.lock:
+                        self._sync()  # Durable here before the orphan lets go of it
+                    orphan.commit(position)
+                    adopted += len(records)
+            finally:
+                orphan.close()
+        if adopted:
+            self.stats["adopted"] += adopted
+            print(f"[Spool] Adopted {adopted} records from orphaned spools under {base}")
+        return adopted
+
+    def close(self):
+        with self.lock:
+            self._sync()
+            self.writer.close()
+            if self.sizes.get(self.active) == 0:
+                os.remove(self._path(self.active))
+            self.owner.close()  # Releases the flock
+
+
+def _has_segments(directory):
+    return any(name.endswith(SEGMENT_SUFFIX) for name in os.listdir(directory))
+
+
+def _slots(base):
+    return [os.path.join(base, name) for name in sorted(os.listdir(base))
+            if name.startswith(SLOT_PREFIX) and os.path.isdir(os.path.join(base, name))]
+
+
+def claim(base, **kwargs):
+    """Open the lowest worker-N slot under `base` that no live process owns"""
+    os.makedirs(base, exist_ok=True)
+    slot = 0
+    while True:
+        try:
+            return Spool(os.path.join(base, f"{SLOT_PREFIX}{slot}"), **kwargs)
+        except BlockingIOError:
+            slot += 1
@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip("httpx")  # TestClient transport
+from fastapi.testclient import TestClient
+
+import app
+import block_store
+
+TOKEN = {"X-Admin-Token": "test-token"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app, "ADMIN_TOKEN", "test-token")
+    return TestClient(app.app)
+
+
+@pytest.mark.parametrize("ips", ["1.2.3.4", [{"ip": "1.2.3.4"}], ["1.2.3.4", 5], {"ip": "1.2.3.4"}])
+def test_bulk_unblock_rejects_anything_but_a_list_of_strings(client, ips):
+    response = client.post("/admin/blocks/unblock", json={"ips": ips}, headers=TOKEN)
+    assert response.status_code == 400
+
+
+def test_bulk_unblock_removes_listed_blocks(client):
+    block_store.block_ip("192.0.2.77", "test", "test", ttl=600)
+    response = client.post("/admin/blocks/unblock", json={"ips": ["192.0.2.77", "192.0.2.78"]}, headers=TOKEN)
+    assert response.json() == {"requested": 2, "removed": 1}
+    assert not block_store.is_blocked("192.0.2.77")
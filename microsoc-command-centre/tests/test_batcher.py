@@ -0,0 +1,29 @@
+import threading
+
+from ml.batcher import InferenceBatcher
+
+
+def test_cancelled_futures_do_not_stall_the_rest_of_the_batch():
+    started, release = threading.Event(), threading.Event()
+
+    def predict(rows):
+        started.set()
+        release.wait(5)
+        return [("normal", float(i)) for i in range(len(rows))]
+
+    batcher = InferenceBatcher(predict_fn=predict, max_batch=8, max_wait_ms=50)
+    before = batcher.submit("1.1.1.1", "2.2.2.2", 80, "TCP", 100)
+    assert before.cancel()  # Cancelled while queued: skipped, never scored
+    running = batcher.submit("1.1.1.2", "2.2.2.2", 80, "TCP", 100)
+    other = batcher.submit("1.1.1.3", "2.2.2.2", 80, "TCP", 100)
+
+    assert started.wait(5)
+    assert not running.cancel()  # Already claimed by the batch
+    release.set()
+    assert running.result(5) == ("normal", 0.0)
+    assert other.result(5) == ("normal", 1.0)
+    assert batcher.batches == 1 and batcher.rows == 2
+
+    # The worker thread survived and keeps serving
+    assert batcher.submit("1.1.1.4", "2.2.2.2", 80, "TCP", 100).result(5) == ("normal", 0.0)
+    batcher.stop()
@@ -0,0 +1,51 @@
+import pytest
+
+import behavior
+from behavior import DistinctPaths, WindowedCountMin
+
+
+@pytest.fixture
+def detectors(monkeypatch):
+    monkeypatch.setattr(behavior, "distinct_paths", DistinctPaths(window=30))
+    monkeypatch.setattr(behavior, "failed_logins", WindowedCountMin(60, width=1024))
+    monkeypatch.setattr(behavior, "path_hits", WindowedCountMin(60, width=1024))
+
+
+def test_brute_force_fires_past_the_threshold_for_that_ip_only(detectors):
+    now = 1_700_000_000
+    failed = {"status": "FAILED"}
+    for i in range(behavior.FAILED_LOGIN_MAX):
+        assert behavior.observe("10.0.0.1", "/login", failed, now + i) is None
+    assert behavior.observe("10.0.0.2", "/login", failed, now) is None
+    assert behavior.observe("10.0.0.1", "/login", {"status": "ok"}, now + 10) is None
+    assert behavior.observe("10.0.0.1", "/login", failed, now + 10) == \
+        ("brute_force_login", behavior.FAILED_LOGIN_MAX + 1, behavior.FAILED_LOGIN_WINDOW)
+
+
+def test_directory_scan_counts_distinct_routes_not_query_strings(detectors):
+    now = 1_700_000_000
+    for i in range(100):
+        assert behavior.observe("10.0.0.1", f"/search?q={i}", None, now) is None
+    verdicts = [behavior.observe("10.0.0.2", f"/admin/{i}.php", None, now) for i in range(80)]
+    attack, count, window = next(v for v in verdicts if v)
+    assert attack == "directory_scan" and window == behavior.SCAN_WINDOW
+    assert count > behavior.SCAN_MAX_PATHS
+
+
+def test_count_min_slides_the_previous_window_out():
+    sketch = WindowedCountMin(60, width=1024)
+    start = 1_700_000_040  # a multiple of 60
+    assert sketch.add("k", start, n=10) == 10
+    assert sketch.add("k", start + 30, n=0) == 10  # same window
+    assert sketch.add("k", start + 90, n=0) == 5   # half of the previous window still overlaps
+    assert sketch.add("k", start + 180, n=0) == 0  # two windows on, nothing is left
+
+
+def test_distinct_table_is_capped_lru():
+    sketch = DistinctPaths(window=30, max_ips=2)
+    sketch.add("10.0.0.1", "/a", 0)
+    sketch.add("10.0.0.2", "/a", 0)
+    sketch.add("10.0.0.1", "/b", 0)
+    sketch.add("10.0.0.3", "/a", 0)
+    assert list(sketch.ips) == ["10.0.0.1", "10.0.0.3"]
+    assert sketch.evicted == 1
@@ -0,0 +1,77 @@
+import pytest
+
+import block_store
+
+
+@pytest.fixture
+def memory(monkeypatch):
+    monkeypatch.setattr(block_store, "REDIS_AVAILABLE", False)
+    monkeypatch.setattr(block_store, "_memory", block_store.MemoryBlocks())
+    monkeypatch.setattr(block_store, "_listings", block_store.OrderedDict())
+    monkeypatch.setattr(block_store, "_cache", block_store.OrderedDict())
+    return block_store._memory
+
+
+def test_local_listing_pages_one_snapshot_with_a_real_cursor(memory, monkeypatch):
+    ips = [f"192.0.2.{i}" for i in range(250)]
+    for ip in ips:
+        block_store.block_ip(ip, "test", "test", ttl=600)
+    scans = []
+    active = memory.active
+    monkeypatch.setattr(memory, "active", lambda now: scans.append(now) or active(now))
+
+    listed, cursor = [], 0
+    while True:
+        cursor, records = block_store.list_blocked(cursor, 100)
+        listed += [record["ip"] for record in records]
+        if not cursor:
+            break
+    assert listed == sorted(ips)
+    assert len(scans) == 1  # One scan and sort for the whole listing
+    assert not block_store._listings
+
+
+
+def test_near_cache_answers_repeats_until_an_unblock_event_drops_it(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    redis = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(block_store, "r", redis)
+    monkeypatch.setattr(block_store, "REDIS_AVAILABLE", True)
+    monkeypatch.setattr(block_store, "_memory", block_store.MemoryBlocks())
+    monkeypatch.setattr(block_store, "_cache", block_store.OrderedDict())
+    monkeypatch.setattr(block_store, "stats", {"hits": 0, "misses": 0, "invalidations": 0})
+    redis.set(f"{block_store.BLOCK_KEY_PREFIX}192.0.2.7", "{}", ex=600)  # blocked by another pod
+
+    assert block_store.is_blocked("192.0.2.7")
+    assert block_store.is_blocked("192.0.2.7")
+    assert block_store.stats == {"hits": 1, "misses": 1, "invalidations": 0}
+
+    # The other pod unblocks: Redis changes, this pod only learns through the event
+    redis.delete(f"{block_store.BLOCK_KEY_PREFIX}192.0.2.7")
+    assert block_store.is_blocked("192.0.2.7")  # still the cached answer
+    block_store._apply_events({"op": "unblock_many", "ips": ["192.0.2.7"]})
+    assert not block_store.is_blocked("192.0.2.7")
+    assert block_store.stats["misses"] == 2 and block_store.stats["invalidations"] == 1
+
+
+def test_blocked_range_decision_does_one_range_lookup(memory, monkeypatch):
+    import classifier
+    from cidr_blocks import CidrIndex
+
+    index = CidrIndex()
+    index.add("198.51.100.0/24", "feed entry", "Feed")
+    lookups = []
+
+    class Ranges:
+        def lookup(self, ip):
+            lookups.append(ip)
+            return index.lookup(ip)
+
+    monkeypatch.setattr(block_store, "get_ranges", Ranges)
+    monkeypatch.setattr(classifier, "push_log", lambda log: None)
+    decision = classifier._rule_check("198.51.100.9", "/", "GET", "curl", None, 1_700_000_000)
+
+    assert decision["attack_type"] == "blocked_range"
+    assert decision["reason"] == "IP in blocked range 198.51.100.0/24 (feed entry)"
+    assert lookups == ["198.51.100.9"]
+    assert block_store.check_block("192.0.2.1") == (False, None)
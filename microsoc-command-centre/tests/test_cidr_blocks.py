@@ -0,0 +1,32 @@
+import pytest
+
+from cidr_blocks import CidrIndex, parse_address, parse_cidr
+
+
+@pytest.fixture
+def index():
+    index = CidrIndex()
+    index.add_many(["10.0.0.0/8", "10.1.0.0/16", "2001:db8::/32"], reason="test", source="test")
+    return index
+
+
+def test_lookup_returns_the_most_specific_range(index):
+    assert index.lookup("10.1.2.3")[0] == "10.1.0.0/16"
+    assert index.lookup("10.2.0.1")[0] == "10.0.0.0/8"
+    assert index.lookup("::ffff:10.1.0.9")[0] == "10.1.0.0/16"
+    assert index.lookup("2001:db8::7")[0] == "2001:db8::/32"
+    assert index.lookup("192.0.2.1") is None
+
+
+@pytest.mark.parametrize("ip", [None, "", "not-an-ip", "10.0.0", "999.1.1.1", "2001:db8::zz", 123, 10.5, ["10.0.0.1"], {"ip": 1}])
+def test_lookup_of_malformed_or_non_string_input_is_a_miss(index, ip):
+    assert index.lookup(ip) is None
+
+
+def test_non_string_ranges_are_rejected_not_raised():
+    assert parse_address(123) is None
+    with pytest.raises(ValueError):
+        parse_cidr(123)
+    added, rejected = CidrIndex().add_many(["192.0.2.0/24", 7, None, "10.0.0.0/33"])
+    assert added == 1
+    assert rejected == [7, None, "10.0.0.0/33"]
@@ -0,0 +1,36 @@
+import pytest
+
+pytest.importorskip("httpx")  # TestClient transport
+from fastapi.testclient import TestClient
+
+import app
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(app.app)
+
+
+def test_bulk_decisions_come_back_in_input_order(client):
+    items = [
+        {"ip": "198.51.100.1", "path": "/products"},
+        {"path": "/no-ip"},
+        {"ip": "198.51.100.2", "path": "/search", "payload": {"q": "<script>alert(1)</script>"}},
+        {"ip": "198.51.100.3", "path": "/products", "timestamp": "abc"},
+        {"ip": "198.51.100.4", "path": "/products", "timestamp": 1_700_000_000},
+    ]
+    response = client.post("/security/decisions", json=items)
+    assert response.status_code == 200
+    body = response.json()
+
+    assert [row["ip"] for row in body] == ["198.51.100.1", "", "198.51.100.2", "198.51.100.3", "198.51.100.4"]
+    assert body[1]["status"] == "WARN" and body[1]["reason"] == "Missing ip"
+    assert (body[2]["status"], body[2]["attack_type"]) == ("WARN", "xss_attempt")
+    # An unparseable timestamp falls back to now instead of failing the batch
+    assert body[0]["status"] == body[3]["status"] == body[4]["status"] == "ALLOW"
+
+
+def test_bulk_decisions_over_the_cap_are_rejected(client, monkeypatch):
+    monkeypatch.setattr(app, "DECISIONS_MAX_ITEMS", 2)
+    response = client.post("/security/decisions", json=[{"ip": "198.51.100.9"}] * 3)
+    assert response.status_code == 413
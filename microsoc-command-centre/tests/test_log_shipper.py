@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+import log_shipper
+
+
+@pytest.fixture
+def shipper_env(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_shipper, "SPOOL_DIR", str(tmp_path / "spool"))
+    monkeypatch.setattr(log_shipper, "SPOOL_ENABLED", True)
+    monkeypatch.setattr(log_shipper, "REDIS_AVAILABLE", False)
+    monkeypatch.setattr(log_shipper, "MONGODB_AVAILABLE", False)
+    monkeypatch.setattr(log_shipper, "attack_logs", None)  # No Mongo sink unless a test adds one
+    monkeypatch.setattr(log_shipper, "_sink_retry_at", {"mongo": 0.0, "redis": float("inf")})
+    monkeypatch.setattr(log_shipper, "_spool", None)
+    monkeypatch.setattr(log_shipper, "_pending", {})
+    monkeypatch.setattr(log_shipper, "_overflow", log_shipper.deque())
+    yield
+    if log_shipper._spool is not None:
+        log_shipper._spool.close()
+
+
+def _log(ip, ts=600):
+    return {"ip": ip, "attack_type": "SQL_INJECTION", "timestamp": ts, "path": "/login"}
+
+
+def _recording_shipper(delivered):
+    shipper = log_shipper.LogShipper()
+
+    async def post(batch):
+        delivered.extend(batch)
+        return True
+
+    shipper._post_backend = post
+    return shipper
+
+
+def test_close_spools_buffered_logs_and_next_start_replays_them(shipper_env):
+    for ip in ("10.0.0.1", "10.0.0.2", "10.0.0.1"):
+        log_shipper.enqueue(_log(ip))
+    assert log_shipper.depth() == 2
+
+    asyncio.run(log_shipper.LogShipper().close())
+    assert log_shipper.depth() == 0
+
+    # A fresh process reopens the spool slot and delivers what the last one left
+    delivered = []
+
+    async def restart():
+        shipper = _recording_shipper(delivered)
+        await shipper.flush_once()
+        await shipper.close()
+
+    asyncio.run(restart())
+    hits = {agg["_id"]: agg["hits"] for agg in delivered}
+    assert hits == {"10.0.0.1_SQL_INJECTION_10": 2, "10.0.0.2_SQL_INJECTION_10": 1}
+
+
+def test_logs_spooled_while_mongo_is_down_reach_it_after_it_recovers(shipper_env, monkeypatch):
+    monkeypatch.setattr(log_shipper, "attack_logs", object())  # Configured, but down since boot
+    log_shipper._sink_retry_at["mongo"] = float("inf")
+    delivered, written = [], []
+
+    async def run():
+        shipper = _recording_shipper(delivered)
+
+        async def save(batch):
+            written.extend(batch)
+            return True
+
+        shipper._save_mongo = save
+        log_shipper.enqueue(_log("10.0.0.1"))
+        await shipper.flush_once()
+        assert [agg["_id"] for agg in delivered] == ["10.0.0.1_SQL_INJECTION_10"]
+        assert written == []  # Spooled for Mongo instead
+
+        # The next health check finds Mongo back and the spool replays its share
+        monkeypatch.setattr(log_shipper, "_ping_mongo", lambda: None)
+        log_shipper._sink_retry_at["mongo"] = 0.0
+        shipper.spool_retry_at = 0.0
+        await shipper.flush_once()
+        await shipper.close()
+
+    asyncio.run(run())
+    assert log_shipper.MONGODB_AVAILABLE
+    assert [agg["_id"] for agg in written] == ["10.0.0.1_SQL_INJECTION_10"]
+    assert len(delivered) == 1  # The backend is not sent the record twice
+
+
+def test_full_buffer_overflows_without_touching_the_spool(shipper_env, monkeypatch):
+    monkeypatch.setattr(log_shipper, "LOG_BUFFER_SIZE", 1)
+    monkeypatch.setattr(log_shipper, "LOG_OVERFLOW_SIZE", 1)
+    monkeypatch.setattr(log_shipper, "spill", lambda *a, **k: pytest.fail("enqueue touched the spool"))
+    dropped = log_shipper.stats["dropped"]
+
+    assert log_shipper.enqueue(_log("10.0.0.1"))
+    assert log_shipper.enqueue(_log("10.0.0.2"))
+    assert not log_shipper.enqueue(_log("10.0.0.3"))
+    assert log_shipper.depth() == 2
+    assert log_shipper.stats["dropped"] == dropped + 1
+
+
+def test_repeats_in_one_minute_coalesce_into_one_upsert(shipper_env, monkeypatch):
+    monkeypatch.setattr(log_shipper, "LOG_SAMPLE_PATHS", 2)
+    for ts, path in ((605, "/login"), (610, "/admin"), (601, "/login"), (615, "/wp-admin")):
+        log_shipper.enqueue(dict(_log("10.0.0.1", ts), path=path))
+    log_shipper.enqueue(_log("10.0.0.1", 660))  # next minute, next document
+
+    first, second = log_shipper._take(10)
+    assert (first["_id"], second["_id"]) == ("10.0.0.1_SQL_INJECTION_10", "10.0.0.1_SQL_INJECTION_11")
+    assert first["hits"] == 4 and second["hits"] == 1
+    assert (first["first_seen"], first["last_seen"]) == (601, 615)
+    assert first["log"]["path"] == "/wp-admin"  # the latest event wins
+    assert first["paths"] == ["/login", "/admin"]  # unique samples, capped
+
+    update = log_shipper.to_update(first)._doc
+    assert update["$inc"] == {"hits": 4}
+    assert update["$min"] == {"first_seen": 601} and update["$max"] == {"last_seen": 615}
@@ -0,0 +1,44 @@
+import metrics
+from metrics import Counter, Gauge, Histogram
+
+
+def test_render_writes_counters_gauges_and_cumulative_histograms(monkeypatch):
+    monkeypatch.setattr(metrics, "_registry", [])
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    decisions = Counter("decisions_total", "Decisions", ["status", "attack_type"])
+    depth = Gauge("queue_depth", "Queued items", lambda: 7)
+    Gauge("broken", "Fails at scrape", lambda: 1 / 0)
+    latency = Histogram("stage_seconds", "Stage time", ["stage"], buckets=(0.01, 0.1))
+
+    decisions.inc("BLOCK", 'say "hi"')
+    decisions.inc("ALLOW", "normal", n=3)
+    decisions.inc("BLOCK", 'say "hi"')
+    latency.observe(0.005, "rules")
+    latency.observe(0.05, "rules")
+    latency.observe(5, "rules")
+    assert depth.render()[-1] == "queue_depth 7.0"
+
+    assert metrics.render().splitlines() == [
+        "# HELP decisions_total Decisions",
+        "# TYPE decisions_total counter",
+        'decisions_total{status="ALLOW",attack_type="normal"} 3',
+        'decisions_total{status="BLOCK",attack_type="say \\"hi\\""} 2',
+        "# HELP queue_depth Queued items",
+        "# TYPE queue_depth gauge",
+        "queue_depth 7.0",
+        "# HELP stage_seconds Stage time",
+        "# TYPE stage_seconds histogram",
+        'stage_seconds_bucket{stage="rules",le="0.01"} 1',
+        'stage_seconds_bucket{stage="rules",le="0.1"} 2',
+        'stage_seconds_bucket{stage="rules",le="+Inf"} 3',
+        'stage_seconds_sum{stage="rules"} 5.055',
+        'stage_seconds_count{stage="rules"} 3',
+    ]
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, "_registry", [])
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    decisions = Counter("decisions_total", "Decisions", ["status"])
+    decisions.inc("BLOCK")
+    assert decisions.render() == ["# HELP decisions_total Decisions", "# TYPE decisions_total counter"]
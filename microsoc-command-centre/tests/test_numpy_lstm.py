@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+tf = pytest.importorskip("tensorflow")
+
+from ml.export_weights import DEFAULT_MODEL, export
+from ml.numpy_lstm import NumpyLSTM
+
+
+@pytest.fixture(scope="module")
+def model():
+    if not os.path.exists(DEFAULT_MODEL):
+        pytest.skip(f"{DEFAULT_MODEL} not found")
+    return tf.keras.models.load_model(DEFAULT_MODEL)
+
+
+def test_numpy_engine_matches_keras_on_exported_weights(model, tmp_path):
+    weights = str(tmp_path / "threat_lstm_weights.npz")
+    export(model, weights)
+    engine = NumpyLSTM.load(weights)
+
+    x = np.random.default_rng(0).random((256, 10, 5), dtype=np.float32)
+    expected = model.predict(x, verbose=0)
+    actual = engine.predict(x)
+
+    np.testing.assert_allclose(actual, expected, atol=1e-4)
+    assert (actual.argmax(axis=1) == expected.argmax(axis=1)).all()
+
+
+def test_stepwise_inference_matches_the_full_sequence(model, tmp_path):
+    weights = str(tmp_path / "threat_lstm_weights.npz")
+    export(model, weights)
+    engine = NumpyLSTM.load(weights)
+
+    x = np.random.default_rng(1).random((32, 10, 5), dtype=np.float32)
+    h = np.zeros((32, engine.units), dtype=np.float32)
+    c = np.zeros_like(h)
+    for t in range(x.shape[1]):
+        h, c = engine.lstm_step(x[:, t], h, c)
+    np.testing.assert_allclose(engine.head(h), model.predict(x, verbose=0), atol=1e-4)
@@ -0,0 +1,68 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+preprocessing = pytest.importorskip("sklearn.preprocessing")
+
+import ml.predict as predict
+
+
+class CountingModel:
+    def __init__(self):
+        self.rows = 0
+
+    def predict(self, x, verbose=0, batch_size=None):
+        self.rows += len(x)
+        out = np.zeros((len(x), 2))
+        out[:, 1] = 0.9  # every row is an attack
+        out[:, 0] = 0.1
+        return out
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    model = CountingModel()
+    features = np.array([[0, 0, 0, 0, 0], [2**32, 2**32, 65535, 1, 1500]], dtype=float)
+    monkeypatch.setattr(predict, "model", model)
+    monkeypatch.setattr(predict, "protocol_encoder", preprocessing.LabelEncoder().fit(["TCP", "UDP"]))
+    monkeypatch.setattr(predict, "label_encoder", preprocessing.LabelEncoder().fit(["ddos", "normal"]))
+    monkeypatch.setattr(predict, "scaler", preprocessing.MinMaxScaler().fit(features))
+    monkeypatch.setattr(predict, "sequences", None)
+    monkeypatch.setattr(predict, "_fused", None)
+    monkeypatch.setattr(predict, "verdicts", predict.VerdictCache(size=100))
+    return model
+
+
+def test_repeated_row_is_answered_from_the_cache(engine, monkeypatch):
+    monkeypatch.setattr(predict, "ML_SEQUENCE_MODE", "repeat")
+    row = ("10.0.0.1", "10.0.0.2", 80, "TCP", 60)
+
+    first = predict.predict_payloads([row, row])
+    assert engine.rows == 2  # nothing cached yet inside one batch
+    assert predict.predict_payloads([row]) == [first[0]] == [("normal", pytest.approx(0.9))]
+    assert engine.rows == 2
+    assert predict.verdicts.stats == {"hits": 1, "misses": 2}
+
+    # A different row still reaches the model
+    predict.predict_payloads([("10.0.0.1", "10.0.0.2", 80, "TCP", 61)])
+    assert engine.rows == 3
+
+
+def test_window_mode_reuses_a_verdict_only_while_the_window_is_that_row(engine, monkeypatch):
+    monkeypatch.setattr(predict, "ML_SEQUENCE_MODE", "window")
+    flood = ("10.0.0.1", "10.0.0.2", 80, "TCP", 60)
+    other = ("10.0.0.1", "10.0.0.2", 443, "TCP", 900)
+    length = predict.get_sequences().length
+
+    predict.predict_payloads([flood])  # a new IP's window starts as its first row
+    predict.predict_payloads([flood])
+    assert engine.rows == 1
+
+    predict.predict_payloads([other])
+    predict.predict_payloads([flood])  # cached, but the window now holds `other` too
+    assert engine.rows == 3
+    for _ in range(length - 2):
+        predict.predict_payloads([flood])
+    assert engine.rows == length + 1
+    predict.predict_payloads([flood])  # `other` has rolled out of the window
+    assert engine.rows == length + 1
+    assert predict.verdicts.stats["hits"] == 2
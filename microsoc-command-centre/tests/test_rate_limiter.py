@@ -0,0 +1,53 @@
+import rate_limiter
+from rate_limiter import RateTracker, SlidingCounter
+
+
+def test_counter_rolls_buckets_out_of_the_window_and_horizon(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "RATE_LIMIT_RESOLUTION", 1)
+    monkeypatch.setattr(rate_limiter, "RATE_LIMIT_HORIZON", 120)
+    now = 1_700_000_000
+    counter = SlidingCounter()
+    counter.add(now)
+    counter.add(now + 0.5)  # same one-second bucket
+    counter.add(now + 30)
+    assert [n for _, n in counter.buckets] == [2, 1]
+
+    assert counter.count(now + 30, window=60) == 3
+    assert counter.count(now + 65, window=60) == 1   # the first bucket slid out of the window
+    assert counter.count(now + 65, window=120) == 3  # but is still inside the horizon
+    assert counter.count(now + 125, window=120) == 1
+    assert len(counter.buckets) == 1                 # expired buckets are dropped, not skipped
+    assert counter.count(now + 200, window=60) == 0
+    assert counter.total == 0 and not counter.buckets
+
+
+def test_out_of_order_hits_fold_into_the_newest_bucket():
+    now = 1_700_000_000
+    counter = SlidingCounter()
+    counter.add(now + 10)
+    counter.add(now + 5)
+    assert len(counter.buckets) == 1
+    assert counter.count(now + 10, window=1) == 2
+
+
+def test_ip_table_evicts_the_least_recently_seen_ip_at_the_cap():
+    tracker = RateTracker(max_ips=2, idle_ttl=3600)
+    now = 1_700_000_000
+    tracker.add_request("10.0.0.1", now)
+    tracker.add_request("10.0.0.2", now + 1)
+    tracker.add_request("10.0.0.1", now + 2)  # refreshes .1, so .2 is now the oldest
+    tracker.add_request("10.0.0.3", now + 3)
+
+    assert list(tracker.ips) == ["10.0.0.1", "10.0.0.3"]
+    assert tracker.evicted == 1
+    assert tracker.count_requests("10.0.0.1", 60, now + 3) == 2
+    assert tracker.count_requests("10.0.0.2", 60, now + 3) == 0
+
+
+def test_ip_table_drops_idle_ips():
+    tracker = RateTracker(max_ips=100, idle_ttl=60)
+    now = 1_700_000_000
+    tracker.add_request("10.0.0.1", now)
+    tracker.add_request("10.0.0.2", now + 61)
+    assert list(tracker.ips) == ["10.0.0.2"]
+    assert tracker.evicted == 1
@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+import rate_limiter
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # fakeredis runs EVALSHA through lupa
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_tracker", rate_limiter.RateTracker())
+    monkeypatch.setattr(rate_limiter, "RATE_LIMIT_REDIS_RETRY", 0.05)
+    server = fakeredis.FakeServer()
+    rate_limiter.configure_redis(fakeredis.FakeRedis(server=server, decode_responses=True))
+    yield server
+    rate_limiter.configure_redis(None)
+
+
+def test_window_drops_hits_older_than_the_window(server):
+    now = 1_700_000_000
+    assert rate_limiter.hit_and_count("10.0.0.1", now, window=60) == 1
+    assert rate_limiter.hit_and_count("10.0.0.1", now + 30, window=60) == 2
+    assert rate_limiter.hit_and_count("10.0.0.1", now + 65, window=60) == 2  # first hit slid out
+    assert rate_limiter.hit_and_count("10.0.0.1", now + 200, window=60) == 1
+    # Buckets past the horizon are deleted, not just skipped
+    assert len(rate_limiter._redis.hgetall("rl:{10.0.0.1}")) == 1
+
+
+def test_concurrent_increments_are_all_counted(server):
+    now = 1_700_000_000
+
+    def hit():
+        for i in range(50):
+            rate_limiter.hit_and_count("10.0.0.2", now + i * 0.01, window=60)
+
+    threads = [threading.Thread(target=hit) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert rate_limiter.hit_and_count("10.0.0.2", now + 1, window=60) == 8 * 50 + 1
+    assert rate_limiter._tracker.tracked_ips() == 0
+
+
+def test_redis_errors_fall_back_to_local_counters_and_recover(server):
+    now = 1_700_000_000
+    server.connected = False
+    assert rate_limiter.hit_and_count("10.0.0.3", now, window=60) == 1
+    assert rate_limiter._redis_script is None
+    assert rate_limiter.hit_and_count("10.0.0.3", now + 1, window=60) == 2
+    assert rate_limiter._tracker.tracked_ips() == 1
+
+    # The background reconnect re-enables the shared window once Redis answers
+    server.connected = True
+    deadline = time.monotonic() + 2
+    while rate_limiter._redis_script is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert rate_limiter._redis_script is not None
+    assert rate_limiter.hit_and_count("10.0.0.3", now + 2, window=60) == 1
@@ -0,0 +1,22 @@
+import json
+
+import replay
+
+
+def test_output_keeps_each_ips_events_in_input_order(tmp_path):
+    events = [{"ip": f"10.0.0.{i % 5}", "path": f"/page/{i}", "method": "GET", "user_agent": "Mozilla/5.0",
+               "timestamp": 1_700_000_000 + i, "status": "ALLOW"} for i in range(40)]
+    source = tmp_path / "decisions.log"
+    source.write_text("".join(json.dumps(e) + "\n" for e in events) + "not json\n")
+    out = tmp_path / "out.jsonl"
+
+    summary, _ = replay.replay(str(source), str(out), workers=2, chunk_size=3, no_blocks=True)
+
+    results = [json.loads(line) for line in out.read_text().splitlines()]
+    assert sorted(r["seq"] for r in results) == list(range(41))  # every event exactly once
+    assert [r["seq"] for r in results if "error" in r] == [40]  # the bad line is reported, not fatal
+    for ip in {e["ip"] for e in events}:
+        seqs = [r["seq"] for r in results if r.get("ip") == ip]
+        assert seqs == sorted(seqs)  # an IP's history is replayed in order, in one shard
+        assert all(r["path"] == events[r["seq"]]["path"] for r in results if r.get("ip") == ip)
+    assert (summary.events, summary.errors, summary.skipped) == (41, 1, 0)
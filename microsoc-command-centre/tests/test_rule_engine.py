@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from rule_engine import RuleEngine, RulePack
+
+
+def _rule(**overrides):
+    rule = {
+        "id": "sensitive-paths",
+        "kind": "path_prefix",
+        "fields": ["path"],
+        "values": ["/admin"],
+        "status": "BLOCK",
+        "attack_type": "sensitive_path_access",
+        "severity": "HIGH",
+        "reason": "Accessed sensitive path {path}",
+        "suggestion": "Restrict access",
+    }
+    rule.update(overrides)
+    return rule
+
+
+def _write(path, *rules, version="1"):
+    path.write_text(json.dumps({"version": version, "rules": list(rules)}))
+
+
+def test_first_matching_rule_in_priority_order_wins():
+    pack = RulePack({"rules": [
+        _rule(id="tautology", kind="regex", fields=["payload"], pattern=r"'\s*or\s*(1)=1", attack_type="sqli"),
+        _rule(id="xss", kind="substring", fields=["payload"], values=["<script"], attack_type="xss"),
+        _rule(),
+    ]})
+    assert pack.match({"payload": "<SCRIPT>' or 1=1"})["attack_type"] == "sqli"
+    assert pack.match({"payload": "<script>"})["attack_type"] == "xss"
+    assert pack.match({"path": "/admin/users"})["attack_type"] == "sensitive_path_access"
+    assert pack.match({"path": "/administrator"}) is None
+
+
+@pytest.mark.parametrize("bad", [
+    _rule(reason="Blocked {ip}"),
+    _rule(reason="Blocked {0}"),
+    _rule(reason="Blocked {path"),
+    _rule(kind="regex", fields=["payload"], pattern="(?P<evil>x)"),
+    _rule(kind="regex", fields=["payload"], pattern="(unclosed"),
+    _rule(suggestion=None),
+    _rule(values="/admin"),
+])
+def test_reloading_a_bad_pack_keeps_the_previous_rules(tmp_path, bad):
+    path = tmp_path / "rules.json"
+    _write(path, _rule())
+    engine = RuleEngine(str(path), reload_interval=0)
+    assert engine.pack.version == "1"
+
+    _write(path, bad, version="2")
+    assert not engine.reload()
+    assert engine.pack.version == "1"
+    hit = engine.match(path="/admin")
+    assert hit["reason"].format(path="/admin") == "Accessed sensitive path /admin"
@@ -0,0 +1,40 @@
+import time
+
+from shared_state import SharedBlocks, SharedCounters
+
+
+def test_block_count_tracks_writes_deletes_and_sweeps(tmp_path):
+    blocks = SharedBlocks(str(tmp_path / "blocks.tbl"), slots=64)
+    now = time.time()
+    blocks.set("10.0.0.1", now + 60, {"reason": "a"})
+    blocks.set("10.0.0.1", now + 120, {"reason": "again"})  # overwrite, not a new entry
+    blocks.set("10.0.0.2", now + 60, {"reason": "b"})
+    blocks.set("10.0.0.3", now - 1, {"reason": "already expired"})
+    assert blocks.count() == 3
+    assert blocks.pop("10.0.0.2")
+    assert blocks.count() == 2
+
+    # Expired entries are counted until a sweep reclaims them
+    assert blocks.sweep(now) == 1
+    assert blocks.count() == 1
+    assert [ip for ip, _, _ in blocks.active(now)] == ["10.0.0.1"]
+
+
+def test_sweep_compacts_and_the_count_survives_reopening(tmp_path):
+    path = str(tmp_path / "blocks.tbl")
+    blocks = SharedBlocks(path, slots=64)
+    now = time.time()
+    for i in range(40):
+        blocks.set(f"10.0.0.{i}", now + (60 if i < 5 else 1), {})
+    blocks.sweep(now + 2)
+    assert blocks._used() == 5  # deleted slots cleared by the compaction
+    assert SharedBlocks(path, slots=64).count() == 5
+
+
+def test_counter_slots_count_as_live(tmp_path):
+    counters = SharedCounters(str(tmp_path / "rate.tbl"), slots=64, buckets=60)
+    now = time.time()
+    assert counters.hit_and_count("10.0.0.1", now, 60) == 1
+    assert counters.hit_and_count("10.0.0.1", now, 60) == 2
+    counters.hit_and_count("10.0.0.2", now, 60)
+    assert counters.count() == 2
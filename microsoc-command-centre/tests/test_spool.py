@@ -0,0 +1,48 @@
+import os
+
+from spool import HEADER, Spool
+
+
+def _segment(directory):
+    (name,) = [n for n in os.listdir(directory) if n.endswith(".seg")]
+    return os.path.join(directory, name)
+
+
+def test_replay_skips_a_torn_tail_and_continues_in_the_next_segment(tmp_path):
+    directory = str(tmp_path)
+    spool = Spool(directory)
+    spool.append_many([{"n": 1}, {"n": 2}, {"n": 3}])
+    spool.close()
+    path = _segment(directory)
+    os.truncate(path, os.path.getsize(path) - 3)  # crash mid-write of the third record
+
+    spool = Spool(directory)
+    spool.append({"n": 4})
+    records, position = spool.read(10)
+    assert records == [{"n": 1}, {"n": 2}, {"n": 4}]
+    assert spool.stats["corrupt"] == 1
+
+    spool.commit(position)
+    spool.close()
+    assert not os.path.exists(path)  # sealed segment behind the checkpoint is deleted
+    spool = Spool(directory)
+    assert spool.read(10)[0] == []
+    spool.close()
+
+
+def test_a_record_failing_its_crc_drops_the_rest_of_that_segment(tmp_path):
+    directory = str(tmp_path)
+    spool = Spool(directory)
+    spool.append_many([{"n": 1}, {"n": 2}, {"n": 3}])
+    spool.close()
+    path = _segment(directory)
+    first = HEADER.size + len(b'{"n": 1}')
+    with open(path, "r+b") as f:
+        f.seek(first + HEADER.size + 6)  # the digit inside the second record
+        f.write(b"9")
+
+    spool = Spool(directory)
+    records, _ = spool.read(10)
+    assert records == [{"n": 1}]
+    assert spool.stats["corrupt"] == 1
+    spool.close()
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+import threat_intel
+from threat_intel import ReputationProvider, StaticProvider, ThreatIntelClient
+
+
+class SlowProvider(StaticProvider):
+    """StaticProvider that holds every lookup until released"""
+
+    def __init__(self, scores):
+        super().__init__(scores)
+        self.release = asyncio.Event()
+
+    async def lookup(self, ip):
+        await self.release.wait()
+        return await super().lookup(ip)
+
+
+def test_concurrent_lookups_of_one_ip_share_a_provider_call():
+    async def run():
+        provider = SlowProvider({"203.0.113.9": 90})
+        intel = ThreatIntelClient(provider)
+        lookups = [asyncio.ensure_future(intel.lookup("203.0.113.9")) for _ in range(20)]
+        await asyncio.sleep(0.01)  # Let every lookup reach the provider
+        provider.release.set()
+        results = await asyncio.gather(*lookups)
+        return provider, intel, results
+
+    provider, intel, results = asyncio.run(run())
+    assert provider.calls == 1
+    assert intel.stats["coalesced"] == 19
+    assert all(result == {"is_malicious": True, "confidence": 90} for result in results)
+
+
+def test_verdicts_are_cached_until_their_ttl(monkeypatch):
+    now = [1_000.0]
+    monkeypatch.setattr(threat_intel.time, "time", lambda: now[0])
+    provider = StaticProvider({"203.0.113.9": 90})
+    intel = ThreatIntelClient(provider, ttl=3600, negative_ttl=60)
+
+    async def lookups(*ips):
+        return [await intel.lookup(ip) for ip in ips]
+
+    asyncio.run(lookups("203.0.113.9", "198.51.100.1"))  # malicious, and unknown
+    assert provider.calls == 2
+    now[0] += 59
+    asyncio.run(lookups("203.0.113.9", "198.51.100.1"))
+    assert provider.calls == 2  # Both cached, the unknown one too
+    assert intel.peek("198.51.100.1") is None and intel.peek("203.0.113.9")["is_malicious"]
+    now[0] += 2
+    asyncio.run(lookups("203.0.113.9", "198.51.100.1"))
+    assert provider.calls == 3  # Only the negative verdict expired
+
+
+def test_prefetch_past_max_pending_is_skipped():
+    async def run():
+        provider = SlowProvider({})
+        intel = ThreatIntelClient(provider, max_pending=3)
+        prefetch = asyncio.ensure_future(intel.prefetch([f"198.51.100.{i}" for i in range(5)]))
+        await asyncio.sleep(0.01)  # Let every lookup reach the provider
+        provider.release.set()
+        results = await prefetch
+        return provider, intel, results
+
+    provider, intel, results = asyncio.run(run())
+    assert provider.calls == 3
+    assert intel.stats["skipped"] == 2
+    assert len(results) == 5
+
+
+def test_a_provider_without_lookup_fails_when_instantiated():
+    class Incomplete(ReputationProvider):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -1,26 +1,227 @@
 # threat_intel.py
-import os, requests
+import asyncio
+import os, requests, time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
 from dotenv import load_dotenv
 load_dotenv()
 
 ABUSEIPDB_KEY = os.getenv("ABUSEIPDB_KEY", "")
+# Point at a local stub server in tests: THREAT_INTEL_URL=http://127.0.0.1:9000/api/v2/check
+ABUSEIPDB_URL = os.getenv("THREAT_INTEL_URL", "https://api.abuseipdb.com/api/v2/check")
+THREAT_INTEL_TIMEOUT = float(os.getenv("THREAT_INTEL_TIMEOUT", 3))
+THREAT_INTEL_TTL = int(os.getenv("THREAT_INTEL_TTL", 3600))                    # malicious verdicts
+THREAT_INTEL_NEGATIVE_TTL = int(os.getenv("THREAT_INTEL_NEGATIVE_TTL", 600))   # clean / unknown IPs
+THREAT_INTEL_CACHE_SIZE = int(os.getenv("THREAT_INTEL_CACHE_SIZE", 100000))
+THREAT_INTEL_CONCURRENCY = int(os.getenv("THREAT_INTEL_CONCURRENCY", 20))
+THREAT_INTEL_MAX_PENDING = int(os.getenv("THREAT_INTEL_MAX_PENDING", 1000))  # queued + running lookups
+MALICIOUS_SCORE = 50
 
 def check_abuseipdb(ip):
+    """Blocking single lookup, kept for scripts; the decision path uses ThreatIntelClient"""
     if not ABUSEIPDB_KEY:
         return None
     try:
-        url = "https://api.abuseipdb.com/api/v2/check"
+        url = ABUSEIPDB_URL
         headers = {
             "Accept": "application/json",
             "Key": ABUSEIPDB_KEY
         }
         params = {"ipAddress": ip}
-        r = requests.get(url, headers=headers, params=params, timeout=3)
+        r = requests.get(url, headers=headers, params=params, timeout=THREAT_INTEL_TIMEOUT)
         if r.status_code == 200:
             data = r.json().get("data", {})
             score = data.get("abuseConfidenceScore", 0)
-            return {"is_malicious": score >= 50, "confidence": score}
+            return {"is_malicious": score >= MALICIOUS_SCORE, "confidence": score}
         else:
             return None
     except Exception:
         return None
+
+
+# ---------------- PROVIDERS ----------------
+class ReputationProvider(ABC):
+    """Interface: async lookup(ip) -> {"is_malicious": bool, "confidence": int} or None if unknown"""
+
+    @abstractmethod
+    async def lookup(self, ip):
+        ...
+
+    async def close(self):
+        pass
+
+
+class AbuseIPDBProvider(ReputationProvider):
+    def __init__(self, api_key=ABUSEIPDB_KEY, url=ABUSEIPDB_URL, timeout=THREAT_INTEL_TIMEOUT):
+        import httpx  # Only needed when a real provider is configured
+        self.api_key = api_key
+        self.url = url
+        self.client = httpx.AsyncClient(timeout=timeout)
+
+    async def lookup(self, ip):
+        response = await self.client.get(
+            self.url,
+            headers={"Accept": "application/json", "Key": self.api_key},
+            params={"ipAddress": ip},
+        )
+        if response.status_code != 200:
+            return None
+        score = response.json().get("data", {}).get("abuseConfidenceScore", 0)
+        return {"is_malicious": score >= MALICIOUS_SCORE, "confidence": score}
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class StaticProvider(ReputationProvider):
+    """In-process stand-in: ip -> abuse score"""
+
+    def __init__(self, scores):
+        self.scores = scores
+        self.calls = 0
+
+    async def lookup(self, ip):
+        self.calls += 1
+        if ip not in self.scores:
+            return None
+        score = self.scores[ip]
+        return {"is_malicious": score >= MALICIOUS_SCORE, "confidence": score}
+
+
+# ---------------- CLIENT ----------------
+class ThreatIntelClient:
+    """
+    Reputation lookups with a TTL+LRU cache (clean and unknown IPs are cached too)
+    and request coalescing: concurrent lookups of one IP share a single provider call.
+    At most max_pending distinct IPs are being looked up or waiting for a provider
+    slot; misses beyond that are skipped (counted in stats["skipped"]) and retried
+    on a later request, so a flood of new source IPs cannot pile up tasks or quota.
+    """
+
+    def __init__(self, provider, ttl=THREAT_INTEL_TTL, negative_ttl=THREAT_INTEL_NEGATIVE_TTL,
+                 max_size=THREAT_INTEL_CACHE_SIZE, concurrency=THREAT_INTEL_CONCURRENCY,
+                 max_pending=THREAT_INTEL_MAX_PENDING):
+        self.provider = provider
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.max_pending = max_pending
+        self.cache = OrderedDict()  # ip -> (expires_at, result)
+        self.inflight = {}          # ip -> asyncio.Future
+        self.background = {}        # ip -> peek()-scheduled task (strong refs)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0, "skipped": 0}
+
+    def pending(self):
+        return max(len(self.inflight), len(self.background))
+
+    def _get(self, ip):
+        entry = self.cache.get(ip)
+        if entry is None:
+            return False, None
+        if time.time() >= entry[0]:
+            self.cache.pop(ip, None)
+            return False, None
+        try:
+            self.cache.move_to_end(ip)
+        except KeyError:
+            pass  # Evicted meanwhile by the loop (peek() also runs in bulk-decision threads)
+        return True, entry[1]
+
+    def _put(self, ip, result):
+        ttl = self.ttl if result and result.get("is_malicious") else self.negative_ttl
+        self.cache[ip] = (time.time() + ttl, result)
+        self.cache.move_to_end(ip)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    def peek(self, ip):
+        """
+        Non-blocking cache read for the decision path. On a miss the lookup is
+        scheduled in the background (when an event loop is running and fewer than
+        max_pending lookups are outstanding) and None is returned.
+        """
+        found, result = self._get(ip)
+        if found:
+            self.stats["hits"] += 1
+            return result
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        if ip in self.inflight or ip in self.background:
+            return None
+        if self.pending() >= self.max_pending:
+            self.stats["skipped"] += 1
+            return None
+        task = loop.create_task(self.lookup(ip))
+        self.background[ip] = task
+        task.add_done_callback(lambda _: self.background.pop(ip, None))
+        return None
+
+    async def lookup(self, ip):
+        found, result = self._get(ip)
+        if found:
+            self.stats["hits"] += 1
+            return result
+
+        pending = self.inflight.get(ip)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        if len(self.inflight) >= self.max_pending:
+            self.stats["skipped"] += 1
+            return None
+
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[ip] = future
+        result = None
+        try:
+            async with self.semaphore:
+                result = await self.provider.lookup(ip)
+            self._put(ip, result)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[ThreatIntel] Lookup failed for {ip}: {e}")
+            self.stats["errors"] += 1
+            self._put(ip, None)
+        finally:
+            # Always release waiters, even if this lookup was cancelled
+            del self.inflight[ip]
+            future.set_result(result)
+        return result
+
+    async def prefetch(self, ips):
+        """Warm the cache for many IPs at once; returns {ip: result}"""
+        unique = list(dict.fromkeys(ips))
+        results = await asyncio.gather(*(self.lookup(ip) for ip in unique))
+        return dict(zip(unique, results))
+
+    async def close(self):
+        await self.provider.close()
+
+
+_client = None
+_client_checked = False
+
+
+def get_client():
+    """Shared client, or None when no reputation provider is configured"""
+    global _client, _client_checked
+    if _client is None and not _client_checked:
+        _client_checked = True
+        if ABUSEIPDB_KEY:
+            try:
+                _client = ThreatIntelClient(AbuseIPDBProvider())
+            except Exception as e:
+                print(f"[ThreatIntel] Provider unavailable: {e}")
+    return _client
+
+
+def set_client(client):
+    """Swap in a client (e.g. one backed by StaticProvider or a stub server)"""
+    global _client
+    _client = client